@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+"""Growable audio buffer with cheap append at the end and trim from the front.
+
+`OnlineASRProcessor.insert_audio_chunk` used to do `np.append`, which copies the
+whole buffer (up to 30 seconds) on every chunk, and `chunk_at` sliced and copied
+it again. With small chunks (e.g. --vac-chunk-size 0.04), that's quadratic copy
+traffic. AudioBuffer keeps the samples in a preallocated array between a head
+and a tail index:
+
+  - append copies only the new samples. When there is no room at the end, the
+    live samples are moved to the front, or the array is doubled if it's more
+    than half full. Both happen rarely enough that append is amortized O(1).
+  - trim(n) drops n samples from the front just by moving the head.
+  - view() is a contiguous, zero-copy view of the live samples, e.g. for
+    asr.transcribe. It is valid until the next append.
+"""
+
+import numpy as np
+
+
+class AudioBuffer:
+
+    def __init__(self, capacity=32*16000, dtype=np.float32):
+        self._data = np.empty(capacity, dtype=dtype)
+        self._head = 0
+        self._tail = 0
+
+    def __len__(self):
+        return self._tail - self._head
+
+    @property
+    def capacity(self):
+        return len(self._data)
+
+    def view(self):
+        """Zero-copy view of the buffered samples. Don't keep it over the next append."""
+        return self._data[self._head:self._tail]
+
+    def __array__(self, dtype=None, copy=None):
+        v = self.view()
+        return v if dtype is None else v.astype(dtype)
+
+    def __getitem__(self, index):
+        return self.view()[index]
+
+    def append(self, audio):
+        n = len(audio)
+        if n == 0:
+            return
+        if self._tail + n > len(self._data):
+            self._make_room(n)
+        self._data[self._tail:self._tail+n] = audio
+        self._tail += n
+
+    def _make_room(self, n):
+        live = len(self)
+        if live + n <= len(self._data) // 2:
+            # enough space, it's only behind the head
+            self._data[:live] = self._data[self._head:self._tail]
+        else:
+            capacity = max(len(self._data), 1)
+            while live + n > capacity // 2:
+                capacity *= 2
+            data = np.empty(capacity, dtype=self._data.dtype)
+            data[:live] = self._data[self._head:self._tail]
+            self._data = data
+        self._head = 0
+        self._tail = live
+
+    def trim(self, n):
+        """Drops the first n samples."""
+        n = min(max(0, n), len(self))
+        self._head += n
+        if self._head == self._tail:
+            self._head = self._tail = 0
+
+    def clear(self):
+        self._head = self._tail = 0
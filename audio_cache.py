@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+"""In-memory cache of decoded audio with a byte budget.
+
+It replaces the unbounded `@lru_cache(10**6)` that used to sit on
+`whisper_online.load_audio`. Decoded files are kept in LRU order and the
+least recently used ones are dropped as soon as the total size of the cached
+arrays exceeds `max_bytes`, so long batch jobs run in bounded memory.
+"""
+
+import os
+import threading
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# default budget: 512 MB, can be overridden by ONECLICK_AUDIO_CACHE_MB
+DEFAULT_MAX_BYTES = int(float(os.environ.get("ONECLICK_AUDIO_CACHE_MB", 512)) * 1024 * 1024)
+
+
+class AudioCache:
+    """LRU cache of decoded audio arrays, bounded by their total size in bytes.
+
+    Usage:
+        cache = AudioCache(max_bytes=256*1024*1024)
+        audio = cache.get(fname, loader)   # loader(fname) -> np.ndarray, called on a miss
+        cache.invalidate(fname)            # e.g. when the file changed on disk
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> array, the most recently used is last
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(fname):
+        return os.path.abspath(os.fspath(fname))
+
+    def get(self, fname, loader):
+        """Returns the cached array for fname, or calls loader(fname) and caches the result."""
+        key = self._key(fname)
+        with self._lock:
+            audio = self._entries.get(key)
+            if audio is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return audio
+            self.misses += 1
+
+        # decoding is slow, don't hold the lock meanwhile
+        audio = loader(fname)
+        self.put(fname, audio)
+        return audio
+
+    def put(self, fname, audio):
+        key = self._key(fname)
+        size = audio.nbytes
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old.nbytes
+            if size > self.max_bytes:
+                # it would evict everything else and still not fit
+                logger.debug(f"not caching {fname}: {size} bytes is over the budget of {self.max_bytes} bytes")
+                return
+            self._entries[key] = audio
+            self.current_bytes += size
+            self._evict()
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self._entries:
+            key, audio = self._entries.popitem(last=False)
+            self.current_bytes -= audio.nbytes
+            self.evictions += 1
+            logger.debug(f"audio cache: evicted {key} ({audio.nbytes} bytes)")
+
+    def invalidate(self, fname):
+        """Drops fname from the cache. Returns True if it was cached."""
+        key = self._key(fname)
+        with self._lock:
+            audio = self._entries.pop(key, None)
+            if audio is None:
+                return False
+            self.current_bytes -= audio.nbytes
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def __contains__(self, fname):
+        return self._key(fname) in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Returns a dict with the counters and the current occupancy."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
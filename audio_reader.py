@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+
+"""Random-access readers of 16 kHz mono float32 audio.
+
+`whisper_online.load_audio_chunk(fname, beg, end)` used to decode the whole
+file just to slice out one window. The readers here decode only the requested
+range, so time-to-first-chunk and peak memory don't depend on the file length:
+
+  - MemmapWavReader: 16 kHz mono PCM WAV. The data chunk is memory-mapped and
+    a window is just a slice of it.
+  - SoundFileReader: other 16 kHz mono files that libsndfile can seek in
+    (FLAC, OGG...). It seeks directly to the first frame of the window.
+  - BlockResampleReader: any other format libsndfile can seek in (other sample
+    rates, stereo, MP3 with libsndfile >= 1.1). It decodes and resamples fixed
+    size blocks and keeps a small index of the recently decoded ones, so the
+    consecutive windows of the simulation loops decode every block once.
+  - ArrayReader: audio that is already decoded, e.g. in the pcm cache.
+  - DecodedReader: the fallback for the rest (M4A, AAC, WMA...). It decodes
+    the whole file once, with the given loader.
+
+Use `open_audio_reader(fname)` to get the right one.
+"""
+
+import os
+import math
+import struct
+import logging
+from collections import OrderedDict
+
+import numpy as np
+import soundfile as sf
+
+logger = logging.getLogger(__name__)
+
+SAMPLING_RATE = 16000
+
+
+class AudioReader:
+    """Base class. Subclasses set self.frames (number of 16 kHz samples) and implement _read."""
+
+    SAMPLING_RATE = SAMPLING_RATE
+
+    frames = 0
+
+    @property
+    def duration(self):
+        return self.frames / self.SAMPLING_RATE
+
+    def read(self, beg, end):
+        """Returns float32 16 kHz mono audio in [beg, end) seconds, the same as
+        load_audio(fname)[int(beg*16000):int(end*16000)] would."""
+        return self.read_frames(int(beg*self.SAMPLING_RATE), int(end*self.SAMPLING_RATE))
+
+    def read_frames(self, beg_s, end_s):
+        """The same as read, but beg_s and end_s are sample indices."""
+        beg_s = min(max(0, beg_s), self.frames)
+        end_s = min(max(beg_s, end_s), self.frames)
+        if end_s <= beg_s:
+            return np.array([], dtype=np.float32)
+        return self._read(beg_s, end_s)
+
+    def _read(self, beg_s, end_s):
+        raise NotImplementedError("must be implemented in the child class")
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def parse_wav_header(fname):
+    """Finds the PCM data of a RIFF/WAVE file.
+    Returns: dict with format, channels, sample_rate, bits, data_offset, data_size,
+    or None if it is not a WAV file or it doesn't have a data chunk.
+    """
+    with open(fname, "rb") as f:
+        head = f.read(12)
+        if len(head) < 12 or head[:4] != b"RIFF" or head[8:12] != b"WAVE":
+            return None
+        fmt = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                return None
+            cid, size = struct.unpack("<4sI", chunk)
+            if cid == b"fmt ":
+                body = f.read(size)
+                audio_format, channels, sample_rate, _, _, bits = struct.unpack("<HHIIHH", body[:16])
+                if audio_format == 0xFFFE and len(body) >= 26:  # WAVE_FORMAT_EXTENSIBLE
+                    audio_format = struct.unpack("<H", body[24:26])[0]
+                fmt = dict(format=audio_format, channels=channels, sample_rate=sample_rate, bits=bits)
+                if size % 2:
+                    f.seek(1, os.SEEK_CUR)
+            elif cid == b"data":
+                if fmt is None:
+                    return None
+                data_offset = f.tell()
+                # streamed WAVs may have a bogus size, the data can't reach behind the end of file
+                data_size = min(size, os.path.getsize(fname) - data_offset)
+                return dict(fmt, data_offset=data_offset, data_size=data_size)
+            else:
+                f.seek(size + size % 2, os.SEEK_CUR)
+
+
+class MemmapWavReader(AudioReader):
+    """16 kHz mono WAV with 16/32-bit integer or 32-bit float samples, memory-mapped."""
+
+    # (format, bits) -> (numpy dtype, scale to [-1,1]), the same scaling as soundfile's
+    DTYPES = {
+        (1, 16): ("<i2", 1/32768),
+        (1, 32): ("<i4", 1/2147483648),
+        (3, 32): ("<f4", None),
+    }
+
+    @classmethod
+    def supports(cls, header):
+        return (header is not None
+                and header["sample_rate"] == SAMPLING_RATE
+                and header["channels"] == 1
+                and (header["format"], header["bits"]) in cls.DTYPES)
+
+    def __init__(self, fname, header=None):
+        if header is None:
+            header = parse_wav_header(fname)
+        if not self.supports(header):
+            raise ValueError(f"{fname} is not a 16 kHz mono PCM WAV file")
+        dtype, self.scale = self.DTYPES[(header["format"], header["bits"])]
+        itemsize = np.dtype(dtype).itemsize
+        self.frames = header["data_size"] // itemsize
+        if self.frames > 0:
+            self.data = np.memmap(fname, dtype=dtype, mode="r", offset=header["data_offset"], shape=(self.frames,))
+        else:
+            self.data = np.array([], dtype=dtype)
+
+    def _read(self, beg_s, end_s):
+        x = self.data[beg_s:end_s]
+        if self.scale is None:
+            return np.array(x, dtype=np.float32)
+        return x.astype(np.float32) * np.float32(self.scale)
+
+    def close(self):
+        self.data = None
+
+
+class SoundFileReader(AudioReader):
+    """16 kHz mono file that libsndfile can seek in. Reads exactly the requested frames."""
+
+    def __init__(self, fname, sfile=None):
+        self.sf = sfile if sfile is not None else sf.SoundFile(fname)
+        if self.sf.samplerate != SAMPLING_RATE or self.sf.channels != 1:
+            raise ValueError(f"{fname} is not 16 kHz mono")
+        self.frames = self.sf.frames
+
+    def _read(self, beg_s, end_s):
+        self.sf.seek(beg_s)
+        return self.sf.read(end_s - beg_s, dtype="float32")
+
+    def close(self):
+        self.sf.close()
+
+
+class BlockResampleReader(AudioReader):
+    """Seekable file with any sample rate and number of channels.
+
+    It converts the audio to 16 kHz mono by blocks of BLOCK_SECONDS. Every block
+    is decoded with PAD_SECONDS of context on both sides, so that the resampling
+    filter doesn't produce artifacts at the block borders. Up to max_blocks
+    decoded blocks are kept, the least recently used one is dropped.
+    """
+
+    BLOCK_SECONDS = 10
+    PAD_SECONDS = 0.05
+
+    def __init__(self, fname, sfile=None, max_blocks=4):
+        self.sf = sfile if sfile is not None else sf.SoundFile(fname)
+        self.src_sr = self.sf.samplerate
+        # the same length as librosa.resample produces
+        self.frames = int(math.ceil(self.sf.frames * SAMPLING_RATE / self.src_sr))
+        self.block_size = self.BLOCK_SECONDS*SAMPLING_RATE
+        self.max_blocks = max_blocks
+        self.blocks = OrderedDict()  # block number -> decoded 16 kHz mono audio
+
+        self.decoded_blocks = 0  # for logging and benchmarks
+
+    def _decode_block(self, i):
+        import librosa
+
+        out_beg = i*self.block_size
+        out_end = min(out_beg+self.block_size, self.frames)
+        ratio = self.src_sr / SAMPLING_RATE
+        pad = int(self.PAD_SECONDS*self.src_sr)
+        src_beg = max(0, int(math.floor(out_beg*ratio)) - pad)
+        src_end = min(self.sf.frames, int(math.ceil(out_end*ratio)) + pad)
+
+        self.sf.seek(src_beg)
+        x = self.sf.read(src_end-src_beg, dtype="float32", always_2d=True)
+        x = x.mean(axis=1) if x.shape[1] > 1 else x[:, 0]
+        if self.src_sr != SAMPLING_RATE:
+            x = librosa.resample(x, orig_sr=self.src_sr, target_sr=SAMPLING_RATE)
+
+        # x[0] is at src_beg in the original time axis
+        skip = int(round(out_beg - src_beg/ratio))
+        y = x[skip:skip+out_end-out_beg]
+        if len(y) < out_end-out_beg:
+            y = np.concatenate([y, np.zeros(out_end-out_beg-len(y), dtype=np.float32)])
+        self.decoded_blocks += 1
+        return y.astype(np.float32, copy=False)
+
+    def _block(self, i):
+        b = self.blocks.get(i)
+        if b is None:
+            b = self._decode_block(i)
+            self.blocks[i] = b
+            while len(self.blocks) > self.max_blocks:
+                self.blocks.popitem(last=False)
+        else:
+            self.blocks.move_to_end(i)
+        return b
+
+    def _read(self, beg_s, end_s):
+        first = beg_s // self.block_size
+        last = (end_s-1) // self.block_size
+        parts = []
+        for i in range(first, last+1):
+            b = self._block(i)
+            o = i*self.block_size
+            parts.append(b[max(beg_s-o, 0):end_s-o])
+        if len(parts) == 1:
+            return parts[0].copy()
+        return np.concatenate(parts)
+
+    def close(self):
+        self.blocks.clear()
+        self.sf.close()
+
+
+class ArrayReader(AudioReader):
+    """Audio that is already decoded, e.g. memory-mapped from the pcm cache (see pcm_cache.py)."""
+
+    def __init__(self, audio):
+        self.audio = audio
+        self.frames = len(audio)
+
+    def _read(self, beg_s, end_s):
+        # a copy, so that a memory-mapped file is paged in only in this window
+        return np.array(self.audio[beg_s:end_s], dtype=np.float32)
+
+    def close(self):
+        self.audio = None
+
+
+class DecodedReader(AudioReader):
+    """Fallback for files that can't be seeked in: decodes them whole with loader(fname), once.
+    The decoded array is kept until close(), also when the loader's cache doesn't keep it
+    (a file over the budget of AudioCache), so that the file is not decoded again for every window.
+    """
+
+    def __init__(self, fname, loader):
+        self.fname = fname
+        self.audio = loader(fname)
+        self.frames = len(self.audio)
+
+    def _read(self, beg_s, end_s):
+        return self.audio[beg_s:end_s]
+
+    def close(self):
+        self.audio = None
+
+
+def open_audio_reader(fname, loader=None):
+    """Returns the cheapest AudioReader for fname.
+    loader: function fname -> whole decoded 16 kHz mono float32 array, used only for
+    the formats that libsndfile can't open.
+    """
+    header = parse_wav_header(fname)
+    if MemmapWavReader.supports(header):
+        return MemmapWavReader(fname, header)
+
+    try:
+        sfile = sf.SoundFile(fname)
+    except (RuntimeError, TypeError) as e:
+        if loader is None:
+            raise
+        logger.debug(f"{fname} can't be opened by soundfile ({e}), decoding it whole")
+        return DecodedReader(fname, loader)
+
+    if not sfile.seekable():
+        sfile.close()
+        if loader is None:
+            raise ValueError(f"{fname} is not seekable")
+        return DecodedReader(fname, loader)
+    if sfile.samplerate == SAMPLING_RATE and sfile.channels == 1:
+        return SoundFileReader(fname, sfile)
+    return BlockResampleReader(fname, sfile)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Per-iteration cost of HypothesisBuffer (insert + flush + pop_commited) as the
+number of committed words that are still in the audio buffer grows.
+
+Usage:
+    python benchmarks/bench_hypothesis_buffer.py [--sizes 1000 5000 10000 20000] [--json out.json]
+
+Every iteration inserts a hypothesis of 40 words: 10 already committed ones and
+30 after them, 5 words further than the previous hypothesis. It commits the 5
+words they agree on and drops the 5 oldest committed words, so the number of
+committed words stays at the given size.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from whisper_online import HypothesisBuffer
+
+WORDS = ["to", "je", "dobrý", "den", "a", "pak", "jsme", "šli", "domů", "."]
+
+def word(i):
+    return (i*0.3, i*0.3+0.25, " " + WORDS[i % len(WORDS)] + str(i % 97))
+
+def filled_buffer(size):
+    hb = HypothesisBuffer()
+    for i in range(size):
+        hb.commited_in_buffer.append(word(i))
+        hb.commited_ids.append(hb.vocab.setdefault(word(i)[2], len(hb.vocab)))
+    hb.last_commited_time = word(size-1)[1]
+    return hb, size
+
+def run(size, iterations, hyp_words=30, step=5, context=10):
+    hb, pos = filled_buffer(size)
+    # like the audio buffer, every hypothesis starts with a few committed words, which are filtered out
+    # by time, and ends step words further than the previous one
+    hyps = []
+    for k in range(iterations+1):
+        end = pos + hyp_words + k*step
+        hyps.append([word(i) for i in range(end - hyp_words - context, end)])
+    hb.insert(hyps[0], 0)
+    hb.flush()
+    t = time.perf_counter()
+    for k in range(1, iterations+1):
+        hb.insert(hyps[k], 0)
+        hb.flush()
+        hb.pop_commited(word(hyp_words - step + k*step)[0])
+    return (time.perf_counter() - t) / iterations, len(hb.commited_in_buffer)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 10000, 20000],
+                        help='Numbers of committed words in the buffer')
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--json', type=str, default=None, help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        per_iter, kept = run(size, args.iterations)
+        results.append({"committed_words": size, "us_per_iteration": per_iter*1e6, "committed_after": kept})
+        print(f"{size:8d} committed words  {per_iter*1e6:8.1f} us/iteration")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Offline engine vs the streaming simulation (--comp_unaware) on the same file:
+the number of transcribe calls, the seconds of audio they got, and the time.
+
+Usage:
+    python benchmarks/bench_offline.py [audio file] [--backend faster-whisper --model small --lan en] [--json out.json]
+
+Without --backend, a fake ASR that returns one word per half second is used, so
+the numbers show how much audio every mode sends to Whisper. Whisper pads every
+call to 30 seconds, so the calls are a good proxy of the GPU time. Without a
+file, a synthetic 10 minute recording of noise bursts with pauses is used.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import whisper_online
+
+class CountingASR(whisper_online.ASRBase):
+    """Fake ASR, counts the calls and the audio"""
+
+    sep = " "
+
+    def load_model(self, modelsize=None, cache_dir=None, model_dir=None):
+        return None
+
+    def transcribe(self, audio, init_prompt=""):
+        n = max(int(len(audio) / 16000 * 2) - 1, 0)
+        return [(i*0.5, i*0.5+0.4, f"w{i}") for i in range(n)]
+
+    def ts_words(self, r):
+        return r
+
+    def segments_end_ts(self, r):
+        return [w[1] for w in r[7::8]]
+
+class Counter:
+    """Wraps an ASR and counts its transcribe calls"""
+
+    def __init__(self, asr):
+        self.asr = asr
+        self.calls = 0
+        self.seconds = 0.0
+
+    def transcribe(self, audio, init_prompt=""):
+        self.calls += 1
+        self.seconds += len(audio) / 16000
+        return self.asr.transcribe(audio, init_prompt=init_prompt)
+
+    def __getattr__(self, name):
+        return getattr(self.asr, name)
+
+def synthetic_file(folder, seconds=600):
+    import soundfile as sf
+    rng = np.random.default_rng(0)
+    sr = 16000
+    a = (rng.standard_normal(sr*seconds) * 0.002).astype(np.float32)
+    t = 0.5
+    while t < seconds - 1:
+        speech = rng.uniform(2, 12)
+        e = min(seconds, t + speech)
+        a[int(t*sr):int(e*sr)] += (rng.standard_normal(int(e*sr) - int(t*sr)) * 0.2).astype(np.float32)
+        t = e + rng.uniform(0.3, 3)
+    fname = os.path.join(folder, "synthetic.wav")
+    sf.write(fname, a, sr)
+    return fname
+
+def run_streaming(asr, fname, min_chunk):
+    online = whisper_online.OnlineASRProcessor(asr, logfile=open(os.devnull, "w"))
+    lines = [o for _, o in whisper_online.simulate_comp_unaware(online, fname, min_chunk) if o[0] is not None]
+    o = online.finish()
+    if o[0] is not None:
+        lines.append(o)
+    online.close()
+    return lines
+
+def run_offline(asr, fname, segmenter):
+    return list(whisper_online.transcribe_offline(asr, fname, segmenter))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('file', nargs='?')
+    parser.add_argument('--backend', type=str, default=None, help='Real Whisper backend, see whisper_online.py --backend')
+    parser.add_argument('--model', type=str, default='small')
+    parser.add_argument('--lan', type=str, default='en')
+    parser.add_argument('--min-chunk-size', dest='min_chunk_size', type=float, default=1.0)
+    parser.add_argument('--segmenter', type=str, default='energy', choices=['energy', 'silero'])
+    parser.add_argument('--json', type=str, default=None, help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    if args.backend:
+        asr = whisper_online.create_asr(whisper_online.shared_args(backend=args.backend, model=args.model, lan=args.lan))
+    else:
+        asr = CountingASR(lan=args.lan)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        fname = args.file or synthetic_file(tmp)
+        duration = whisper_online.audio_duration(fname)
+        modes = {"streaming": lambda a: run_streaming(a, fname, args.min_chunk_size),
+                 "offline": lambda a: run_offline(a, fname, args.segmenter)}
+        for mode, fn in modes.items():
+            counter = Counter(asr)
+            t = time.perf_counter()
+            lines = fn(counter)
+            elapsed = time.perf_counter() - t
+            results.append({"mode": mode, "audio_seconds": duration, "calls": counter.calls,
+                            "transcribed_seconds": counter.seconds, "seconds": elapsed, "lines": len(lines)})
+            print(f"{mode:10s} {counter.calls:6d} calls  {counter.seconds:9.1f} s of audio transcribed "
+                  f"({counter.seconds/duration:5.2f}x the file)  {elapsed:7.2f} s  {len(lines)} lines")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+faster-whisper real-time factor (processing time / audio duration) per device and compute type.
+
+Usage:
+    python benchmarks/bench_rtf.py audio_file [--model small --lan en] [--device cpu] [--compute-types int8 int8_float32 float32] [--cpu-threads 8] [--json out.json]
+
+Every compute type loads the model again and transcribes the file once with the
+offline engine of whisper_online.py, the way the front-ends do. The load time is
+reported separately and is not in the RTF. A compute type that the device can't
+run falls back as in whisper_online.resolve_device, the used one is reported.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import whisper_online
+
+def measure(fname, duration, args, compute_type):
+    options = whisper_online.shared_args(backend="faster-whisper", model=args.model, lan=args.lan,
+                                         device=args.device, compute_type=compute_type,
+                                         cpu_threads=args.cpu_threads)
+    t = time.perf_counter()
+    asr = whisper_online.create_asr(options)
+    load = time.perf_counter() - t
+    t = time.perf_counter()
+    lines = list(whisper_online.transcribe_offline(asr, fname, args.segmenter))
+    elapsed = time.perf_counter() - t
+    return {"device": asr.device, "compute_type": asr.compute_type, "requested_compute_type": compute_type,
+            "cpu_threads": args.cpu_threads, "audio_seconds": duration, "load_seconds": load,
+            "seconds": elapsed, "rtf": elapsed / duration, "lines": len(lines)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('file')
+    parser.add_argument('--model', type=str, default='small')
+    parser.add_argument('--lan', type=str, default='en')
+    parser.add_argument('--device', type=str, default='cpu', choices=whisper_online.DEVICES)
+    parser.add_argument('--compute-types', dest='compute_types', nargs='+', default=["int8", "int8_float32", "float32"],
+                        choices=[c for c in whisper_online.COMPUTE_TYPES if c != "auto"])
+    parser.add_argument('--cpu-threads', dest='cpu_threads', type=int, default=0, help='0 for the CTranslate2 default')
+    parser.add_argument('--segmenter', type=str, default='energy', choices=['energy', 'silero'])
+    parser.add_argument('--json', type=str, default=None, help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    duration = whisper_online.audio_duration(args.file)
+    results = []
+    for compute_type in args.compute_types:
+        try:
+            r = measure(args.file, duration, args, compute_type)
+        except Exception as e:  # faster-whisper not installed, or a type the hardware can't run
+            print(f"{compute_type:13s} failed: {e}")
+            continue
+        results.append(r)
+        print(f"{r['device']:4s} {r['compute_type']:13s} load {r['load_seconds']:6.1f} s  "
+              f"transcribe {r['seconds']:7.1f} s  RTF {r['rtf']:6.3f}  {r['lines']} lines")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
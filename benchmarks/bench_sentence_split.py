@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Sentence splitters: load time and split throughput of the rule-based splitter
+(sentence_splitter.py) vs mosestokenizer and wtpsplit, where they are installed.
+
+Usage:
+    python benchmarks/bench_sentence_split.py [--languages cs en ...] [--splitters rules moses wtpsplit] [--json out.json]
+
+The text of every language is a short paragraph repeated to about 100k characters.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from whisper_online import create_tokenizer
+
+SAMPLES = {
+    "cs": "Dobrý den, vítejte u dnešní přednášky. Ing. Novák nám např. ukáže, co se stalo 3. května. Je to jasné? Ano, pokračujeme dál!",
+    "en": "Good morning and welcome to today's lecture. Mr. Smith will show us what happened in Jan. last year. Is that clear? Yes, let's move on!",
+    "es": "Buenos días y bienvenidos a la clase de hoy. El Sr. García nos mostrará lo que pasó. ¿Está claro? ¡Sí, sigamos!",
+    "de": "Guten Morgen und willkommen zur heutigen Vorlesung. Dr. Müller zeigt uns z.B., was am 3. Mai passiert ist. Ist das klar? Ja, weiter!",
+    "fr": "Bonjour et bienvenue au cours d'aujourd'hui. M. Dupont va nous montrer ce qui s'est passé. C'est clair? Oui, continuons!",
+    "ru": "Доброе утро и добро пожаловать на сегодняшнюю лекцию. Проф. Иванов покажет, что случилось в 1990 г. на ул. Ленина. Понятно? Да, продолжаем!",
+    "id": "Selamat pagi dan selamat datang di kuliah hari ini. Bpk. Budi akan menunjukkan apa yang terjadi. Apakah jelas? Ya, mari lanjutkan!",
+    "zh": "大家早上好，欢迎来到今天的讲座。 王老师会给我们讲发生了什么。 清楚吗？ 好的，我们继续！",
+}
+
+def measure(lan, splitter, text, repeat):
+    t = time.perf_counter()
+    tokenizer = create_tokenizer(lan, splitter)
+    load = time.perf_counter() - t
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        n = len(tokenizer.split(text))
+        times.append(time.perf_counter() - t)
+    return load, min(times), n
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--languages', nargs='+', default=list(SAMPLES), choices=list(SAMPLES))
+    parser.add_argument('--splitters', nargs='+', default=["rules", "moses", "wtpsplit"], choices=["rules", "moses", "wtpsplit"])
+    parser.add_argument('--chars', type=int, default=100000, help='Length of the text of every language')
+    parser.add_argument('--repeat', type=int, default=3, help='Repetitions, the best time is reported')
+    parser.add_argument('--json', type=str, default=None, help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = []
+    for splitter in args.splitters:
+        for lan in args.languages:
+            text = " ".join([SAMPLES[lan]] * (args.chars // len(SAMPLES[lan]) + 1))
+            try:
+                load, best, n = measure(lan, splitter, text, args.repeat)
+            except Exception as e:  # ImportError, or a model that can't be downloaded
+                print(f"{splitter:10s} {lan:3s} failed: {e}")
+                continue
+            results.append({"splitter": splitter, "language": lan, "load_seconds": load, "split_seconds": best,
+                            "chars": len(text), "sentences": n, "chars_per_second": len(text) / best})
+            print(f"{splitter:10s} {lan:3s} load {load:8.3f} s  split {best*1000:8.1f} ms  {len(text)/best/1e6:6.2f} M chars/s  {n} sentences")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks of the hot paths that don't run a model: synthetic audio and
+fake ASRs only, so the suite runs offline in about a minute and every
+performance change gets a number.
+
+Usage:
+    python benchmarks/bench_suite.py [--only hypothesis_buffer srt ...] [--repeat 5] [--json out.json]
+    python benchmarks/bench_suite.py --json new.json --compare baseline.json [--threshold 0.1]
+
+Benchmarks (the unit is one operation of the column "ops"):
+  hypothesis_buffer   HypothesisBuffer insert + flush + pop_commited with 10000
+                      committed words, as in bench_hypothesis_buffer.py
+  online_processor    OnlineASRProcessor fed 10 minutes of audio in 1 s chunks,
+                      with the replay ASR: buffer management, the hypothesis
+                      buffer and the trimming, per process_iter
+  vad_windows         FixedVADIterator windowing of chunks of uneven lengths,
+                      with a fake model that scores a window by its energy,
+                      per 512 sample window (requires torch)
+  line_packet         line_packet.send_one_line + receive_one_line of one
+                      output line over a socket pair, per line
+  srt                 utils.create_srt_content of 10000 subtitles, per subtitle
+  detect_audio_files  utils.detect_audio_files in a folder of 2000 files, per file
+  sentence_split      the rule-based Czech splitter, as in
+                      bench_sentence_split.py, per character
+  offline_engine      whisper_online.transcribe_offline of a 2 minute synthetic
+                      recording with the fake ASR of bench_offline.py, per
+                      second of audio (requires soundfile)
+
+Every benchmark is set up again for every repetition and the best time is
+reported. A benchmark whose dependencies are not installed is skipped.
+
+--json writes {"python": ..., "platform": ..., "results": {name: {"seconds",
+"ops", "us_per_op"}}}. --compare prints the ratio of us_per_op to the same
+benchmark in an earlier --json file, and exits with 1 if any of them is slower
+by more than --threshold (0.1 = 10 %), e.g. to keep a baseline in CI.
+
+bench_decode.py and bench_rtf.py need real decoders or a model and are run
+separately.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import platform
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import whisper_online
+import line_packet
+from utils import create_srt_content, detect_audio_files
+
+import bench_hypothesis_buffer
+import bench_sentence_split
+import bench_offline
+
+def hypothesis_buffer(iterations=2000):
+    def run():
+        bench_hypothesis_buffer.run(10000, iterations)
+        return iterations
+    return run
+
+def online_processor(seconds=600):
+    online = whisper_online.OnlineASRProcessor(whisper_online.ReplayASR("en"), logfile=open(os.devnull, "w"))
+    chunk = np.zeros(16000, dtype=np.float32)
+
+    def run():
+        for _ in range(seconds):
+            online.insert_audio_chunk(chunk)
+            online.process_iter()
+        online.finish()
+        return seconds
+    return run
+
+class EnergyVAD:
+    """Fake silero model, a window is speech if its mean absolute value is over 0.05"""
+
+    def reset_states(self):
+        pass
+
+    def __call__(self, x, sampling_rate):
+        import torch
+        return torch.tensor([[float(x.abs().mean() > 0.05)]])
+
+    def audio_forward(self, x, sampling_rate):
+        import torch
+        windows = x.reshape(-1, 512)
+        return (windows.abs().mean(dim=1) > 0.05).float().reshape(1, -1)
+
+def speech_bursts(seconds, seed=0):
+    """Noise with bursts of louder noise, 16 kHz"""
+    rng = np.random.default_rng(seed)
+    a = (rng.standard_normal(16000*seconds) * 0.002).astype(np.float32)
+    t = 0.5
+    while t < seconds - 1:
+        e = min(seconds, t + rng.uniform(2, 12))
+        a[int(t*16000):int(e*16000)] += (rng.standard_normal(int(e*16000) - int(t*16000)) * 0.2).astype(np.float32)
+        t = e + rng.uniform(0.3, 3)
+    return a
+
+def vad_windows(seconds=120):
+    from silero_vad_iterator import FixedVADIterator
+    audio = speech_bursts(seconds)
+    vad = FixedVADIterator(EnergyVAD())
+    # the streaming chunks of --vac, an odd length that leaves a tail, and a long one for the batched scoring
+    sizes = [640, 16000, 333, 16000*5]
+
+    def run():
+        pos = k = 0
+        while pos < len(audio):
+            vad(audio[pos:pos+sizes[k % len(sizes)]])
+            pos += sizes[k % len(sizes)]
+            k += 1
+        return len(audio) // FixedVADIterator.WINDOW
+    return run
+
+def line_packet_roundtrip(lines=1000):
+    a, b = socket.socketpair()
+    line = "1234.5678 12000 15400 Dobrý den, vítejte u dnešní přednášky."
+
+    def run():
+        try:
+            for _ in range(lines):
+                line_packet.send_one_line(a, line, pad_zeros=True)
+                line_packet.receive_one_line(b)
+        finally:
+            a.close()
+            b.close()
+        return lines
+    return run
+
+def srt(subtitles=10000):
+    data = [(i*2500, i*2500+2000, f" Titulek číslo {i}, dobrý den.") for i in range(subtitles)]
+
+    def run():
+        create_srt_content(data)
+        return subtitles
+    return run
+
+def detect_files(files=2000):
+    tmp = tempfile.TemporaryDirectory()
+    exts = ['.wav', '.MP3', '.m4a', '.txt', '.flac', '.srt']
+    for i in range(files):
+        open(os.path.join(tmp.name, f"nahravka{i}{exts[i % len(exts)]}"), "w").close()
+
+    def run():
+        try:
+            detect_audio_files(tmp.name)
+        finally:
+            tmp.cleanup()
+        return files
+    return run
+
+def sentence_split(chars=100000):
+    sample = bench_sentence_split.SAMPLES["cs"]
+    text = " ".join([sample] * (chars // len(sample) + 1))
+    tokenizer = whisper_online.create_tokenizer("cs", "rules")
+
+    def run():
+        tokenizer.split(text)
+        return len(text)
+    return run
+
+def offline_engine(seconds=120):
+    import soundfile as sf
+    tmp = tempfile.TemporaryDirectory()
+    fname = os.path.join(tmp.name, "synthetic.wav")
+    sf.write(fname, speech_bursts(seconds), 16000)
+    asr = bench_offline.CountingASR(lan="en")
+
+    def run():
+        try:
+            bench_offline.run_offline(asr, fname, "energy")
+        finally:
+            tmp.cleanup()
+        return seconds
+    return run
+
+BENCHMARKS = {
+    "hypothesis_buffer": hypothesis_buffer,
+    "online_processor": online_processor,
+    "vad_windows": vad_windows,
+    "line_packet": line_packet_roundtrip,
+    "srt": srt,
+    "detect_audio_files": detect_files,
+    "sentence_split": sentence_split,
+    "offline_engine": offline_engine,
+}
+
+def measure(setup, repeat):
+    """Returns the best time of repeat runs, and the number of operations of one run."""
+    times = []
+    for _ in range(repeat):
+        run = setup()
+        t = time.perf_counter()
+        ops = run()
+        times.append(time.perf_counter() - t)
+    return min(times), ops
+
+def compare(results, baseline, threshold):
+    """Prints the ratio of every result to the baseline. Returns the names of the ones slower than 1+threshold."""
+    slower = []
+    for name, r in results.items():
+        b = baseline.get(name)
+        if b is None:
+            print(f"{name:20s} not in the baseline")
+            continue
+        ratio = r["us_per_op"] / b["us_per_op"]
+        mark = ""
+        if ratio > 1 + threshold:
+            slower.append(name)
+            mark = "  SLOWER"
+        elif ratio < 1 - threshold:
+            mark = "  faster"
+        print(f"{name:20s} {b['us_per_op']:10.3f} -> {r['us_per_op']:10.3f} us/op  {ratio:6.2f}x{mark}")
+    return slower
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', nargs='+', default=list(BENCHMARKS), choices=list(BENCHMARKS))
+    parser.add_argument('--repeat', type=int, default=5, help='Repetitions, the best time is reported')
+    parser.add_argument('--json', type=str, default=None, help='Write the results to this JSON file')
+    parser.add_argument('--compare', type=str, default=None, help='Compare to the results in this JSON file of an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.1, help='With --compare, the relative slowdown that fails the run')
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.only:
+        try:
+            best, ops = measure(BENCHMARKS[name], args.repeat)
+        except ImportError as e:
+            print(f"{name:20s} skipped: {e}")
+            continue
+        results[name] = {"seconds": best, "ops": ops, "us_per_op": best / ops * 1e6}
+        print(f"{name:20s} {best*1000:9.2f} ms  {ops:8d} ops  {best/ops*1e6:10.3f} us/op")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"python": platform.python_version(), "platform": platform.platform(),
+                       "repeat": args.repeat, "results": results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)["results"]
+        print(f"\ncompared to {args.compare}:")
+        slower = compare(results, baseline, args.threshold)
+        if slower:
+            print(f"slower by more than {args.threshold:.0%}: {' '.join(slower)}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
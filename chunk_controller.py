@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+"""Adaptive chunk size of the online processors.
+
+With a fixed --min-chunk-size, the loop of whisper_online.py and of the server
+waits for that much new audio before every process_iter. When transcribe gets
+slower (a longer audio buffer, a loaded machine), the processing time adds up
+to the wait and the latency grows; when the machine is idle, the loop waits
+longer than it needs to.
+
+ChunkSizeController measures the transcribe time of every iteration and sets
+the chunk size for the next one:
+
+  - target latency L: a word is emitted after about chunk + transcribe time,
+    so the chunk is L minus the (smoothed) transcribe time,
+  - target real-time factor R: transcribe time / chunk, the share of the time
+    the ASR is busy, so the chunk is at least transcribe time / R,
+
+within [min_chunk, max_chunk]. Optionally, when the target latency can't be
+held even with the shortest chunk, the buffer trimming threshold is lowered,
+so that the buffer and the transcribe time get shorter, and it is raised back
+to the configured value when there is room again.
+
+The decisions are counted in stats() and logged at the debug level.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkSizeController:
+
+    def __init__(self, chunk_size=1.0, target_latency=None, target_rtf=None, min_chunk=0.1, max_chunk=5.0,
+                 trimming_sec=None, min_trimming_sec=5.0, smoothing=0.3):
+        """chunk_size: the initial chunk size in seconds, e.g. --min-chunk-size
+        target_latency: seconds, or None
+        target_rtf: transcribe time per second of new audio, or None
+        min_chunk, max_chunk: the bounds of the chunk size
+        trimming_sec: the configured buffer trimming threshold, to adapt it, or None to keep it fixed
+        min_trimming_sec: the lowest buffer trimming threshold
+        smoothing: weight of the last iteration in the moving average of the transcribe time
+        """
+        self.chunk_size = chunk_size
+        self.target_latency = target_latency
+        self.target_rtf = target_rtf
+        self.min_chunk = min_chunk
+        self.max_chunk = max_chunk
+        self.max_trimming_sec = trimming_sec
+        self.buffer_trimming_sec = trimming_sec
+        self.min_trimming_sec = min_trimming_sec
+        self.smoothing = smoothing
+
+        self.transcribe_time = None  # moving average, seconds
+        self.iterations = 0
+        self.increases = 0
+        self.decreases = 0
+        self.trimming_changes = 0
+
+    def update(self, transcribe_time, audio_seconds):
+        """Records one process_iter: the transcribe time and the length of the transcribed audio, in seconds.
+        Returns the chunk size for the next iteration."""
+        self.iterations += 1
+        if self.transcribe_time is None:
+            self.transcribe_time = transcribe_time
+        else:
+            self.transcribe_time += self.smoothing * (transcribe_time - self.transcribe_time)
+        p = self.transcribe_time
+
+        chunk = self.chunk_size
+        if self.target_latency is not None:
+            chunk = self.target_latency - p
+        if self.target_rtf is not None:
+            chunk = max(chunk, p / self.target_rtf) if self.target_latency is not None else p / self.target_rtf
+        chunk = min(self.max_chunk, max(self.min_chunk, chunk))
+
+        # ignore changes under 10%, they only make noise in the log
+        if abs(chunk - self.chunk_size) > 0.1 * self.chunk_size:
+            if chunk > self.chunk_size:
+                self.increases += 1
+            else:
+                self.decreases += 1
+            logger.debug(f"chunk size {self.chunk_size:.2f} -> {chunk:.2f} s, transcribe time {p:.2f} s "
+                         f"of {audio_seconds:.2f} s of audio")
+            self.chunk_size = chunk
+
+        if self.buffer_trimming_sec is not None and self.target_latency is not None:
+            self._adapt_trimming(p)
+        return self.chunk_size
+
+    def _adapt_trimming(self, p):
+        trimming = self.buffer_trimming_sec
+        if p + self.min_chunk > self.target_latency:
+            trimming = max(self.min_trimming_sec, trimming * 0.8)
+        elif p + self.min_chunk < 0.5 * self.target_latency:
+            trimming = min(self.max_trimming_sec, trimming * 1.25)
+        if trimming != self.buffer_trimming_sec:
+            self.trimming_changes += 1
+            logger.debug(f"buffer trimming {self.buffer_trimming_sec:.1f} -> {trimming:.1f} s, transcribe time {p:.2f} s")
+            self.buffer_trimming_sec = trimming
+
+    def stats(self):
+        return {
+            "iterations": self.iterations,
+            "chunk_size": self.chunk_size,
+            "transcribe_time": self.transcribe_time,
+            "buffer_trimming_sec": self.buffer_trimming_sec,
+            "increases": self.increases,
+            "decreases": self.decreases,
+            "trimming_changes": self.trimming_changes,
+        }
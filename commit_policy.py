@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+"""Commit policies of HypothesisBuffer: which words of the new hypothesis are committed.
+
+The original policy, LocalAgreement-2, commits the longest common prefix of the
+last two hypotheses, so every word waits for one more process_iter after it was
+first transcribed. The other policies move along the latency/stability
+trade-off:
+
+  - LocalAgreement(n): the common prefix of the last n hypotheses. n=1 commits
+    every hypothesis right away (with --lazy-segments, its first segment), n=3
+    waits one more iteration than the default.
+  - ForcedCommit: LocalAgreement, and the words that ended more than max_delay
+    seconds before the end of the audio are committed even if the hypotheses
+    don't agree on them, so that a flickering word doesn't hold the text back.
+  - ConfidenceCommit: LocalAgreement, and the words after the agreed prefix are
+    committed while their confidence (the word probability times one minus the
+    no_speech_prob of its segment, see ASRBase.word_confidences) is at least
+    the threshold. Backends without confidences fall back to the agreement.
+
+Every policy records the commit delay of its words, the time from the end of
+a word in the audio to the end of the audio when it was committed, in a
+stream_metrics.Histogram, see stats(). With --metrics-json or --metrics-prom,
+the metrics export the same histogram as commit_delay_seconds.
+"""
+
+import logging
+
+from stream_metrics import Histogram, HISTOGRAMS
+
+logger = logging.getLogger(__name__)
+
+COMMIT_POLICIES = ["agreement", "forced", "confidence"]
+
+
+class LocalAgreement:
+    """Commits the longest common prefix of the last n hypotheses."""
+
+    name = "agreement"
+
+    def __init__(self, n=2):
+        assert 1 <= n, "LocalAgreement needs n >= 1"
+        self.n = n
+        self.delays = Histogram(HISTOGRAMS["commit_delay_seconds"][1])
+
+    def agreed(self, hb):
+        """The length of the prefix of hb.new that the previous n-1 hypotheses of HypothesisBuffer hb agree on."""
+        previous = hb.previous_ids()
+        if len(previous) < self.n - 1:
+            return 0
+        previous = previous[len(previous) - (self.n - 1):]
+        k = 0
+        for i, w in enumerate(hb.new_ids):
+            if any(i >= len(p) or p[i] != w for p in previous):
+                break
+            k += 1
+        return k
+
+    def commit_length(self, hb, now=None):
+        """The number of words of hb.new to commit. now: the end of the audio buffer in seconds, or None."""
+        return self.agreed(hb)
+
+    def decided(self, hb, now=None):
+        """True if more words appended to hb.new can't change commit_length.
+        With n=1 every appended word is committed, so that never holds; there it's True as soon as hb.new
+        has words, the lazy decoding stops after the first segment and the rest is decoded in the next iteration."""
+        if self.n == 1:
+            return len(hb.new) > 0
+        return self.commit_length(hb, now) < len(hb.new)
+
+    def record(self, hb, k, now=None):
+        """Called by HypothesisBuffer.flush before it commits the first k words of hb.new."""
+        if now is None:
+            return
+        for _, e, _ in hb.new[:k]:
+            self.delays.observe(max(0.0, now - e))
+
+    def stats(self):
+        st = self.delays.summary()
+        st["words"] = st.pop("count")
+        return dict(policy=self.name, n=self.n, **st)
+
+
+class ForcedCommit(LocalAgreement):
+    """LocalAgreement, and the words that ended max_delay seconds before the end of the audio are committed anyway."""
+
+    name = "forced"
+
+    def __init__(self, n=2, max_delay=2.0):
+        super().__init__(n)
+        self.max_delay = max_delay
+        self.forced = 0
+
+    def commit_length(self, hb, now=None):
+        k = self.agreed(hb)
+        if now is None:
+            return k
+        while k < len(hb.new) and hb.new[k][1] <= now - self.max_delay:
+            k += 1
+        return k
+
+    def record(self, hb, k, now=None):
+        super().record(hb, k, now)
+        self.forced += k - min(k, self.agreed(hb))
+
+    def stats(self):
+        return dict(super().stats(), max_delay=self.max_delay, forced=self.forced)
+
+
+class ConfidenceCommit(LocalAgreement):
+    """LocalAgreement, and the following words are committed while their confidence is at least the threshold."""
+
+    name = "confidence"
+
+    def __init__(self, n=2, threshold=0.9):
+        super().__init__(n)
+        self.threshold = threshold
+        self.confident = 0
+
+    def commit_length(self, hb, now=None):
+        k = self.agreed(hb)
+        conf = hb.new_conf
+        if conf is None:
+            return k
+        while k < len(conf) and conf[k] >= self.threshold:
+            k += 1
+        return k
+
+    def record(self, hb, k, now=None):
+        super().record(hb, k, now)
+        self.confident += k - min(k, self.agreed(hb))
+
+    def stats(self):
+        return dict(super().stats(), threshold=self.threshold, confident=self.confident)
+
+
+def create_commit_policy(policy="agreement", n=2, max_delay=2.0, threshold=0.9):
+    """policy: one of COMMIT_POLICIES"""
+    if policy == "agreement":
+        return LocalAgreement(n)
+    if policy == "forced":
+        return ForcedCommit(n, max_delay=max_delay)
+    if policy == "confidence":
+        return ConfidenceCommit(n, threshold=threshold)
+    raise ValueError(f"Unknown commit policy {policy}, must be one of: " + " ".join(COMMIT_POLICIES))
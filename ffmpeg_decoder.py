@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+
+"""Streaming audio decoder that runs a local ffmpeg subprocess.
+
+An alternative to librosa/audioread for MP3/M4A/WMA and the other compressed
+formats: ffmpeg decodes, downmixes and resamples in one pass and writes
+16 kHz mono float32 to a pipe, which is read in fixed-size frames. Nothing but
+the current frame has to be in memory.
+
+    for frame in stream_audio("lecture.m4a", frame_size=16000):
+        ...  # np.float32 array of 16000 samples (the last one may be shorter)
+
+The resampler quality is one of RESAMPLERS: "fast", "default" or "high" (soxr,
+it requires ffmpeg built with libsoxr).
+"""
+
+import os
+import sys
+import math
+import shutil
+import subprocess
+import threading
+import logging
+from collections import deque
+
+import numpy as np
+
+from audio_reader import AudioReader
+
+logger = logging.getLogger(__name__)
+
+SAMPLING_RATE = 16000
+
+# options of ffmpeg's aresample filter
+RESAMPLERS = {
+    "fast": "resampler=swr:filter_size=8:phase_shift=6",
+    "default": "resampler=swr",
+    "high": "resampler=soxr:precision=28",
+}
+
+# 1 MB, the default pipe buffer is 64 kB on Linux, that's less than 1 second of audio
+PIPE_BUFFER_SIZE = 1 << 20
+
+F_SETPIPE_SZ = 1031  # from linux/fcntl.h, it's not in the fcntl module of older Pythons
+
+# last lines of ffmpeg's stderr that are kept for the error message
+STDERR_TAIL_LINES = 20
+
+
+def ffmpeg_available():
+    return shutil.which("ffmpeg") is not None
+
+
+def _ffmpeg_command(fname, start=0, duration=None, quality="default"):
+    if quality not in RESAMPLERS:
+        raise ValueError(f"resampler quality must be one of {', '.join(RESAMPLERS)}, not {quality}")
+    cmd = ["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error"]
+    if start:
+        cmd += ["-ss", f"{start:.6f}"]  # before -i, it seeks in the input instead of decoding up to start
+    cmd += ["-i", os.fspath(fname)]
+    if duration is not None:
+        cmd += ["-t", f"{duration:.6f}"]
+    cmd += ["-vn", "-ac", "1", "-af", f"aresample={SAMPLING_RATE}:{RESAMPLERS[quality]}",
+            "-f", "f32le", "-acodec", "pcm_f32le", "-"]
+    return cmd
+
+
+def _enlarge_pipe(pipe, size):
+    if not sys.platform.startswith("linux"):
+        return
+    try:
+        import fcntl
+        fcntl.fcntl(pipe.fileno(), F_SETPIPE_SZ, size)
+    except (ImportError, OSError) as e:
+        # e.g. over /proc/sys/fs/pipe-max-size for unprivileged users
+        logger.debug(f"can't enlarge the ffmpeg pipe: {e}")
+
+
+def _open(fname, start, duration, quality, pipe_buffer):
+    if not ffmpeg_available():
+        raise RuntimeError("ffmpeg not found. Install it, or use the librosa decoder.")
+    cmd = _ffmpeg_command(fname, start, duration, quality)
+    logger.debug(" ".join(cmd))
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=pipe_buffer)
+    _enlarge_pipe(proc.stdout, pipe_buffer)
+    # stderr is read all the time, otherwise ffmpeg blocks on a full pipe while we wait for stdout,
+    # e.g. on a damaged file that logs an error for every frame
+    proc.stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+    proc.stderr_thread = threading.Thread(target=_drain, args=(proc.stderr, proc.stderr_tail), daemon=True)
+    proc.stderr_thread.start()
+    return proc
+
+
+def _drain(pipe, tail):
+    with pipe:
+        for line in pipe:
+            tail.append(line)
+
+
+def _close(proc, fname):
+    """Stops ffmpeg. Raises RuntimeError if it failed."""
+    if proc.poll() is None:
+        # the consumer stopped early
+        proc.kill()
+        proc.wait()
+        proc.stderr_thread.join()
+        return
+    proc.stderr_thread.join()
+    err = b"".join(proc.stderr_tail).decode("utf-8", errors="replace").strip()
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to decode {fname}: {err}")
+
+
+def stream_audio(fname, frame_size=SAMPLING_RATE, start=0, duration=None, quality="default", pipe_buffer=PIPE_BUFFER_SIZE):
+    """Yields 16 kHz mono float32 frames of frame_size samples, the last one may be shorter.
+    start, duration: in seconds, decode only this part of the file.
+    """
+    proc = _open(fname, start, duration, quality, pipe_buffer)
+    frame_bytes = frame_size*4
+    try:
+        while True:
+            buf = bytearray(frame_bytes)
+            n = proc.stdout.readinto(buf)  # buffered, it returns a short read only at the end
+            if not n:
+                break
+            yield np.frombuffer(buf, dtype="<f4", count=n//4)
+            if n < frame_bytes:
+                break
+        proc.stdout.close()
+        proc.wait()
+    finally:
+        _close(proc, fname)
+
+
+def decode_audio(fname, start=0, duration=None, quality="default", pipe_buffer=PIPE_BUFFER_SIZE):
+    """Decodes the whole file (or the given part) into one 16 kHz mono float32 array."""
+    proc = _open(fname, start, duration, quality, pipe_buffer)
+    try:
+        data = bytearray()
+        while True:
+            b = proc.stdout.read(pipe_buffer)
+            if not b:
+                break
+            data += b
+        proc.stdout.close()
+        proc.wait()
+    finally:
+        _close(proc, fname)
+    return np.frombuffer(data, dtype="<f4", count=len(data)//4)
+
+
+def probe_duration(fname):
+    """Duration of the file in seconds from ffprobe, without decoding it, or None."""
+    if shutil.which("ffprobe") is None:
+        return None
+    cmd = ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+           "-of", "default=noprint_wrappers=1:nokey=1", os.fspath(fname)]
+    try:
+        out = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, timeout=60).stdout
+        return float(out.decode().strip())
+    except (subprocess.SubprocessError, ValueError, OSError):
+        return None
+
+
+class FFmpegStreamReader(AudioReader):
+    """AudioReader that serves consecutive windows from one running ffmpeg stream,
+    as the simulation loops of whisper_online.py request them. ffmpeg is restarted
+    with a seek only when a window is requested out of order.
+    """
+
+    # forward jumps shorter than this are decoded and skipped instead of restarting ffmpeg
+    MAX_SKIP_SECONDS = 30
+
+    def __init__(self, fname, quality="default", frame_seconds=1):
+        self.fname = fname
+        self.quality = quality
+        self.frame_size = int(frame_seconds*SAMPLING_RATE)
+        duration = probe_duration(fname)
+        if duration is None:
+            # no ffprobe: one pass to count the samples, still in bounded memory
+            n = sum(len(f) for f in stream_audio(fname, frame_size=self.frame_size*16, quality=quality))
+            self.frames = n
+        else:
+            self.frames = int(math.ceil(duration*SAMPLING_RATE))
+        self._frames_iter = None
+        self._buf = np.array([], dtype=np.float32)
+        self._buf_pos = 0  # sample index of self._buf[0]
+
+    def _restart(self, beg_s):
+        self.close()
+        self._frames_iter = stream_audio(self.fname, frame_size=self.frame_size, start=beg_s/SAMPLING_RATE, quality=self.quality)
+        self._buf = np.array([], dtype=np.float32)
+        self._buf_pos = beg_s
+
+    def _read(self, beg_s, end_s):
+        if (self._frames_iter is None or beg_s < self._buf_pos
+                or beg_s > self._buf_pos + len(self._buf) + self.MAX_SKIP_SECONDS*SAMPLING_RATE):
+            self._restart(beg_s)
+        while self._buf_pos + len(self._buf) < end_s:
+            frame = next(self._frames_iter, None)
+            if frame is None:
+                break
+            if self._buf_pos + len(self._buf) + len(frame) <= beg_s:
+                # skipping forward
+                self._buf_pos += len(self._buf) + len(frame)
+                self._buf = np.array([], dtype=np.float32)
+                continue
+            self._buf = np.concatenate([self._buf, frame]) if len(self._buf) else frame
+        out = self._buf[max(0, beg_s-self._buf_pos):end_s-self._buf_pos]
+        # keep only what was not consumed yet
+        cut = max(0, min(end_s-self._buf_pos, len(self._buf)))
+        self._buf = self._buf[cut:]
+        self._buf_pos += cut
+        return out
+
+    def close(self):
+        if self._frames_iter is not None:
+            self._frames_iter.close()  # runs the finally block of stream_audio, it kills ffmpeg
+            self._frames_iter = None
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+
+"""Persistent on-disk cache of decoded 16 kHz mono float32 audio.
+
+Decoding and resampling MP3/M4A with librosa is the slowest part of opening a
+file, and it used to be repeated on every run, e.g. when a folder is processed
+again for other languages or with another model. The decoded audio is stored
+here as `.npy` files keyed by a hash of the source file content and of the
+decoder that produced the samples, so that the next run just memory-maps it and
+the audio is paged in lazily.
+
+The cache lives in `get_pcm_cache_dir()` of src/config.py. When its total size
+exceeds the limit, the least recently used files are removed.
+
+Command line usage:
+    python3 pcm_cache.py stats
+    python3 pcm_cache.py list
+    python3 pcm_cache.py prune [--max-mb 1024]
+    python3 pcm_cache.py add <audio file or folder> ...
+    python3 pcm_cache.py clear
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SAMPLING_RATE = 16000
+
+# bump it when the decoding changes, so that the old entries are not used
+FORMAT_VERSION = 1
+
+
+def _config():
+    src = os.path.join(os.path.dirname(os.path.abspath(__file__)), "src")
+    if src not in sys.path:
+        sys.path.append(src)
+    import config
+    return config
+
+
+def file_hash(fname, decoder="", block_size=1 << 20):
+    """Hash of the file content (and the format version), used as the cache key.
+    decoder: the decoder and its settings, e.g. "ffmpeg:high". The samples of another decoder are another entry.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"v{FORMAT_VERSION}:{SAMPLING_RATE}:{decoder}".encode())
+    with open(fname, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class PCMCache:
+    """Directory of <hash>.npy files with decoded audio and <hash>.json metadata."""
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _paths(self, key):
+        return self.cache_dir / f"{key}.npy", self.cache_dir / f"{key}.json"
+
+    def get(self, fname, key=None):
+        """Returns the memory-mapped decoded audio of fname, or None if it is not cached."""
+        if key is None:
+            key = file_hash(fname)
+        audio = self._load(key)
+        if audio is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return audio
+
+    def _load(self, key):
+        npy, _ = self._paths(key)
+        try:
+            audio = np.load(npy, mmap_mode="r")
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        # mark as recently used for the eviction
+        try:
+            os.utime(npy)
+        except OSError:
+            pass
+        return audio
+
+    def put(self, fname, audio, key=None):
+        """Stores the whole decoded audio of fname. Returns the memory-mapped copy."""
+        audio = np.asarray(audio, dtype=np.float32)
+        with self._writer(fname, len(audio), key) as out:
+            out[:] = audio
+        return self._load(out.key)
+
+    def put_from_reader(self, fname, reader, block_seconds=60, key=None):
+        """Stores the audio of an audio_reader.AudioReader block by block, in bounded memory.
+        Returns the memory-mapped copy."""
+        with self._writer(fname, reader.frames, key) as out:
+            step = block_seconds*SAMPLING_RATE
+            for beg in range(0, reader.frames, step):
+                chunk = reader.read_frames(beg, beg+step)
+                out[beg:beg+len(chunk)] = chunk
+        return self._load(out.key)
+
+    def _writer(self, fname, frames, key):
+        if key is None:
+            key = file_hash(fname)
+        return _EntryWriter(self, fname, key, frames)
+
+    def entries(self):
+        """Returns a list of dicts with key, path, bytes, last_used and the metadata, the oldest first."""
+        out = []
+        if not self.cache_dir.is_dir():
+            return out
+        for npy in self.cache_dir.glob("*.npy"):
+            try:
+                st = npy.stat()
+            except OSError:
+                continue
+            e = {"key": npy.stem, "path": str(npy), "bytes": st.st_size, "last_used": st.st_mtime}
+            meta = npy.with_suffix(".json")
+            try:
+                with open(meta, encoding="utf-8") as f:
+                    e.update(json.load(f))
+            except (OSError, ValueError):
+                pass
+            out.append(e)
+        return sorted(out, key=lambda e: e["last_used"])
+
+    def total_bytes(self):
+        return sum(e["bytes"] for e in self.entries())
+
+    def remove(self, key):
+        """Removes the entry. Returns False if it is in use: on Windows, a memory-mapped file can't be removed."""
+        for p in self._paths(key):
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                pass
+            except PermissionError:
+                logger.debug(f"pcm cache: {p} is in use, not removed")
+                return False
+        return True
+
+    def prune(self, max_bytes=None, keep=None):
+        """Removes the least recently used entries until the cache fits into max_bytes.
+        keep: key of an entry that is never removed, e.g. the one that was just stored.
+        Returns the number of removed entries."""
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        entries = self.entries()
+        total = sum(e["bytes"] for e in entries)
+        removed = 0
+        for e in entries:
+            if total <= max_bytes:
+                break
+            if e["key"] == keep:
+                continue
+            if not self.remove(e["key"]):
+                continue
+            total -= e["bytes"]
+            removed += 1
+            logger.debug(f"pcm cache: evicted {e.get('source', e['key'])} ({e['bytes']} bytes)")
+        self.evictions += removed
+        return removed
+
+    def clear(self):
+        return self.prune(0)
+
+    def stats(self):
+        entries = self.entries()
+        return {
+            "dir": str(self.cache_dir),
+            "entries": len(entries),
+            "bytes": sum(e["bytes"] for e in entries),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class _EntryWriter:
+    """Context manager that writes one entry to a temporary file, and renames it into
+    the cache only if it is complete, so that other processes never see partial files."""
+
+    def __init__(self, cache, fname, key, frames):
+        self.cache = cache
+        self.fname = fname
+        self.key = key
+        self.frames = frames
+
+    def __enter__(self):
+        self.cache.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.npy, self.meta = self.cache._paths(self.key)
+        # not *.npy, so that it's not listed as an entry while it's written
+        self.tmp = self.npy.with_name(f"{self.key}.{os.getpid()}.tmp")
+        self.array = np.lib.format.open_memmap(self.tmp, mode="w+", dtype=np.float32, shape=(self.frames,))
+        return self
+
+    def __setitem__(self, index, value):
+        self.array[index] = value
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            del self.array
+            try:
+                self.tmp.unlink()
+            except FileNotFoundError:
+                pass
+            return False
+        self.array.flush()
+        del self.array
+        try:
+            os.replace(self.tmp, self.npy)
+        except PermissionError:
+            # on Windows, the entry is memory-mapped by another reader: it has the same content, keep it
+            if not self.npy.exists():
+                raise
+            self.tmp.unlink()
+            logger.debug(f"pcm cache: {self.npy} is in use, not replaced")
+        with open(self.meta, "w", encoding="utf-8") as f:
+            json.dump({"source": os.path.abspath(self.fname), "frames": self.frames, "created": time.time()}, f)
+        self.cache.prune(keep=self.key)
+        return False
+
+
+def open_default_pcm_cache():
+    """Returns the PCMCache configured in src/config.py, or None if it is disabled."""
+    try:
+        config = _config()
+    except ImportError:
+        logger.debug("src/config.py not found, the pcm cache is disabled")
+        return None
+    settings = config.CACHE_SETTINGS
+    if not settings["pcm_cache_enabled"]:
+        return None
+    return PCMCache(config.get_pcm_cache_dir(), settings["pcm_cache_max_mb"]*1024*1024)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Inspect and prune the cache of decoded audio.")
+    parser.add_argument("--dir", type=str, default=None, help="Cache directory (default: from src/config.py)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="Show the number of entries and their total size")
+    sub.add_parser("list", help="List the entries, the least recently used first")
+    p = sub.add_parser("prune", help="Remove the least recently used entries over the size limit")
+    p.add_argument("--max-mb", type=float, default=None, help="Size limit in MB (default: from src/config.py)")
+    p = sub.add_parser("add", help="Decode audio files (or all audio files in folders) into the cache")
+    p.add_argument("paths", nargs="+")
+    p.add_argument("--decoder", type=str, default="librosa", choices=["librosa", "ffmpeg"],
+                   help="The --decoder of whisper_online.py that the entries are for")
+    p.add_argument("--resample-quality", dest="resample_quality", type=str, default="default",
+                   help="The --resample-quality of whisper_online.py that the entries are for")
+    sub.add_parser("clear", help="Remove all entries")
+    args = parser.parse_args()
+
+    config = _config()
+    cache_dir = args.dir if args.dir is not None else config.get_pcm_cache_dir()
+    cache = PCMCache(cache_dir, config.CACHE_SETTINGS["pcm_cache_max_mb"]*1024*1024)
+
+    if args.command == "stats":
+        st = cache.stats()
+        print(f"Directory: {st['dir']}")
+        print(f"Entries:   {st['entries']}")
+        print(f"Size:      {st['bytes']/2**20:.1f} MB of {st['max_bytes']/2**20:.0f} MB")
+    elif args.command == "list":
+        for e in cache.entries():
+            used = time.strftime("%Y-%m-%d %H:%M", time.localtime(e["last_used"]))
+            duration = e.get("frames", 0)/SAMPLING_RATE
+            print(f"{e['key']}  {e['bytes']/2**20:8.1f} MB  {duration:9.1f} s  {used}  {e.get('source', '?')}")
+    elif args.command == "prune":
+        max_bytes = None if args.max_mb is None else int(args.max_mb*1024*1024)
+        print(f"Removed {cache.prune(max_bytes)} entries")
+    elif args.command == "clear":
+        print(f"Removed {cache.clear()} entries")
+    elif args.command == "add":
+        from utils import detect_audio_files
+        from audio_reader import parse_wav_header, MemmapWavReader
+        from whisper_online import load_audio_into_pcm_cache, set_audio_decoder
+        set_audio_decoder(args.decoder, args.resample_quality)
+        files = []
+        for path in args.paths:
+            files.extend(detect_audio_files(path) if os.path.isdir(path) else [Path(path)])
+        for fname in files:
+            if MemmapWavReader.supports(parse_wav_header(fname)):
+                print(f"{fname}: 16 kHz mono WAV is read directly, not cached")
+                continue
+            t = time.time()
+            load_audio_into_pcm_cache(str(fname), cache)
+            print(f"{fname}: {time.time()-t:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
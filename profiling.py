@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+"""Spans around the stages of the ASR hot path, for --profile.
+
+The stages of process_iter (prompt, transcribe, ts_words, insert, flush,
+to_flush, chunking) and of the offline engine are wrapped in
+
+    with profiling.span("transcribe"):
+        ...
+
+Without an enabled Tracer, span() returns one shared object whose __enter__
+and __exit__ do nothing, so the spans cost a function call.
+
+A Tracer sums the time of every stage (summary(), for the batch summaries of
+the front-ends) and optionally keeps every span as a Chrome trace event, which
+chrome://tracing and https://ui.perfetto.dev open. ProfileSession writes them
+to <dir>/<name>.trace.json, and with cprofile=True also a cProfile dump
+<dir>/<name>.prof for `python -m pstats` or snakeviz.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "args", "beg")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.beg = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.add(self.name, self.beg, time.perf_counter() - self.beg, self.args)
+        return False
+
+
+class Tracer:
+
+    def __init__(self, events=True):
+        """events: keep every span for write_chrome_trace, otherwise only the totals of the stages"""
+        self.events = [] if events else None
+        self.stages = {}  # name -> [count, seconds]
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+
+    def span(self, name, **args):
+        return _Span(self, name, args)
+
+    def add(self, name, beg, seconds, args=None):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = [0, 0.0]
+        stage[0] += 1
+        stage[1] += seconds
+        if self.events is not None:
+            event = {"name": name, "ph": "X", "ts": (beg - self.origin) * 1e6, "dur": seconds * 1e6,
+                     "pid": self.pid, "tid": threading.get_ident()}
+            if args:
+                event["args"] = args
+            self.events.append(event)
+
+    def summary(self):
+        """{stage: {"count", "seconds", "mean"}}, the longest stage first"""
+        return {name: {"count": c, "seconds": s, "mean": s / c}
+                for name, (c, s) in sorted(self.stages.items(), key=lambda kv: -kv[1][1])}
+
+    def format_summary(self):
+        """One line per stage, for logs"""
+        return [f"{name:16s} {st['count']:7d}x {st['seconds']:9.3f} s  {st['mean']*1000:9.3f} ms"
+                for name, st in self.summary().items()]
+
+    def write_chrome_trace(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self.events or [], "displayTimeUnit": "ms"}, f)
+
+
+_tracer = None
+
+
+def span(name, **args):
+    """A context manager that records the time of the block as the stage `name`, if a Tracer is enabled."""
+    tracer = _tracer
+    if tracer is None:
+        return _NO_SPAN
+    return tracer.span(name, **args)
+
+
+def enable(tracer=None):
+    """Makes tracer (a new one that keeps only the totals by default) the current one. Returns it."""
+    global _tracer
+    _tracer = tracer if tracer is not None else Tracer(events=False)
+    return _tracer
+
+
+def disable():
+    """Stops tracing. Returns the Tracer that was enabled, or None."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def enabled():
+    return _tracer is not None
+
+
+def current():
+    """The enabled Tracer, or None."""
+    return _tracer
+
+
+class ProfileSession:
+    """Traces the spans of one session (a run of whisper_online.py, a client of the server) into files in out_dir."""
+
+    def __init__(self, out_dir, name, cprofile=False):
+        self.out_dir = out_dir
+        self.name = name
+        self.cprofile = cprofile
+        self.tracer = None
+        self.profile = None
+
+    def __enter__(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        self.tracer = enable(Tracer(events=True))
+        if self.cprofile:
+            import cProfile
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        return self
+
+    def __exit__(self, *exc):
+        if self.profile is not None:
+            self.profile.disable()
+            self.profile.dump_stats(os.path.join(self.out_dir, f"{self.name}.prof"))
+        disable()
+        path = os.path.join(self.out_dir, f"{self.name}.trace.json")
+        self.tracer.write_chrome_trace(path)
+        logger.info(f"profile of {self.name} written to {path}")
+        for line in self.tracer.format_summary():
+            logger.info(line)
+        return False
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+"""Incremental sentence segmentation of the committed words, for buffer_trimming="sentence".
+
+OnlineASRProcessor.chunk_completed_sentence used to join all committed words,
+run the sentence tokenizer over the whole text and map the words back to the
+sentences with list.pop(0), on every iteration. IncrementalSentenceSegmenter
+remembers where the last confirmed sentence ended and tokenizes only the words
+after it. Every sentence but the last one returned by the tokenizer is
+confirmed, i.e. it is not tokenized again; only the last two are kept.
+"""
+
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+def map_words_to_sentences(words, sentences):
+    """words: [(beg,end,"word"), ...], sentences: the split of the words joined with spaces.
+    Returns: [(beg,end,"sentence"), ...] and, for each of them, the number of words up to its end.
+    Linear in the number of words. The matching is the one of the original
+    OnlineASRProcessor.words_to_sentences, except that a one-word sentence is
+    closed by its word (it used to swallow all the following words).
+    """
+    out = []
+    used = []
+    i = 0
+    n = len(words)
+    for sent in sentences:
+        sent = sent.strip()
+        fsent = sent
+        pos = 0  # sent[pos:] is what's left of the sentence
+        beg = None
+        end = None
+        while i < n:
+            b, e, w = words[i]
+            i += 1
+            w = w.strip()
+            if beg is None and sent.startswith(w, pos):
+                beg = b
+            if end is None and len(sent) - pos == len(w) and sent.endswith(w):
+                end = e
+                out.append((beg, end, fsent))
+                used.append(i)
+                break
+            pos = min(pos + len(w), len(sent))
+            while pos < len(sent) and sent[pos].isspace():
+                pos += 1
+        if i >= n:
+            break
+    return out, used
+
+
+class IncrementalSentenceSegmenter:
+
+    def __init__(self, tokenizer, keep=2):
+        """tokenizer: object with split(text) -> [sentence, ...], like MosesTokenizer
+        keep: number of confirmed sentences that are kept
+        """
+        self.tokenizer = tokenizer
+        self.confirmed = deque(maxlen=keep)  # (beg, end, "sentence")
+        self.pending = []  # words after the last confirmed sentence
+        self.last = None  # the sentence in progress, (beg, end, "sentence") or None
+        self._dirty = False
+
+    def add(self, words):
+        if words:
+            self.pending.extend(words)
+            self._dirty = True
+
+    def sentences(self):
+        """The last confirmed sentences and the one in progress, [(beg,end,"sentence"), ...]"""
+        if self._dirty:
+            self._update()
+        out = list(self.confirmed)
+        if self.last is not None:
+            out.append(self.last)
+        return out
+
+    def _update(self):
+        self._dirty = False
+        text = " ".join(w[2] for w in self.pending)
+        split = self.tokenizer.split(text)
+        sents, used = map_words_to_sentences(self.pending, split)
+        # the last sentence of the tokenizer can still continue
+        k = min(len(sents), len(split)-1)
+        if k > 0:
+            self.confirmed.extend(sents[:k])
+            del self.pending[:used[k-1]]
+            logger.debug(f"{k} sentences confirmed, {len(self.pending)} words pending")
+        self.last = sents[k] if k < len(sents) else None
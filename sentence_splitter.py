@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+"""Rule-based sentence splitter, in pure Python, for the languages of the subtitle generator.
+
+The sentence buffer trimming needs a tokenizer with split(text) -> [sentence, ...].
+MosesTokenizer runs a Perl subprocess and WtP loads a neural model, which takes
+seconds before the first split. For cs, en, es, de, fr, ru, id and zh, Whisper's
+output is punctuated well enough that a few rules do the job:
+
+  - a sentence ends with . ! ? or … (and 。！？ in Chinese), optionally followed
+    by closing quotes or brackets,
+  - and the next sentence starts with an uppercase letter, a digit, an opening
+    quote or bracket, or ¿ ¡ (in Chinese, any character),
+  - but not after a known abbreviation of the language, an initial ("J. Smith"),
+    or an ordinal number in Czech and German ("3. května", "am 3. Mai").
+    Abbreviations that often end a sentence, like "etc." or "atd.", are not
+    in the lists.
+
+Sentences are split only at whitespace (except in Chinese), so the words joined
+with spaces map back to the sentences.
+"""
+
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+ABBREVIATIONS = {
+    "cs": "např tzv tj tzn resp mj příp popř str čís č odst písm obr tab ing mgr bc doc prof mudr judr phdr rndr dr p pí sv kč hod min sl".split(),
+    "en": "mr mrs ms dr prof sr jr st vs e.g i.e cf approx dept est fig no ltd co corp jan feb mar apr jun jul aug sep sept oct nov dec u.s a.m p.m".split(),
+    "es": "sr sra srta dr dra ud uds lic ing prof p.ej pág núm aprox av avda dto".split(),
+    "de": "z.b d.h u.a bzw ca evtl ggf inkl vgl nr str hr fr dr prof dipl-ing s u.s.w o.ä".split(),
+    "fr": "m mm mme mlle dr pr p.ex cf av apr n° st ste env".split(),
+    "ru": "т.е т.к г гг ул д др пр стр им см напр тыс млн млрд руб коп".split(),
+    "id": "bpk ibu sdr jl no hlm yth dr prof ir drs tn ny".split(),
+    "zh": [],
+}
+
+# languages in which "3. " is an ordinal number, not the end of a sentence
+ORDINAL_DOT_LANGUAGES = {"cs", "de"}
+
+CLOSING = "\"'”’»)]」』"
+OPENING = "\"'“‘«([¿¡「『"
+
+_BOUNDARY = re.compile(r"[.!?…]+[" + re.escape(CLOSING) + r"]*(?=\s+(\S))")
+_ZH_BOUNDARY = re.compile(r"[。！？!?…]+[" + re.escape(CLOSING) + r"]*")
+
+
+class RuleSentenceSplitter:
+
+    LANGUAGES = tuple(ABBREVIATIONS)
+
+    def __init__(self, lan):
+        if lan not in ABBREVIATIONS:
+            raise ValueError(f"no sentence splitting rules for {lan}, only for {', '.join(ABBREVIATIONS)}")
+        self.lan = lan
+        self.abbreviations = set(ABBREVIATIONS[lan])
+        self.ordinal_dot = lan in ORDINAL_DOT_LANGUAGES
+
+    def split(self, text):
+        if self.lan == "zh":
+            ends = [m.end() for m in _ZH_BOUNDARY.finditer(text)]
+        else:
+            ends = [m.end() for m in _BOUNDARY.finditer(text) if self._is_end(text, m)]
+        out = []
+        beg = 0
+        for end in ends:
+            s = text[beg:end].strip()
+            if s:
+                out.append(s)
+            beg = end
+        s = text[beg:].strip()
+        if s:
+            out.append(s)
+        return out
+
+    def _is_end(self, text, m):
+        nxt = m.group(1)
+        if nxt.isalpha() and not nxt.isupper():
+            return False
+        if text[m.start()] != "." or m.group().startswith("..."):
+            return True
+        # the word before the dot
+        beg = m.start()
+        while beg > 0 and not text[beg-1].isspace():
+            beg -= 1
+        w = text[beg:m.start()].lstrip(OPENING)
+        if not w:
+            return True
+        if w.lower() in self.abbreviations:
+            return False
+        if len(w) == 1 and w.isupper():  # an initial
+            return False
+        if self.ordinal_dot and w.isdigit() and len(w) <= 2:
+            return False
+        return True
@@ -70,10 +70,15 @@ class VADIterator:
                 raise TypeError("Audio cannot be casted to tensor. Cast it manually")
 
         window_size_samples = len(x[0]) if x.dim() == 2 else len(x)
-        self.current_sample += window_size_samples
 
         speech_prob = self.model(x, self.sampling_rate).item()
 
+        return self.process_prob(speech_prob, window_size_samples, return_seconds)
+
+    def process_prob(self, speech_prob, window_size_samples, return_seconds=False):
+        """Updates the start/end state with the speech probability of the next window."""
+        self.current_sample += window_size_samples
+
         if (speech_prob >= self.threshold) and self.temp_end:
             self.temp_end = 0
 
@@ -103,26 +108,99 @@ class FixedVADIterator(VADIterator):
     '''It fixes VADIterator by allowing to process any audio length, not only exactly 512 frames at once.
     If audio to be processed at once is long and multiple voiced segments detected, 
     then __call__ returns the start of the first segment, and end (or middle, which means no end) of the last segment. 
+
+    The windows are read with a cursor over the incoming chunk, only the tail shorter than 512 samples
+    is copied to a preallocated buffer, and the tensors share memory with the numpy arrays.
+
+    batch_windows: if a chunk contains at least this many windows (e.g. the whole file in --offline mode),
+    their speech probabilities are computed first, in one model.audio_forward call if the model
+    has it and the VAD is at the beginning, otherwise in one loop without the per-window overhead.
+    The start/end merging is the same. Silero is a recurrent model, so the windows of one stream can't be
+    scored as independent rows of one batch.
     '''
 
+    WINDOW = 512
+
+    def __init__(self, *a, batch_windows=16, **kw):
+        self.batch_windows = batch_windows
+        super().__init__(*a, **kw)
+
     def reset_states(self):
         super().reset_states()
-        self.buffer = np.array([],dtype=np.float32)
+        self.buffer = np.empty(self.WINDOW, dtype=np.float32)
+        self.buffered = 0  # number of valid samples in self.buffer, always < WINDOW between calls
+
+    def _score(self, window):
+        return self.model(torch.from_numpy(window), self.sampling_rate).item()
+
+    def _score_many(self, windows):
+        """windows: 2D array of shape (n, WINDOW), rows in time order. Returns a list of n probabilities."""
+        with torch.no_grad():
+            if self.current_sample == 0 and hasattr(self.model, "audio_forward"):
+                # the model state is fresh, which is what audio_forward starts with
+                probs = self.model.audio_forward(torch.from_numpy(windows.reshape(1, -1)), self.sampling_rate)
+                return probs[0].tolist()
+            probs = [self.model(w, self.sampling_rate) for w in torch.from_numpy(windows)]
+            return torch.cat(probs).flatten().tolist()
+
+    def _merge(self, ret, r):
+        if ret is None:
+            return r
+        elif r is not None:
+            if 'end' in r:
+                ret['end'] = r['end']  # the latter end
+            if 'start' in r and 'end' in ret:  # there is an earlier start.
+                # Remove end, merging this segment with the previous one.
+                del ret['end']
+        return ret
+
+    def _events(self, x, return_seconds):
+        """Yields the start/end events of the windows of x, one by one."""
+        x = np.asarray(x, dtype=np.float32)
+        if not x.flags.writeable or not x.flags.c_contiguous:
+            x = np.ascontiguousarray(x).copy()  # torch.from_numpy needs a writable contiguous array
+        pos = 0
+
+        # complete the window that was started by the previous chunk
+        if self.buffered:
+            n = min(self.WINDOW - self.buffered, len(x))
+            self.buffer[self.buffered:self.buffered+n] = x[:n]
+            self.buffered += n
+            pos = n
+            if self.buffered < self.WINDOW:
+                return
+            r = self.process_prob(self._score(self.buffer), self.WINDOW, return_seconds)
+            self.buffered = 0
+            if r is not None:
+                yield r
+
+        # whole windows directly from x, without copying
+        count = (len(x) - pos) // self.WINDOW
+        if count >= self.batch_windows:
+            windows = x[pos:pos+count*self.WINDOW].reshape(count, self.WINDOW)
+            probs = self._score_many(windows)
+        else:
+            probs = (self._score(x[pos+i*self.WINDOW:pos+(i+1)*self.WINDOW]) for i in range(count))
+        for p in probs:
+            r = self.process_prob(p, self.WINDOW, return_seconds)
+            if r is not None:
+                yield r
+        pos += count*self.WINDOW
+
+        # keep the tail for the next call
+        rest = len(x) - pos
+        self.buffer[:rest] = x[pos:]
+        self.buffered = rest
+
+    def events(self, x, return_seconds=False):
+        """Like __call__, but returns all the start/end events in x, [{'start': ...}, {'end': ...}, ...],
+        instead of merging them. For segmenting a whole recording."""
+        return list(self._events(x, return_seconds))
 
     def __call__(self, x, return_seconds=False):
-        self.buffer = np.append(self.buffer, x) 
         ret = None
-        while len(self.buffer) >= 512:
-            r = super().__call__(self.buffer[:512], return_seconds=return_seconds)
-            self.buffer = self.buffer[512:]
-            if ret is None:
-                ret = r
-            elif r is not None:
-                if 'end' in r:
-                    ret['end'] = r['end']  # the latter end
-                if 'start' in r and 'end' in ret:  # there is an earlier start.
-                    # Remove end, merging this segment with the previous one.
-                    del ret['end']
+        for r in self._events(x, return_seconds):
+            ret = self._merge(ret, r)
         return ret if ret != {} else None
 
 if __name__ == "__main__":
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+"""Splitting a whole audio file into windows for offline transcription.
+
+The offline engine of whisper_online.py transcribes every window once, so the
+windows should be at most as long as Whisper's 30-second context and should be
+cut in silence. Speech regions come from a simple energy detector (or from
+Silero VAD, see whisper_online.silero_speech_regions), then consecutive regions
+are packed into windows of up to max_window seconds. A region longer than that
+is cut at its quietest frame.
+
+All times are in samples at 16 kHz, unless the name says seconds.
+"""
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SAMPLING_RATE = 16000
+
+FRAME = 480  # 30 ms
+
+
+def frame_rms(read, duration, block_seconds=60):
+    """RMS of the 30 ms frames of the whole file, read in blocks of block_seconds.
+    read(beg, end): audio between beg and end seconds, e.g. whisper_online.load_audio_chunk.
+    """
+    out = []
+    beg = 0
+    while beg < duration:
+        end = min(duration, beg + block_seconds)
+        a = read(beg, end)
+        n = len(a) // FRAME
+        if n:
+            f = a[:n*FRAME].reshape(n, FRAME).astype(np.float32)
+            out.append(np.sqrt(np.mean(f*f, axis=1)))
+        beg = end
+    return np.concatenate(out) if out else np.zeros(0, dtype=np.float32)
+
+
+class SilenceDetector:
+    """Tells if the pieces of a stream are silence, with the rule of energy_speech_regions:
+    a frame is speech if it is 12 dB over the noise floor and at least floor_db dBFS. The noise floor
+    is the 10th percentile of the frames of the last history seconds of the stream. Until there are
+    min_history seconds of them, only the frames under floor_db are silence.
+    """
+
+    def __init__(self, floor_db=-50, history=30, min_history=3):
+        self.floor = 10**(floor_db/20)
+        self.rms = np.zeros(0, dtype=np.float32)
+        self.history_frames = int(history * SAMPLING_RATE / FRAME)
+        self.min_history_frames = int(min_history * SAMPLING_RATE / FRAME)
+        self.rest = np.zeros(0, dtype=np.float32)  # the samples of an incomplete frame
+
+    def is_silence(self, audio):
+        """audio: the next samples of the stream at 16 kHz. True if none of its complete frames is speech.
+        An incomplete last frame is kept for the next call."""
+        a = np.concatenate((self.rest, np.asarray(audio, dtype=np.float32)))
+        n = len(a) // FRAME
+        self.rest = a[n*FRAME:]
+        if n == 0:
+            return True
+        f = a[:n*FRAME].reshape(n, FRAME)
+        rms = np.sqrt(np.mean(f*f, axis=1))
+        self.rms = np.concatenate((self.rms, rms))[-self.history_frames:]
+        threshold = self.floor
+        if len(self.rms) >= self.min_history_frames:
+            threshold = max(np.percentile(self.rms, 10) * 4, self.floor)
+        return not np.any(rms > threshold)
+
+
+def energy_speech_regions(rms, min_silence=0.5, min_speech=0.1, pad=0.2, floor_db=-50):
+    """Speech regions [(beg, end), ...] in samples from the frame RMS.
+    A frame is speech if it is 12 dB over the noise floor (the 10th percentile of the frames),
+    and at least floor_db dBFS. Gaps shorter than min_silence seconds are merged.
+    """
+    if len(rms) == 0:
+        return []
+    threshold = max(np.percentile(rms, 10) * 4, 10**(floor_db/20))
+    speech = rms > threshold
+    # runs of speech frames: starts and ends (exclusive) in frames
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], speech.astype(np.int8), [0]))))
+    starts, ends = edges[::2], edges[1::2]
+    frame_s = FRAME / SAMPLING_RATE
+    regions = []
+    for s, e in zip(starts.tolist(), ends.tolist()):
+        if regions and (s - regions[-1][1]) * frame_s < min_silence:
+            regions[-1][1] = e
+        else:
+            regions.append([s, e])
+    pad_frames = int(pad / frame_s)
+    out = []
+    for s, e in regions:
+        if (e - s) * frame_s < min_speech:
+            continue
+        s = max(0, s - pad_frames)
+        e = min(len(rms), e + pad_frames)
+        if out and s <= out[-1][1]:
+            out[-1][1] = e
+        else:
+            out.append([s, e])
+    return [(s*FRAME, e*FRAME) for s, e in out]
+
+
+def pack_windows(regions, rms=None, max_window=25, max_gap=5):
+    """Packs speech regions [(beg, end), ...] in samples into windows of up to max_window seconds.
+    The silence between the regions of one window is transcribed with them, so the timestamps
+    of a window are continuous, but regions more than max_gap seconds apart are not packed
+    together (Whisper tends to hallucinate in long silence). A region longer than max_window
+    is cut at the quietest frame of its second half (by rms, or at max_window without it).
+    """
+    max_len = int(max_window * SAMPLING_RATE)
+    max_gap = int(max_gap * SAMPLING_RATE)
+    windows = []
+    for beg, end in regions:
+        while end - beg > max_len:
+            cut = beg + max_len
+            if rms is not None:
+                lo, hi = (beg + max_len//2) // FRAME, cut // FRAME
+                if hi > lo:
+                    cut = (lo + int(np.argmin(rms[lo:hi]))) * FRAME
+            windows.append((beg, cut))
+            beg = cut
+        if windows and end - windows[-1][0] <= max_len and beg - windows[-1][1] <= max_gap:
+            windows[-1] = (windows[-1][0], end)
+        else:
+            windows.append((beg, end))
+    return windows
+
+
+def split_parts(windows, n, overlap=1.0):
+    """Splits the windows [(beg, end), ...] in seconds into up to n lists of consecutive windows with
+    about the same amount of speech, for transcribing them in parallel. A part ends at the longest
+    pause near its share of the speech. If that pause is shorter than overlap seconds (a long region
+    was cut), the next part starts overlap seconds earlier, so that the word at the cut is not lost;
+    the repeated words are dropped when the parts are stitched together.
+    """
+    if not windows:
+        return []
+    n = max(1, min(n, len(windows)))
+    starts = np.cumsum([0] + [e - b for b, e in windows])  # speech before every window
+    band = starts[-1] / n / 4
+    cuts = [0]
+    for k in range(1, n):
+        target = starts[-1] * k / n
+        rest = range(cuts[-1] + 1, len(windows) - (n - 1 - k))
+        near = [i for i in rest if abs(starts[i] - target) <= band] or [min(rest, key=lambda i: abs(starts[i] - target))]
+        cuts.append(max(near, key=lambda i: windows[i][0] - windows[i-1][1]))
+    parts = [list(windows[c:d]) for c, d in zip(cuts, cuts[1:] + [len(windows)])]
+    for c, part in zip(cuts[1:], parts[1:]):
+        beg, end = part[0]
+        if beg - windows[c-1][1] < overlap:
+            part[0] = (max(windows[c-1][0], beg - overlap), end)
+    return parts
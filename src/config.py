@@ -137,6 +137,16 @@ def get_models_dir():
     cache_dir = get_cache_dir()
     return cache_dir / "models"
 
+def get_pcm_cache_dir():
+    """Returns the decoded audio (16 kHz PCM) cache directory"""
+    cache_dir = get_cache_dir()
+    return cache_dir / "pcm"
+
+def get_transcribe_cache_dir():
+    """Returns the directory of cached transcribe results"""
+    cache_dir = get_cache_dir()
+    return cache_dir / "transcribe"
+
 # GUI settings
 GUI_SETTINGS = {
     'window_size': '800x600',
@@ -148,7 +158,7 @@ GUI_SETTINGS = {
 
 # Processing settings
 PROCESSING_SETTINGS = {
-    'max_workers': 4,  # For parallel processing
+    'max_workers': 4,  # Worker processes of the offline transcription on CPU, each loads its own model
     'timeout_seconds': 3600,  # 1 hour timeout per file
     'retry_attempts': 3,
     'chunk_overlap_seconds': 1,
@@ -156,6 +166,14 @@ PROCESSING_SETTINGS = {
     'energy_threshold': 300
 }
 
+# Decoded audio cache settings (see pcm_cache.py) and transcribe results cache settings (see transcribe_cache.py)
+CACHE_SETTINGS = {
+    'pcm_cache_enabled': True,
+    'pcm_cache_max_mb': 4096,  # Least recently used files are evicted above this size
+    'transcribe_cache_enabled': False,  # or --transcribe-cache of whisper_online.py
+    'transcribe_cache_max_mb': 512
+}
+
 # Translation settings
 TRANSLATION_SETTINGS = {
     'batch_size': 10,  # Segments to translate at once
@@ -186,6 +204,11 @@ def get_env_or_default(key, default):
 # Override defaults with environment variables
 DEFAULT_MODEL = get_env_or_default('MODEL', DEFAULT_MODEL)
 DEFAULT_BACKEND = get_env_or_default('BACKEND', DEFAULT_BACKEND)
+PROCESSING_SETTINGS['max_workers'] = int(get_env_or_default('MAX_WORKERS', PROCESSING_SETTINGS['max_workers']))
+CACHE_SETTINGS['pcm_cache_enabled'] = get_env_or_default('PCM_CACHE', '1').lower() in ['1', 'true', 'yes']
+CACHE_SETTINGS['pcm_cache_max_mb'] = int(get_env_or_default('PCM_CACHE_MB', CACHE_SETTINGS['pcm_cache_max_mb']))
+CACHE_SETTINGS['transcribe_cache_enabled'] = get_env_or_default('TRANSCRIBE_CACHE', '0').lower() in ['1', 'true', 'yes']
+CACHE_SETTINGS['transcribe_cache_max_mb'] = int(get_env_or_default('TRANSCRIBE_CACHE_MB', CACHE_SETTINGS['transcribe_cache_max_mb']))
 
 # Validation functions
 def validate_model(model):
@@ -224,7 +247,9 @@ def init_app_directories():
     directories = [
         get_app_data_dir(),
         get_cache_dir(),
-        get_models_dir()
+        get_models_dir(),
+        get_pcm_cache_dir(),
+        get_transcribe_cache_dir()
     ]
     
     for directory in directories:
@@ -235,22 +260,40 @@ PLATFORM_SETTINGS = {
     'macos_silicon': {
         'preferred_backend': 'mlx-whisper',
         'memory_efficient': True,
-        'gpu_acceleration': True
+        'gpu_acceleration': True,
+        # faster-whisper (CTranslate2) has no Metal support, it runs on CPU
+        'device': 'cpu',
+        'compute_type': 'int8',
+        'cpu_threads': 0,  # 0 = CTranslate2 default
+        'num_workers': 1
     },
     'macos_intel': {
         'preferred_backend': 'faster-whisper',
         'memory_efficient': False,
-        'gpu_acceleration': False
+        'gpu_acceleration': False,
+        'device': 'cpu',
+        'compute_type': 'int8',
+        'cpu_threads': 0,
+        'num_workers': 1
     },
     'windows': {
         'preferred_backend': 'faster-whisper',
         'memory_efficient': False,
-        'gpu_acceleration': True
+        'gpu_acceleration': True,
+        # cuda with float16 if available, otherwise cpu with int8
+        'device': 'auto',
+        'compute_type': 'auto',
+        'cpu_threads': 0,
+        'num_workers': 1
     },
     'linux': {
         'preferred_backend': 'faster-whisper', 
         'memory_efficient': False,
-        'gpu_acceleration': True
+        'gpu_acceleration': True,
+        'device': 'auto',
+        'compute_type': 'auto',
+        'cpu_threads': 0,
+        'num_workers': 1
     }
 }
 
@@ -259,6 +302,17 @@ def get_platform_settings():
     platform_type = detect_platform()
     return PLATFORM_SETTINGS.get(platform_type, PLATFORM_SETTINGS['linux'])
 
+def get_inference_settings():
+    """Returns the faster-whisper device, compute type, cpu threads and workers for current platform,
+    overridden by ONECLICK_DEVICE, ONECLICK_COMPUTE_TYPE, ONECLICK_CPU_THREADS and ONECLICK_NUM_WORKERS"""
+    settings = get_platform_settings()
+    return {
+        'device': get_env_or_default('DEVICE', settings['device']),
+        'compute_type': get_env_or_default('COMPUTE_TYPE', settings['compute_type']),
+        'cpu_threads': int(get_env_or_default('CPU_THREADS', settings['cpu_threads'])),
+        'num_workers': int(get_env_or_default('NUM_WORKERS', settings['num_workers']))
+    }
+
 # Export main configuration
 CONFIG = {
     'version': VERSION,
@@ -272,9 +326,11 @@ CONFIG = {
     'backends': BACKENDS,
     'gui_settings': GUI_SETTINGS,
     'processing_settings': PROCESSING_SETTINGS,
+    'cache_settings': CACHE_SETTINGS,
     'translation_settings': TRANSLATION_SETTINGS,
     'output_settings': OUTPUT_SETTINGS,
     'platform_settings': get_platform_settings(),
+    'inference_settings': get_inference_settings(),
     'debug_mode': DEBUG_MODE,
     'log_level': LOG_LEVEL
 }
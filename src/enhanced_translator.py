@@ -5,12 +5,18 @@ Rozšířená verze s Google Translate API pro skutečný překlad
 
 import os
 import sys
-import subprocess
-import tempfile
 import glob
 from pathlib import Path
 from datetime import timedelta
 import argparse
+import contextlib
+
+try:
+    from utils import transcribe_file_ms, transcribe_files_ms, stop_transcription_workers, load_profiling
+except ImportError:  # importováno jako balíček src
+    from .utils import transcribe_file_ms, transcribe_files_ms, stop_transcription_workers, load_profiling
+
+profiling = load_profiling()
 
 # Pro Google Translate
 try:
@@ -78,61 +84,31 @@ class EnhancedSubtitleGenerator:
             audio_files.extend(glob.glob(os.path.join(folder, f"*{ext.upper()}")))
         return audio_files
     
-    def transcribe_audio(self, audio_file, model="large-v3", backend="mlx-whisper"):
-        """Transkribuje audio soubor do češtiny"""
+    def transcribe_audio(self, audio_file, model="large-v3", backend="mlx-whisper", decoder="librosa", inference=None):
+        """Transkribuje audio soubor do češtiny
+        inference: device, compute_type, cpu_threads a num_workers pro faster-whisper, nezadané se berou z config.py"""
         print(f"🎙️ Transkribuji: {os.path.basename(audio_file)}")
         
         try:
-            # Vytvoříme dočasný soubor pro výstup
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False) as temp_file:
-                temp_output = temp_file.name
-            
-            # Spustíme whisper_online.py
-            cmd = [
-                "python3", "whisper_online.py",
-                audio_file,
-                "--language", "cs",
-                "--model", model,
-                "--backend", backend,
-                "--min-chunk-size", "1",
-                "--vac"
-            ]
-            
-            print(f"📝 Spouštím: {' '.join(cmd)}")
-            
-            with open(temp_output, 'w', encoding='utf-8') as output_file:
-                process = subprocess.run(cmd, stdout=output_file, stderr=subprocess.PIPE, 
-                                       text=True, timeout=3600)
-            
-            if process.returncode != 0:
-                print(f"❌ Whisper chyba: {process.stderr}")
-                return None
-            
-            # Načteme a zparsujeme výstup
-            transcript_data = []
-            with open(temp_output, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    
-                    parts = line.split(' ', 3)
-                    if len(parts) >= 4:
-                        try:
-                            start_ms = int(parts[1])
-                            end_ms = int(parts[2])
-                            text = parts[3]
-                            transcript_data.append((start_ms, end_ms, text))
-                        except ValueError:
-                            continue
-            
-            # Vyčistíme dočasný soubor
-            os.unlink(temp_output)
+            # Offline transkripce v tomto procesu: soubor se rozdělí podle řeči a každé okno se přepíše jednou,
+            # model se načte jen pro první soubor
+            with profiling.span("transcribe_file"):
+                transcript_data = transcribe_file_ms(
+                    audio_file,
+                    lan="cs",
+                    model=model,
+                    backend=backend,
+                    min_chunk_size=1,
+                    vac=True,
+                    offline=True,
+                    decoder=decoder,
+                    **(inference or {})
+                )
             
             print(f"✅ Transkripce dokončena: {len(transcript_data)} segmentů")
             return transcript_data
             
-        except subprocess.TimeoutExpired:
+        except TimeoutError:
             print(f"❌ Timeout při zpracování {os.path.basename(audio_file)}")
             return None
         except Exception as e:
@@ -202,8 +178,34 @@ class EnhancedSubtitleGenerator:
         ms = td.microseconds // 1000
         return f"{hours:02d}:{minutes:02d}:{seconds:02d},{ms:03d}"
     
-    def process_folder(self, folder, selected_languages=None, model="large-v3", backend="mlx-whisper"):
-        """Zpracuje všechny audio soubory ve složce"""
+    def transcribe_batch(self, audio_files, model="large-v3", backend="mlx-whisper", decoder="librosa", inference=None, batch_size=16):
+        """Transkribuje soubory do češtiny v dávkovém režimu, okna řeči více souborů se přepisují najednou.
+        Vrací postupně (audio_file, transcript_data) pro každý hotový soubor, při chybě transcript_data = []"""
+        print(f"🎙️ Dávková transkripce {len(audio_files)} souborů (dávka {batch_size} oken)")
+        done = set()
+        try:
+            for audio_file, transcript_data in transcribe_files_ms(
+                audio_files,
+                batch_size=batch_size,
+                lan="cs",
+                model=model,
+                backend=backend,
+                vac=True,
+                decoder=decoder,
+                **(inference or {})
+            ):
+                done.add(audio_file)
+                print(f"✅ {os.path.basename(audio_file)}: {len(transcript_data)} segmentů")
+                yield audio_file, transcript_data
+        except Exception as e:
+            print(f"❌ Chyba při dávkové transkripci: {str(e)}")
+            for audio_file in audio_files:
+                if audio_file not in done:
+                    yield audio_file, []
+    
+    def process_folder(self, folder, selected_languages=None, model="large-v3", backend="mlx-whisper", decoder="librosa", inference=None, batch_size=0):
+        """Zpracuje všechny audio soubory ve složce
+        batch_size: v dávkovém režimu (> 0) se soubory přepisují společně, po batch_size oknech řeči"""
         if selected_languages is None:
             selected_languages = list(self.languages.keys())
         
@@ -220,36 +222,54 @@ class EnhancedSubtitleGenerator:
         completed = 0
         total = len(audio_files) * len(selected_languages)
         
-        for i, audio_file in enumerate(audio_files):
-            file_name = Path(audio_file).stem
-            print(f"\n{'='*60}")
-            print(f"📄 Zpracovávám soubor {i+1}/{len(audio_files)}: {os.path.basename(audio_file)}")
-            print(f"{'='*60}")
-            
-            # Transkripce do češtiny
-            transcript_data = self.transcribe_audio(audio_file, model, backend)
+        if batch_size > 0:
+            transcripts = self.transcribe_batch(audio_files, model, backend, decoder, inference, batch_size)
+        else:
+            transcripts = ((f, self.transcribe_audio(f, model, backend, decoder, inference)) for f in audio_files)
+        
+        try:
+            for i, (audio_file, transcript_data) in enumerate(transcripts):
+                file_name = Path(audio_file).stem
+                print(f"\n{'='*60}")
+                print(f"📄 Zpracovávám soubor {i+1}/{len(audio_files)}: {os.path.basename(audio_file)}")
+                print(f"{'='*60}")
             
-            if not transcript_data:
-                print(f"❌ Přeskakuji soubor kvůli chybě transkripce")
-                completed += len(selected_languages)
-                continue
+                if not transcript_data:
+                    print(f"❌ Přeskakuji soubor kvůli chybě transkripce")
+                    completed += len(selected_languages)
+                    continue
             
-            # Vytvoření titulků pro každý jazyk
-            for lang_code in selected_languages:
-                completed += 1
-                progress = (completed / total) * 100
+                # Vytvoření titulků pro každý jazyk
+                for lang_code in selected_languages:
+                    completed += 1
+                    progress = (completed / total) * 100
                 
-                print(f"\n🔄 [{completed}/{total}] ({progress:.1f}%) Jazyk: {self.languages[lang_code]} ({lang_code})")
+                    print(f"\n🔄 [{completed}/{total}] ({progress:.1f}%) Jazyk: {self.languages[lang_code]} ({lang_code})")
                 
-                # Překlad
-                translated_data = self.translate_transcript(transcript_data, lang_code)
+                    # Překlad
+                    with profiling.span("translate"):
+                        translated_data = self.translate_transcript(transcript_data, lang_code)
                 
-                # Vytvoření SRT souboru
-                output_file = os.path.join(folder, f"{file_name}_{lang_code}.srt")
-                self.create_srt_file(translated_data, output_file)
+                    # Vytvoření SRT souboru
+                    output_file = os.path.join(folder, f"{file_name}_{lang_code}.srt")
+                    with profiling.span("write_srt"):
+                        self.create_srt_file(translated_data, output_file)
+        finally:
+            # pracovní procesy drží každý svou kopii modelu
+            stop_transcription_workers()
         
         print(f"\n🎉 Zpracování dokončeno!")
         print(f"📊 Vytvořeno {completed} SRT souborů")
+        self.print_stage_times()
+    
+    def print_stage_times(self):
+        """Vypíše součty časů fází (načtení audia, transkripce, překlad, zápis SRT), pokud se měří"""
+        tracer = profiling.current()
+        if tracer is None or not tracer.stages:
+            return
+        print(f"⏱️ Časy fází:")
+        for line in tracer.format_summary():
+            print(f"   {line}")
 
 def main():
     parser = argparse.ArgumentParser(description='OneClick Subtitle Generator - Batch zpracování')
@@ -264,6 +284,23 @@ def main():
     parser.add_argument('--backend', default='mlx-whisper',
                        choices=['mlx-whisper', 'faster-whisper', 'whisper_timestamped'],
                        help='Whisper backend (default: mlx-whisper)')
+    parser.add_argument('--decoder', default='librosa',
+                       choices=['librosa', 'ffmpeg'],
+                       help='Dekodér audia, ffmpeg je rychlejší pro MP3/M4A/WMA (default: librosa)')
+    parser.add_argument('--device', choices=['auto', 'cuda', 'cpu'],
+                       help='Zařízení pro faster-whisper, bez CUDA se použije CPU (default: podle platformy v config.py)')
+    parser.add_argument('--compute-type', dest='compute_type',
+                       choices=['auto', 'int8', 'int8_float32', 'float32', 'int8_float16', 'float16'],
+                       help='Typ výpočtu pro faster-whisper, na CPU je nejrychlejší int8 (default: podle platformy v config.py)')
+    parser.add_argument('--cpu-threads', dest='cpu_threads', type=int,
+                       help='Počet vláken faster-whisper na CPU (default: podle platformy v config.py)')
+    parser.add_argument('--batch', dest='batch_size', type=int, nargs='?', const=16, default=0,
+                       help='Dávkový režim pro mnoho krátkých nahrávek: okna řeči více souborů se přepisují najednou '
+                            '(faster-whisper 1.1+), volitelně velikost dávky (default: 16)')
+    parser.add_argument('--profile', metavar='DIR',
+                       help='Uloží Chrome trace fází zpracování (a s --profile-cprofile i cProfile) do této složky')
+    parser.add_argument('--profile-cprofile', dest='profile_cprofile', action='store_true',
+                       help='S --profile uloží také výstup cProfile pro python -m pstats nebo snakeviz')
     
     args = parser.parse_args()
     
@@ -272,7 +309,16 @@ def main():
         sys.exit(1)
     
     generator = EnhancedSubtitleGenerator()
-    generator.process_folder(args.folder, args.languages, args.model, args.backend)
+    inference = {k: v for k, v in [('device', args.device), ('compute_type', args.compute_type),
+                                   ('cpu_threads', args.cpu_threads)] if v is not None}
+    if args.profile:
+        session = profiling.ProfileSession(args.profile, f"enhanced_translator-{os.getpid()}", args.profile_cprofile)
+    else:
+        # jen součty časů fází pro souhrn na konci, bez jednotlivých událostí
+        session = contextlib.nullcontext()
+        profiling.enable()
+    with session:
+        generator.process_folder(args.folder, args.languages, args.model, args.backend, args.decoder, inference, args.batch_size)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
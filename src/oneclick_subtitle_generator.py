@@ -7,15 +7,20 @@ Automaticky zpracuje všechny audio soubory ve složce a vytvoří titulky v 8 j
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import os
-import subprocess
 import threading
 import glob
 from pathlib import Path
-import tempfile
 import csv
 from datetime import timedelta
 import sys
 
+try:
+    from utils import transcribe_file_ms, inference_options, stop_transcription_workers, load_profiling
+except ImportError:  # importováno jako balíček src
+    from .utils import transcribe_file_ms, inference_options, stop_transcription_workers, load_profiling
+
+profiling = load_profiling()
+
 class SubtitleGenerator:
     def __init__(self):
         self.root = tk.Tk()
@@ -71,6 +76,20 @@ class SubtitleGenerator:
                                    values=["mlx-whisper", "faster-whisper", "whisper_timestamped"])
         backend_combo.grid(row=1, column=1, sticky=(tk.W, tk.E), padx=(10, 0))
         
+        # Dekodér audia
+        ttk.Label(settings_frame, text="Dekodér audia:").grid(row=2, column=0, sticky=tk.W)
+        self.decoder_var = tk.StringVar(value="librosa")
+        decoder_combo = ttk.Combobox(settings_frame, textvariable=self.decoder_var,
+                                   values=["librosa", "ffmpeg"])
+        decoder_combo.grid(row=2, column=1, sticky=(tk.W, tk.E), padx=(10, 0))
+        
+        # Typ výpočtu faster-whisper, "auto" = float16 na GPU, int8 na CPU
+        ttk.Label(settings_frame, text="Typ výpočtu:").grid(row=3, column=0, sticky=tk.W)
+        self.compute_type_var = tk.StringVar(value=inference_options()['compute_type'])
+        compute_type_combo = ttk.Combobox(settings_frame, textvariable=self.compute_type_var,
+                                        values=["auto", "int8", "int8_float32", "float32", "float16"])
+        compute_type_combo.grid(row=3, column=1, sticky=(tk.W, tk.E), padx=(10, 0))
+        
         # Výběr jazyků
         languages_frame = ttk.LabelFrame(main_frame, text="Jazyky titulků", padding="10")
         languages_frame.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(0, 10))
@@ -172,6 +191,8 @@ class SubtitleGenerator:
         self.log("⏹️ Zpracování zastaveno uživatelem")
     
     def process_files(self, folder, selected_languages):
+        # součty časů fází pro souhrn na konci
+        tracer = profiling.enable()
         try:
             # Najdeme všechny audio soubory
             audio_files = []
@@ -199,7 +220,8 @@ class SubtitleGenerator:
                 
                 # Nejprv vytvoříme českou transkripci
                 self.log("🎙️ Vytvářím českou transkripci...")
-                czech_transcript = self.transcribe_audio(audio_file)
+                with profiling.span("transcribe_file"):
+                    czech_transcript = self.transcribe_audio(audio_file)
                 
                 if not czech_transcript:
                     self.log(f"❌ Chyba při transkripci souboru {os.path.basename(audio_file)}")
@@ -222,20 +244,29 @@ class SubtitleGenerator:
                         translated_text = czech_transcript
                     else:
                         # Pro ostatní jazyky přeložíme
-                        translated_text = self.translate_text(czech_transcript, lang_code)
+                        with profiling.span("translate"):
+                            translated_text = self.translate_text(czech_transcript, lang_code)
                     
                     if translated_text:
                         output_file = os.path.join(folder, f"{file_name}_{lang_code}.srt")
-                        self.create_srt_file(translated_text, output_file)
+                        with profiling.span("write_srt"):
+                            self.create_srt_file(translated_text, output_file)
                         self.log(f"✅ Vytvořen: {os.path.basename(output_file)}")
                     else:
                         self.log(f"❌ Chyba při překladu do jazyka {lang_code}")
             
             self.log(f"\n🎉 Zpracování dokončeno! Zpracováno {completed_tasks}/{total_tasks} úkolů")
+            if tracer.stages:
+                self.log("⏱️ Časy fází:")
+                for line in tracer.format_summary():
+                    self.log(f"   {line}")
             
         except Exception as e:
             self.log(f"❌ Kritická chyba: {str(e)}")
         finally:
+            profiling.disable()
+            # pracovní procesy drží každý svou kopii modelu, nenechávají se běžet mezi spuštěními
+            stop_transcription_workers()
             self.processing = False
             self.start_button.config(state="normal")
             self.stop_button.config(state="disabled")
@@ -244,53 +275,21 @@ class SubtitleGenerator:
     def transcribe_audio(self, audio_file):
         """Transkribuje audio soubor do češtiny"""
         try:
-            # Vytvoříme dočasný soubor pro výstup
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False) as temp_file:
-                temp_output = temp_file.name
-            
-            # Spustíme whisper_online.py
-            cmd = [
-                "python3", "whisper_online.py",
+            # Offline transkripce v tomto procesu: soubor se rozdělí podle řeči a každé okno se přepíše jednou,
+            # model zůstává načtený pro další soubory
+            return transcribe_file_ms(
                 audio_file,
-                "--language", "cs",
-                "--model", self.model_var.get(),
-                "--backend", self.backend_var.get(),
-                "--min-chunk-size", "1",
-                "--vac"
-            ]
-            
-            with open(temp_output, 'w', encoding='utf-8') as output_file:
-                process = subprocess.run(cmd, stdout=output_file, stderr=subprocess.PIPE, 
-                                       text=True, timeout=3600)  # 1 hodina timeout
-            
-            if process.returncode != 0:
-                self.log(f"❌ Whisper chyba: {process.stderr}")
-                return None
+                lan="cs",
+                model=self.model_var.get(),
+                backend=self.backend_var.get(),
+                min_chunk_size=1,
+                vac=True,
+                offline=True,
+                decoder=self.decoder_var.get(),
+                compute_type=self.compute_type_var.get()
+            )
             
-            # Načteme a zparsujeme výstup
-            transcript_data = []
-            with open(temp_output, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    
-                    parts = line.split(' ', 3)
-                    if len(parts) >= 4:
-                        try:
-                            start_ms = int(parts[1])
-                            end_ms = int(parts[2])
-                            text = parts[3]
-                            transcript_data.append((start_ms, end_ms, text))
-                        except ValueError:
-                            continue
-            
-            # Vyčistíme dočasný soubor
-            os.unlink(temp_output)
-            
-            return transcript_data
-            
-        except subprocess.TimeoutExpired:
+        except TimeoutError:
             self.log(f"❌ Timeout při zpracování {os.path.basename(audio_file)}")
             return None
         except Exception as e:
@@ -339,7 +338,14 @@ class SubtitleGenerator:
         ms = td.microseconds // 1000
         return f"{hours:02d}:{minutes:02d}:{seconds:02d},{ms:03d}"
     
+    def on_close(self):
+        """Zavření okna: zastaví zpracování a ukončí pracovní procesy transkripce bez čekání"""
+        self.processing = False
+        stop_transcription_workers(kill=True)
+        self.root.destroy()
+    
     def run(self):
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         self.root.mainloop()
 
 def main():
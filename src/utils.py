@@ -4,8 +4,9 @@ OneClick Subtitle Generator - Utility Functions
 """
 
 import os
+import sys
 import platform
-import subprocess
+import shutil
 import tempfile
 from datetime import timedelta
 from pathlib import Path
@@ -155,6 +156,18 @@ def validate_audio_file(file_path):
 
 def get_audio_duration(file_path):
     """Získá délku audio souboru"""
+    # Formátům, které umí soundfile, stačí přečíst hlavičku
+    try:
+        import soundfile
+        return soundfile.info(str(file_path)).duration
+    except Exception:
+        pass
+
+    # ffprobe také nedekóduje celý soubor (M4A, AAC, WMA...)
+    duration = load_ffmpeg_decoder().probe_duration(file_path)
+    if duration is not None:
+        return duration
+
     try:
         import librosa
         duration = librosa.get_duration(filename=str(file_path))
@@ -180,6 +193,10 @@ def check_dependencies():
     
     return dependencies
 
+def check_ffmpeg():
+    """Zkontroluje dostupnost ffmpeg (pro dekodér --decoder ffmpeg)"""
+    return shutil.which("ffmpeg") is not None
+
 def check_whisper_backend(backend_name):
     """Zkontroluje dostupnost Whisper backendu"""
     try:
@@ -193,6 +210,97 @@ def check_whisper_backend(backend_name):
     except ImportError:
         return False
 
+def load_whisper_online():
+    """Naimportuje whisper_online.py z kořenového adresáře projektu"""
+    root = str(Path(__file__).resolve().parent.parent)
+    if root not in sys.path:
+        sys.path.insert(0, root)
+    import whisper_online
+    return whisper_online
+
+def stop_transcription_workers(kill=False):
+    """Ukončí pracovní procesy offline transkripce (whisper_online.shutdown_parallel_pool), pokud běží.
+    Každý drží vlastní kopii modelu, proto se ukončují po zpracování složky, ne až s celým programem.
+    kill: nečekat, až dopřepisují rozpracované části (např. při zavření okna)
+    """
+    whisper_online = sys.modules.get("whisper_online")
+    if whisper_online is not None:
+        whisper_online.shutdown_parallel_pool(kill=kill)
+
+def load_ffmpeg_decoder():
+    """Naimportuje ffmpeg_decoder.py z kořenového adresáře projektu (ffprobe/ffmpeg bez Whisper backendu)"""
+    root = str(Path(__file__).resolve().parent.parent)
+    if root not in sys.path:
+        sys.path.insert(0, root)
+    import ffmpeg_decoder
+    return ffmpeg_decoder
+
+def load_profiling():
+    """Naimportuje profiling.py z kořenového adresáře projektu, časy fází transkripce a překladu"""
+    root = str(Path(__file__).resolve().parent.parent)
+    if root not in sys.path:
+        sys.path.insert(0, root)
+    import profiling
+    return profiling
+
+def inference_options():
+    """Zařízení, typ výpočtu a počet vláken faster-whisper pro tuto platformu (config.get_inference_settings),
+    jako volby pro transcribe_file_ms"""
+    try:
+        from config import get_inference_settings
+    except ImportError:  # importováno jako balíček src
+        from .config import get_inference_settings
+    return get_inference_settings()
+
+def processing_workers():
+    """Počet pracovních procesů offline transkripce (config.PROCESSING_SETTINGS['max_workers'])"""
+    try:
+        from config import PROCESSING_SETTINGS
+    except ImportError:  # importováno jako balíček src
+        from .config import PROCESSING_SETTINGS
+    return PROCESSING_SETTINGS['max_workers']
+
+def processing_timeout():
+    """Časový limit transkripce jednoho souboru v sekundách (config.PROCESSING_SETTINGS['timeout_seconds'])"""
+    try:
+        from config import PROCESSING_SETTINGS
+    except ImportError:  # importováno jako balíček src
+        from .config import PROCESSING_SETTINGS
+    return PROCESSING_SETTINGS['timeout_seconds']
+
+def transcribe_file_ms(audio_file, **options):
+    """Transkribuje audio soubor v tomto procesu (whisper_online.transcribe_file).
+    Načtený model zůstává v paměti pro další soubory a jazyky.
+    options: volby whisper_online.py, např. lan="cs", model="large-v3", backend="mlx-whisper", vac=True.
+    Pro faster-whisper se nezadané device, compute_type, cpu_threads a num_workers berou z konfigurace platformy.
+    Nezadaný timeout (v sekundách, None = bez limitu) se bere z config.py, po jeho uplynutí se vyvolá TimeoutError.
+    Vrací [(start_ms, end_ms, text), ...]
+    """
+    whisper_online = load_whisper_online()
+    options.setdefault("timeout", processing_timeout())
+    if options.get("backend", "faster-whisper") == "faster-whisper":
+        options = {**inference_options(), **options}
+        # na CPU se dlouhý soubor rozdělí v pauzách a přepisuje v PROCESSING_SETTINGS['max_workers'] procesech,
+        # ty zůstávají pro další soubory, dokud je neukončí stop_transcription_workers
+        device, _ = whisper_online.resolve_device(options["device"], options["compute_type"])
+        if options.get("offline") and device == "cpu":
+            options.setdefault("workers", processing_workers())
+    return [(int(round(beg*1000)), int(round(end*1000)), text.strip())
+            for beg, end, text in whisper_online.transcribe_file(audio_file, **options)]
+
+def transcribe_files_ms(audio_files, batch_size=16, **options):
+    """Transkribuje více souborů najednou (whisper_online.transcribe_files), pro archivy krátkých nahrávek.
+    Okna řeči z více souborů se přepisují v dávkách po batch_size, pokud to backend umí (faster-whisper 1.1+).
+    options: jako u transcribe_file_ms, timeout platí pro každý soubor (v dávce do dokončení dalšího souboru)
+    Vrací postupně (audio_file, [(start_ms, end_ms, text), ...]) pro každý hotový soubor
+    """
+    whisper_online = load_whisper_online()
+    options.setdefault("timeout", processing_timeout())
+    if options.get("backend", "faster-whisper") == "faster-whisper":
+        options = {**inference_options(), **options}
+    for audio_file, lines in whisper_online.transcribe_files(audio_files, batch_size=batch_size, **options):
+        yield audio_file, [(int(round(beg*1000)), int(round(end*1000)), text.strip()) for beg, end, text in lines]
+
 def create_srt_content(transcript_data):
     """Vytvoří obsah SRT souboru z transkripčních dat"""
     srt_content = []
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+"""Latency and throughput metrics of the streaming pipeline.
+
+OnlineASRProcessor, VACOnlineASRProcessor and the server record into a
+StreamMetrics object, if they have one (--metrics-json, --metrics-prom):
+
+  - transcribe_seconds: wall time of one transcribe call,
+  - buffer_seconds: the length of the transcribed audio buffer,
+  - rtf: transcribe time per second of the new audio of the iteration, over 1
+    the processing can't keep up with real time,
+  - commit_delay_seconds: from the end of a word in the audio to the end of the
+    audio buffer when it was committed, the histogram of the commit policy (see
+    commit_policy.py), so the end-of-run log and the export are the same numbers,
+  - queue_seconds: the audio the server received at once, it queued while the
+    previous iteration was running,
+
+as histograms, and the iterations, the skipped ones, the ones where only VAD
+ran, the early stops of --lazy-segments and the committed words as counters.
+
+MetricsExporter appends a JSON line with a summary every --metrics-interval
+seconds, and it rewrites a file in the Prometheus text format, e.g. for the
+textfile collector of node_exporter, so that latency regressions can be
+alerted on.
+"""
+
+import os
+import json
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "oneclick_stream"
+
+# name: (help, bucket upper bounds)
+HISTOGRAMS = {
+    "transcribe_seconds": ("Wall time of one transcribe call.", [0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30]),
+    "buffer_seconds": ("Length of the transcribed audio buffer.", [1, 2, 5, 10, 15, 20, 30, 60]),
+    "rtf": ("Transcribe time per second of new audio.", [0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 5]),
+    "commit_delay_seconds": ("Audio time from the end of a word to the end of the buffer when it was committed.",
+                             [0.25, 0.5, 0.75, 1, 1.25, 1.5, 1.75, 2, 2.5, 3, 4, 5, 7.5, 10, 15, 20]),
+    "queue_seconds": ("Audio received by the server at once.", [0.5, 1, 2, 5, 10, 30]),
+}
+
+COUNTERS = {
+    "iterations": "process_iter calls.",
+    "skipped_iterations": "process_iter calls without transcribe.",
+    "vad_only_iterations": "VAC iterations without process_iter.",
+    "early_stops": "Transcribe calls stopped when the commit was decided.",
+    "committed_words": "Committed words.",
+}
+
+
+class Histogram:
+    """Cumulative counts of the observed values by bucket upper bounds, like a Prometheus histogram."""
+
+    def __init__(self, buckets):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def percentile(self, p):
+        """The upper bound of the bucket of the p-th percentile (0..100), the maximum in the last bucket, None if empty."""
+        if not self.count:
+            return None
+        rank = p / 100 * self.count
+        seen = 0
+        for bound, c in zip(self.buckets, self.counts):
+            seen += c
+            if seen >= rank and c:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max if self.count else None,
+        }
+
+
+class StreamMetrics:
+
+    def __init__(self):
+        self.histograms = {name: Histogram(buckets) for name, (_, buckets) in HISTOGRAMS.items()}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.gauges = {}
+        self.started = time.time()
+
+    def observe(self, name, value):
+        self.histograms[name].observe(value)
+
+    def inc(self, name, n=1):
+        self.counters[name] += n
+
+    def set_gauge(self, name, value):
+        self.gauges[name] = value
+
+    def snapshot(self):
+        """A summary that is one JSON line: the counters, the gauges and the percentiles of the histograms."""
+        return {
+            "time": time.time(),
+            "uptime": time.time() - self.started,
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges),
+            "histograms": {name: h.summary() for name, h in self.histograms.items()},
+        }
+
+    def prometheus_text(self, prefix=PREFIX):
+        lines = []
+        for name, h in self.histograms.items():
+            metric = f"{prefix}_{name}"
+            lines.append(f"# HELP {metric} {HISTOGRAMS[name][0]}")
+            lines.append(f"# TYPE {metric} histogram")
+            seen = 0
+            for bound, c in zip(h.buckets + ["+Inf"], h.counts):
+                seen += c
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {seen}')
+            lines.append(f"{metric}_sum {h.sum}")
+            lines.append(f"{metric}_count {h.count}")
+        for name, value in self.counters.items():
+            metric = f"{prefix}_{name}_total"
+            lines.append(f"# HELP {metric} {COUNTERS[name]}")
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        for name, value in sorted(self.gauges.items()):
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """Writes the metrics to a JSON lines file and/or a Prometheus text file, at most every interval seconds.
+    gauges: name -> function, evaluated at every export, e.g. the hit rate of the transcribe cache.
+    """
+
+    def __init__(self, metrics, json_path=None, prometheus_path=None, interval=10.0, gauges=None):
+        self.metrics = metrics
+        self.json_path = json_path
+        self.prometheus_path = prometheus_path
+        self.interval = interval
+        self.gauges = gauges or {}
+        self.last = time.monotonic()
+
+    def maybe_export(self):
+        if time.monotonic() - self.last >= self.interval:
+            self.export()
+
+    def export(self):
+        self.last = time.monotonic()
+        for name, fn in self.gauges.items():
+            self.metrics.set_gauge(name, fn())
+        if self.json_path:
+            with open(self.json_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(self.metrics.snapshot()) + "\n")
+        if self.prometheus_path:
+            # renamed, so that a scraper never reads a half-written file
+            tmp = f"{self.prometheus_path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(self.metrics.prometheus_text())
+            os.replace(tmp, self.prometheus_path)
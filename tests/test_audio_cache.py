@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Tests for the decoded audio caches
+"""
+
+import unittest
+import tempfile
+import os
+import sys
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+# Add project root to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from audio_cache import AudioCache
+from pcm_cache import PCMCache, file_hash
+
+try:
+    import whisper_online
+    WHISPER_ONLINE_AVAILABLE = True
+except ImportError:
+    WHISPER_ONLINE_AVAILABLE = False
+
+class TestAudioCache(unittest.TestCase):
+    """Test the in-memory LRU audio cache"""
+
+    def loader(self, fname):
+        self.loaded.append(fname)
+        return np.zeros(1000, dtype=np.float32)  # 4000 bytes
+
+    def setUp(self):
+        self.loaded = []
+
+    def test_hits_and_misses(self):
+        """Test that a cached file is decoded only once"""
+        cache = AudioCache(max_bytes=10**6)
+        cache.get("a.wav", self.loader)
+        cache.get("a.wav", self.loader)
+        self.assertEqual(self.loaded, ["a.wav"])
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["bytes"], 4000)
+
+    def test_lru_eviction(self):
+        """Test that the least recently used file is evicted over the budget"""
+        cache = AudioCache(max_bytes=8000)
+        cache.get("a.wav", self.loader)
+        cache.get("b.wav", self.loader)
+        cache.get("a.wav", self.loader)  # b is now the least recently used
+        cache.get("c.wav", self.loader)
+        self.assertIn("a.wav", cache)
+        self.assertNotIn("b.wav", cache)
+        self.assertIn("c.wav", cache)
+        self.assertEqual(cache.evictions, 1)
+        self.assertLessEqual(cache.current_bytes, 8000)
+
+    def test_oversized_entry_not_cached(self):
+        """Test that a file bigger than the budget is returned but not kept"""
+        cache = AudioCache(max_bytes=1000)
+        audio = cache.get("a.wav", self.loader)
+        self.assertEqual(len(audio), 1000)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.current_bytes, 0)
+
+    def test_invalidate(self):
+        """Test explicit invalidation"""
+        cache = AudioCache(max_bytes=10**6)
+        cache.get("a.wav", self.loader)
+        self.assertTrue(cache.invalidate("a.wav"))
+        self.assertFalse(cache.invalidate("a.wav"))
+        self.assertEqual(cache.current_bytes, 0)
+        cache.get("a.wav", self.loader)
+        self.assertEqual(self.loaded, ["a.wav", "a.wav"])
+
+class TestPCMCache(unittest.TestCase):
+    """Test the persistent on-disk cache of decoded audio"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.tmp.name, "a.mp3")
+        with open(self.source, "wb") as f:
+            f.write(b"source content")
+        self.cache = PCMCache(os.path.join(self.tmp.name, "pcm"), max_bytes=10**6)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_put_get(self):
+        """Test stored audio is memory-mapped back"""
+        self.assertIsNone(self.cache.get(self.source))
+        audio = np.arange(1000, dtype=np.float32)
+        self.cache.put(self.source, audio)
+        cached = self.cache.get(self.source)
+        self.assertIsInstance(cached, np.memmap)
+        np.testing.assert_array_equal(cached, audio)
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 1)
+        self.assertEqual(self.cache.entries()[0]["source"], os.path.abspath(self.source))
+
+    def test_content_key(self):
+        """Test the key follows the content, not the file name"""
+        other = os.path.join(self.tmp.name, "b.mp3")
+        with open(other, "wb") as f:
+            f.write(b"source content")
+        self.assertEqual(file_hash(self.source), file_hash(other))
+        self.cache.put(self.source, np.zeros(10, dtype=np.float32))
+        self.assertIsNotNone(self.cache.get(other))
+        with open(other, "ab") as f:
+            f.write(b"changed")
+        self.assertIsNone(self.cache.get(other))
+
+    def test_decoder_key(self):
+        """Test the samples of another decoder or resampler quality are another entry"""
+        keys = {file_hash(self.source, d) for d in ["librosa", "ffmpeg:default", "ffmpeg:high"]}
+        self.assertEqual(len(keys), 3)
+        self.cache.put(self.source, np.zeros(10, dtype=np.float32), key=file_hash(self.source, "librosa"))
+        self.assertIsNone(self.cache.get(self.source, key=file_hash(self.source, "ffmpeg:high")))
+
+    @unittest.skipUnless(WHISPER_ONLINE_AVAILABLE, "whisper_online dependencies are not installed")
+    def test_decoder_change_decodes_again(self):
+        """Test another --decoder or --resample-quality is a miss, not the samples of the earlier settings"""
+        decoded = []
+
+        def decode(fname):
+            decoded.append((whisper_online.audio_decoder, whisper_online.resample_quality))
+            return np.full(100, len(decoded), dtype=np.float32)
+
+        with mock.patch.object(whisper_online, "_decode_whole", decode), \
+                mock.patch.object(whisper_online, "audio_decoder", "ffmpeg"), \
+                mock.patch.object(whisper_online, "resample_quality", "default"):
+            first = whisper_online.load_audio_into_pcm_cache(self.source, self.cache)
+            whisper_online.load_audio_into_pcm_cache(self.source, self.cache)
+            whisper_online.resample_quality = "high"
+            high = whisper_online.load_audio_into_pcm_cache(self.source, self.cache)
+        self.assertEqual(decoded, [("ffmpeg", "default"), ("ffmpeg", "high")])
+        self.assertEqual((first[0], high[0]), (1, 2))
+
+    def test_prune(self):
+        """Test the least recently used entries are removed over the limit"""
+        sources = []
+        for i in range(3):
+            fname = os.path.join(self.tmp.name, f"{i}.mp3")
+            with open(fname, "wb") as f:
+                f.write(str(i).encode())
+            self.cache.put(fname, np.zeros(1000, dtype=np.float32))
+            os.utime(self.cache.entries()[-1]["path"], (i, i))  # make the order explicit
+            sources.append(fname)
+        self.assertEqual(self.cache.stats()["entries"], 3)
+        removed = self.cache.prune(max_bytes=2*4200)
+        self.assertEqual(removed, 1)
+        self.assertIsNone(self.cache.get(sources[0]))
+        self.assertIsNotNone(self.cache.get(sources[2]))
+        self.cache.clear()
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_entries_in_use(self):
+        """Test an entry that Windows can't remove or replace while it is memory-mapped is skipped, not an error"""
+        audio = np.zeros(1000, dtype=np.float32)
+        self.cache.put(self.source, audio)
+        with mock.patch.object(Path, "unlink", side_effect=PermissionError):
+            self.assertEqual(self.cache.prune(max_bytes=0), 0)
+        self.assertIsNotNone(self.cache.get(self.source))
+        with mock.patch("pcm_cache.os.replace", side_effect=PermissionError):
+            cached = self.cache.put(self.source, audio)
+        np.testing.assert_array_equal(cached, audio)
+        self.assertEqual([p for p in os.listdir(self.cache.cache_dir) if p.endswith(".tmp")], [])
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
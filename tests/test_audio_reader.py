@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Tests for the random-access audio readers
+"""
+
+import unittest
+import tempfile
+import os
+import sys
+
+import numpy as np
+import soundfile as sf
+
+# Add project root to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from audio_reader import (
+    open_audio_reader, MemmapWavReader, SoundFileReader, BlockResampleReader, DecodedReader
+)
+
+def make_signal(seconds, sr, channels=1):
+    t = np.arange(int(seconds*sr)) / sr
+    x = 0.5*np.sin(2*np.pi*440*t) + 0.1*np.sin(2*np.pi*97*t)
+    if channels > 1:
+        x = np.stack([x]*channels, axis=1)
+    return x.astype(np.float32)
+
+class TestAudioReader(unittest.TestCase):
+    """Test that readers return the same windows as a whole decode"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def test_memmap_wav(self):
+        """Test 16 kHz mono PCM_16 WAV is memory-mapped"""
+        fname = self.path("a.wav")
+        sf.write(fname, make_signal(3, 16000), 16000, subtype="PCM_16")
+        whole, _ = sf.read(fname, dtype="float32")
+        with open_audio_reader(fname) as r:
+            self.assertIsInstance(r, MemmapWavReader)
+            self.assertEqual(r.frames, len(whole))
+            np.testing.assert_array_equal(r.read(1.0, 2.5), whole[16000:40000])
+            np.testing.assert_array_equal(r.read(2.9, 10), whole[46400:])
+            self.assertEqual(len(r.read(5, 6)), 0)
+
+    def test_float_wav(self):
+        """Test 16 kHz mono float WAV"""
+        fname = self.path("f.wav")
+        sf.write(fname, make_signal(2, 16000), 16000, subtype="FLOAT")
+        whole, _ = sf.read(fname, dtype="float32")
+        with open_audio_reader(fname) as r:
+            self.assertIsInstance(r, MemmapWavReader)
+            np.testing.assert_array_equal(r.read(0.5, 1.0), whole[8000:16000])
+
+    def test_flac_seek(self):
+        """Test 16 kHz mono FLAC is read by seeking"""
+        fname = self.path("a.flac")
+        sf.write(fname, make_signal(3, 16000), 16000)
+        whole, _ = sf.read(fname, dtype="float32")
+        with open_audio_reader(fname) as r:
+            self.assertIsInstance(r, SoundFileReader)
+            np.testing.assert_array_equal(r.read(1.0, 2.0), whole[16000:32000])
+
+    def test_block_resample(self):
+        """Test resampled windows match the whole-file resampling"""
+        import librosa
+        fname = self.path("b.wav")
+        sf.write(fname, make_signal(25, 44100, channels=2), 44100, subtype="PCM_16")
+        whole, _ = librosa.load(fname, sr=16000, dtype=np.float32)
+        with open_audio_reader(fname) as r:
+            self.assertIsInstance(r, BlockResampleReader)
+            self.assertEqual(r.frames, len(whole))
+            for beg, end in [(0, 1), (9.5, 10.5), (19, 25)]:
+                chunk = r.read(beg, end)
+                expected = whole[int(beg*16000):int(end*16000)]
+                self.assertEqual(len(chunk), len(expected))
+                np.testing.assert_allclose(chunk, expected, atol=1e-3)
+            # consecutive windows inside one block decode it only once
+            decoded = r.decoded_blocks
+            r.read(19.5, 20)
+            self.assertEqual(r.decoded_blocks, decoded)
+
+    def test_decoded_fallback(self):
+        """Test fallback to the whole decode for files soundfile can't open"""
+        fname = self.path("c.m4a")
+        with open(fname, "wb") as f:
+            f.write(b"not really audio")
+        audio = make_signal(2, 16000)
+        loads = []
+        r = open_audio_reader(fname, loader=lambda f: loads.append(f) or audio)
+        self.assertIsInstance(r, DecodedReader)
+        np.testing.assert_array_equal(r.read(0.5, 1), audio[8000:16000])
+        np.testing.assert_array_equal(r.read(1, 1.5), audio[16000:24000])
+        # decoded once, even if the loader doesn't cache it
+        self.assertEqual(loads, [fname])
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
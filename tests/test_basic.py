@@ -8,6 +8,7 @@ import tempfile
 import os
 from pathlib import Path
 import sys
+from unittest import mock
 
 # Add src to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
@@ -15,9 +16,10 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 try:
     from utils import (
         ms_to_srt_time, detect_audio_files, format_duration,
-        clean_filename, validate_audio_file, create_srt_content
+        clean_filename, validate_audio_file, create_srt_content,
+        stop_transcription_workers, get_audio_duration, load_ffmpeg_decoder
     )
-    from config import LANGUAGES, AUDIO_EXTENSIONS, validate_config
+    from config import LANGUAGES, AUDIO_EXTENSIONS, PLATFORM_SETTINGS, validate_config, get_inference_settings
 except ImportError as e:
     print(f"Import error: {e}")
     print("Make sure you're running tests from the project root directory")
@@ -77,6 +79,26 @@ class TestUtils(unittest.TestCase):
         self.assertEqual(lines[2], "Hello world")
         self.assertEqual(lines[4], "2")
 
+    def test_stop_transcription_workers(self):
+        """Test the worker pool is shut down only if whisper_online is loaded, without importing it"""
+        fake = mock.Mock()
+        with mock.patch.dict(sys.modules, {"whisper_online": fake}):
+            stop_transcription_workers(kill=True)
+        fake.shutdown_parallel_pool.assert_called_once_with(kill=True)
+        with mock.patch.dict(sys.modules):
+            sys.modules.pop("whisper_online", None)
+            stop_transcription_workers()
+            self.assertNotIn("whisper_online", sys.modules)
+
+    def test_audio_duration_from_ffprobe(self):
+        """Test a file soundfile can't read gets its duration from ffmpeg_decoder.probe_duration"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            fname = os.path.join(temp_dir, "a.m4a")
+            Path(fname).write_bytes(b"not a wav")
+            with mock.patch.object(load_ffmpeg_decoder(), "probe_duration", return_value=12.5) as probe:
+                self.assertEqual(get_audio_duration(fname), 12.5)
+            probe.assert_called_once_with(fname)
+
 class TestConfig(unittest.TestCase):
     """Test configuration"""
     
@@ -97,6 +119,17 @@ class TestConfig(unittest.TestCase):
         """Test configuration validation"""
         errors = validate_config()
         self.assertEqual(len(errors), 0, f"Configuration errors: {errors}")
+    
+    def test_inference_settings(self):
+        """Test faster-whisper settings of every platform"""
+        for settings in PLATFORM_SETTINGS.values():
+            self.assertIn(settings['device'], ['auto', 'cuda', 'cpu'])
+            self.assertIn(settings['compute_type'], ['auto', 'int8', 'int8_float32', 'float32', 'int8_float16', 'float16'])
+        os.environ['ONECLICK_COMPUTE_TYPE'] = 'float32'
+        try:
+            self.assertEqual(get_inference_settings()['compute_type'], 'float32')
+        finally:
+            del os.environ['ONECLICK_COMPUTE_TYPE']
 
 class TestInstallation(unittest.TestCase):
     """Test installation requirements"""
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Tests for the adaptive chunk size of the online processors
+"""
+
+import unittest
+import os
+import sys
+
+import numpy as np
+
+# Add project root to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from chunk_controller import ChunkSizeController
+
+try:
+    import whisper_online
+    WHISPER_ONLINE_AVAILABLE = True
+except ImportError:
+    WHISPER_ONLINE_AVAILABLE = False
+
+class TestChunkSizeController(unittest.TestCase):
+    """Test the decisions of the controller"""
+
+    def test_target_latency(self):
+        """Test the chunk is the target latency minus the transcribe time, within the bounds"""
+        c = ChunkSizeController(1.0, target_latency=2.0, smoothing=1.0)
+        self.assertAlmostEqual(c.update(0.5, 10.0), 1.5)
+        self.assertAlmostEqual(c.update(1.5, 10.0), 0.5)
+        self.assertAlmostEqual(c.update(5.0, 10.0), c.min_chunk)
+        self.assertEqual((c.increases, c.decreases), (1, 2))
+
+    def test_target_rtf(self):
+        """Test the chunk grows so that the ASR is busy at most the target share of the time"""
+        c = ChunkSizeController(1.0, target_rtf=0.5, smoothing=1.0)
+        self.assertAlmostEqual(c.update(1.0, 5.0), 2.0)
+        self.assertAlmostEqual(c.update(10.0, 5.0), c.max_chunk)
+        # small changes are ignored
+        c = ChunkSizeController(1.0, target_rtf=0.5, smoothing=1.0)
+        self.assertAlmostEqual(c.update(0.52, 5.0), 1.0)
+
+    def test_adaptive_trimming(self):
+        """Test the trimming threshold goes down when the latency can't be held and back up when it can"""
+        c = ChunkSizeController(1.0, target_latency=1.0, trimming_sec=15, smoothing=1.0)
+        for _ in range(20):
+            c.update(2.0, 20.0)
+        self.assertEqual(c.buffer_trimming_sec, c.min_trimming_sec)
+        for _ in range(20):
+            c.update(0.1, 5.0)
+        self.assertEqual(c.buffer_trimming_sec, 15)
+        self.assertGreater(c.stats()["trimming_changes"], 2)
+
+@unittest.skipUnless(WHISPER_ONLINE_AVAILABLE, "whisper_online dependencies are not installed")
+class TestControlledStreaming(unittest.TestCase):
+    """Test the controller in the online processor, with a slow replay backend"""
+
+    def test_chunk_follows_transcribe_time(self):
+        """Test a slow ASR gets longer chunks with --target-rtf and the words are still committed in order"""
+        args = whisper_online.shared_args(backend="replay", lan="en", min_chunk_size=0.5, target_rtf=0.5,
+                                          replay_latency=0.4)
+        with open(os.devnull, "w") as devnull:
+            asr, online = whisper_online.asr_factory(args, logfile=devnull)
+            words = []
+            for _, o in self.stream(online, 12):
+                words.extend(o.split())
+            words += online.finish()[2].split()
+        self.assertIsNotNone(online.controller)
+        self.assertAlmostEqual(online.chunk_size(0.5), 0.8, delta=0.1)
+        self.assertGreaterEqual(online.controller.increases, 1)
+        self.assertGreater(len(words), 10)
+        self.assertEqual(words, [f"w{k}." if k % 8 == 7 else f"w{k}" for k in range(len(words))])
+
+    def stream(self, online, seconds):
+        """Feeds silence in the chunks of the controller"""
+        fed = 0.0
+        while fed < seconds:
+            chunk = online.chunk_size(0.5)
+            online.insert_audio_chunk(np.zeros(int(16000*chunk), dtype=np.float32))
+            fed += chunk
+            o = online.process_iter()
+            if o[0] is not None:
+                yield fed, o[2]
+
+    def test_without_targets(self):
+        """Test there is no controller by default and the chunk size is --min-chunk-size"""
+        args = whisper_online.shared_args(backend="replay", lan="en")
+        with open(os.devnull, "w") as devnull:
+            asr, online = whisper_online.asr_factory(args, logfile=devnull)
+        self.assertIsNone(online.controller)
+        self.assertEqual(online.chunk_size(1.0), 1.0)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
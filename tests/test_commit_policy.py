@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Tests for the commit policies of HypothesisBuffer
+"""
+
+import unittest
+import os
+import sys
+from unittest import mock
+
+import numpy as np
+
+# Add project root to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from commit_policy import LocalAgreement, ForcedCommit, ConfidenceCommit, create_commit_policy
+
+try:
+    import whisper_online
+    from whisper_online import HypothesisBuffer
+    WHISPER_ONLINE_AVAILABLE = True
+except ImportError:
+    WHISPER_ONLINE_AVAILABLE = False
+
+def words(text, beg=0.0):
+    return [(beg+i, beg+i+0.5, w) for i, w in enumerate(text.split())]
+
+class TestDelayStats(unittest.TestCase):
+    """Test the histogram of the commit delays"""
+
+    def test_percentiles(self):
+        """Test the percentiles are the upper bucket bounds and long delays go to the last bucket"""
+        policy = LocalAgreement(2)
+        hb = mock.Mock(new=[(0, e, "w") for e in [30.0, 29.0, 28.8, 29.3, 0.0]])
+        policy.record(hb, 5, now=30.0)
+        st = policy.stats()
+        self.assertEqual(st["words"], 5)
+        self.assertEqual(st["p50"], 1.0)
+        self.assertEqual(st["max"], 30.0)
+        self.assertAlmostEqual(st["mean"], (0 + 1.0 + 1.2 + 0.7 + 30.0) / 5)
+        self.assertEqual(policy.delays.counts[-1], 1)
+        self.assertIsNone(LocalAgreement(2).stats()["p90"])
+
+@unittest.skipUnless(WHISPER_ONLINE_AVAILABLE, "whisper_online dependencies are not installed")
+class TestCommitPolicies(unittest.TestCase):
+    """Test which words the policies commit"""
+
+    def commits(self, policy, hypotheses, now=None, confidences=None):
+        """The committed text after every hypothesis. now: the end of the audio at every hypothesis, or None."""
+        hb = HypothesisBuffer(policy=policy)
+        out = []
+        for i, h in enumerate(hypotheses):
+            hb.insert(words(h), 0, None if confidences is None else confidences[i])
+            out.append(" ".join(w for _, _, w in hb.flush(None if now is None else now[i])))
+        return out
+
+    def test_local_agreement_n(self):
+        """Test n=1 commits right away, n=2 after two and n=3 after three agreeing hypotheses"""
+        hyps = ["a b", "a b c", "a b c d", "a b c d"]
+        self.assertEqual(self.commits(LocalAgreement(1), hyps), ["a b", "c", "d", ""])
+        self.assertEqual(self.commits(LocalAgreement(2), hyps), ["", "a b", "c", "d"])
+        self.assertEqual(self.commits(LocalAgreement(3), hyps), ["", "", "a b", "c"])
+
+    def test_forced_commit(self):
+        """Test the words that ended long enough before the end of the audio are committed without agreement"""
+        self.assertEqual(self.commits(ForcedCommit(2, max_delay=2.0), ["a b c d", "a b y z"], now=[4.0, 5.0]),
+                         ["a b", "y"])
+
+    def test_confidence_commit(self):
+        """Test the confident words after the agreed prefix are committed"""
+        policy = ConfidenceCommit(2, threshold=0.9)
+        out = self.commits(policy, ["a b c", "a b c d"], confidences=[[0.95, 0.5, 0.99], [0.9, 0.95, 0.2, 0.5]])
+        self.assertEqual(out, ["a", "b c"])
+        self.assertEqual(policy.stats()["confident"], 1)
+
+    def test_streaming_commits_in_order(self):
+        """Test every policy commits the synthetic words of the replay backend once and in order"""
+        for policy, n in [("agreement", 1), ("agreement", 3), ("forced", 2), ("confidence", 2)]:
+            args = whisper_online.shared_args(backend="replay", lan="en", commit_policy=policy, agreement_n=n,
+                                              max_commit_delay=1.0)
+            with open(os.devnull, "w") as devnull:
+                asr, online = whisper_online.asr_factory(args, logfile=devnull)
+                out = []
+                for _ in range(60):
+                    online.insert_audio_chunk(np.zeros(16000, dtype=np.float32))
+                    out.extend(online.process_iter()[2].split())
+                out.extend(online.finish()[2].split())
+            self.assertEqual(out, [f"w{k}." if k % 8 == 7 else f"w{k}" for k in range(len(out))])
+            self.assertGreater(online.commit_policy.stats()["words"], 50)
+
+    def test_agreement_one_decides_lazily(self):
+        """Test n=1 decides the commit after the first segment, so --lazy-segments stops decoding early"""
+        hb = HypothesisBuffer(policy=LocalAgreement(1))
+        self.assertFalse(hb.commit_decided())
+        hb.insert(words("a b"), 0)
+        self.assertTrue(hb.commit_decided())
+        args = whisper_online.shared_args(backend="replay", lan="en", agreement_n=1, lazy_segments=True)
+        with open(os.devnull, "w") as devnull:
+            asr, online = whisper_online.asr_factory(args, logfile=devnull)
+            out = []
+            for _ in range(30):
+                online.insert_audio_chunk(np.zeros(16000, dtype=np.float32))
+                out.extend(online.process_iter()[2].split())
+            out.extend(online.finish()[2].split())
+        self.assertGreater(online.early_stops, 0)
+        self.assertGreater(len(out), 50)
+        self.assertEqual(out, [f"w{k}." if k % 8 == 7 else f"w{k}" for k in range(len(out))])
+
+    def test_unknown_policy(self):
+        """Test an unknown policy name is an error"""
+        with self.assertRaises(ValueError):
+            create_commit_policy("eager")
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
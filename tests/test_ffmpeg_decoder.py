@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Tests for the ffmpeg decoder, with a fake ffmpeg script on PATH
+"""
+
+import unittest
+import tempfile
+import os
+import sys
+
+import numpy as np
+
+# Add project root to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import ffmpeg_decoder
+
+# writes a lot of errors to stderr before any audio, and 1 second of 0.5 samples to stdout
+FAKE_FFMPEG = """#!{python}
+import sys
+for i in range(20000):
+    sys.stderr.write("error while decoding frame %d\\n" % i)
+sys.stderr.flush()
+sys.stdout.buffer.write(b"\\x00\\x00\\x00\\x3f" * 16000)
+sys.exit({code})
+"""
+
+# 5 seconds of a ramp, sample i is i, honours -ss; every start is logged to starts.log next to it
+FAKE_SEEKING_FFMPEG = """#!{python}
+import os, sys, array
+args = sys.argv
+start = float(args[args.index("-ss")+1]) if "-ss" in args else 0
+with open(os.path.join(os.path.dirname(__file__), "starts.log"), "a") as f:
+    f.write("%f\\n" % start)
+sys.stdout.buffer.write(array.array("f", range(int(start*16000), 80000)).tobytes())
+"""
+
+FAKE_FFPROBE = """#!{python}
+print("5.000000")
+"""
+
+@unittest.skipIf(sys.platform.startswith("win"), "the fake ffmpeg is a script with a shebang")
+class TestFFmpegStderr(unittest.TestCase):
+    """Test ffmpeg's stderr is read while the audio is, and reported on a failure"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.environ["PATH"]
+        os.environ["PATH"] = self.tmp.name + os.pathsep + self.path
+
+    def tearDown(self):
+        os.environ["PATH"] = self.path
+        self.tmp.cleanup()
+
+    def fake_ffmpeg(self, code):
+        fname = os.path.join(self.tmp.name, "ffmpeg")
+        with open(fname, "w") as f:
+            f.write(FAKE_FFMPEG.format(python=sys.executable, code=code))
+        os.chmod(fname, 0o755)
+
+    def test_verbose_stderr_does_not_block(self):
+        """Test more stderr than a pipe buffer holds doesn't block the decoding"""
+        self.fake_ffmpeg(0)
+        a = ffmpeg_decoder.decode_audio("in.mp3")
+        self.assertEqual(len(a), 16000)
+        self.assertTrue(np.all(a == 0.5))
+
+    def test_error_has_last_lines(self):
+        """Test a failed ffmpeg raises with the last lines of its stderr"""
+        self.fake_ffmpeg(1)
+        with self.assertRaises(RuntimeError) as cm:
+            list(ffmpeg_decoder.stream_audio("in.mp3"))
+        message = str(cm.exception)
+        self.assertIn("error while decoding frame 19999", message)
+        self.assertNotIn("frame 0\n", message)
+
+@unittest.skipIf(sys.platform.startswith("win") or sys.byteorder != "little",
+                 "the fake ffmpeg is a script with a shebang, writing native float32")
+class TestFFmpegStreamReader(unittest.TestCase):
+    """Test FFmpegStreamReader serves windows from one ffmpeg run and seeks only when it must"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.environ["PATH"]
+        os.environ["PATH"] = self.tmp.name + os.pathsep + self.path
+        for name, script in [("ffmpeg", FAKE_SEEKING_FFMPEG), ("ffprobe", FAKE_FFPROBE)]:
+            fname = os.path.join(self.tmp.name, name)
+            with open(fname, "w") as f:
+                f.write(script.format(python=sys.executable))
+            os.chmod(fname, 0o755)
+
+    def tearDown(self):
+        os.environ["PATH"] = self.path
+        self.tmp.cleanup()
+
+    def starts(self):
+        with open(os.path.join(self.tmp.name, "starts.log")) as f:
+            return [float(line) for line in f]
+
+    def test_consecutive_windows(self):
+        """Test the growing windows of the simulation are read from one ffmpeg run"""
+        with ffmpeg_decoder.FFmpegStreamReader("in.mp3") as reader:
+            self.assertEqual(reader.frames, 80000)
+            for end in [1, 2, 3.5, 5]:
+                a = reader.read(end-1, end)
+                np.testing.assert_array_equal(a, np.arange(int((end-1)*16000), int(end*16000), dtype=np.float32))
+        self.assertEqual(self.starts(), [0])
+
+    def test_out_of_order_window(self):
+        """Test a window before the already read audio restarts ffmpeg with a seek"""
+        with ffmpeg_decoder.FFmpegStreamReader("in.mp3") as reader:
+            reader.read(0, 3)
+            a = reader.read(1, 2)
+            np.testing.assert_array_equal(a, np.arange(16000, 32000, dtype=np.float32))
+            a = reader.read(4.5, 10)
+            np.testing.assert_array_equal(a, np.arange(72000, 80000, dtype=np.float32))
+        self.assertEqual(self.starts(), [0, 1])
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Tests for the profiling spans of the ASR stages
+"""
+
+import unittest
+import tempfile
+import json
+import os
+import sys
+
+import numpy as np
+
+# Add project root to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import profiling
+from profiling import Tracer, ProfileSession
+
+try:
+    import whisper_online
+    WHISPER_ONLINE_AVAILABLE = True
+except ImportError:
+    WHISPER_ONLINE_AVAILABLE = False
+
+class TestTracer(unittest.TestCase):
+    """Test the spans, the totals of the stages and the Chrome trace"""
+
+    def tearDown(self):
+        profiling.disable()
+
+    def test_disabled_span_records_nothing(self):
+        """Test a span without an enabled tracer is the shared no-op object"""
+        self.assertFalse(profiling.enabled())
+        self.assertIs(profiling.span("a"), profiling.span("b"))
+        with profiling.span("a"):
+            pass
+        self.assertIsNone(profiling.current())
+
+    def test_totals(self):
+        """Test every span is counted in its stage, nested spans too"""
+        tracer = profiling.enable()
+        for _ in range(3):
+            with profiling.span("outer"):
+                with profiling.span("inner"):
+                    pass
+        self.assertIs(profiling.disable(), tracer)
+        summary = tracer.summary()
+        self.assertEqual(summary["outer"]["count"], 3)
+        self.assertEqual(summary["inner"]["count"], 3)
+        self.assertGreaterEqual(summary["outer"]["seconds"], summary["inner"]["seconds"])
+        self.assertEqual(list(summary), ["outer", "inner"])
+        self.assertEqual(len(tracer.format_summary()), 2)
+        self.assertIsNone(tracer.events)
+
+    def test_chrome_trace(self):
+        """Test the trace is valid JSON with complete events in microseconds"""
+        tracer = Tracer()
+        tracer.add("transcribe", tracer.origin + 0.5, 0.25, {"windows": 2})
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "t.trace.json")
+            tracer.write_chrome_trace(path)
+            with open(path) as f:
+                trace = json.load(f)
+        event, = trace["traceEvents"]
+        self.assertEqual(event["ph"], "X")
+        self.assertAlmostEqual(event["ts"], 500000)
+        self.assertAlmostEqual(event["dur"], 250000)
+        self.assertEqual(event["args"], {"windows": 2})
+
+    def test_session_writes_files(self):
+        """Test a session writes the trace and the cProfile dump and disables the tracer"""
+        with tempfile.TemporaryDirectory() as tmp:
+            out = os.path.join(tmp, "profile")
+            with ProfileSession(out, "s", cprofile=True) as session:
+                with profiling.span("work"):
+                    sum(range(1000))
+            self.assertFalse(profiling.enabled())
+            self.assertEqual(sorted(os.listdir(out)), ["s.prof", "s.trace.json"])
+            self.assertEqual(session.tracer.summary()["work"]["count"], 1)
+
+@unittest.skipUnless(WHISPER_ONLINE_AVAILABLE, "whisper_online dependencies are not installed")
+class TestStreamingStages(unittest.TestCase):
+    """Test the stages of process_iter with the replay backend"""
+
+    def tearDown(self):
+        profiling.disable()
+
+    def test_process_iter_stages(self):
+        """Test every transcribing iteration records every stage of the hot path"""
+        tracer = profiling.enable()
+        with open(os.devnull, "w") as devnull:
+            online = whisper_online.OnlineASRProcessor(whisper_online.ReplayASR("en"), logfile=devnull)
+            for _ in range(10):
+                online.insert_audio_chunk(np.zeros(16000, dtype=np.float32))
+                online.process_iter()
+        stages = tracer.summary()
+        for name in ["prompt", "transcribe", "ts_words", "insert", "flush", "to_flush", "chunking"]:
+            self.assertEqual(stages[name]["count"], 10, name)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Tests for the rule-based sentence splitter and the tokenizer registry
+"""
+
+import unittest
+import os
+import sys
+
+# Add project root to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sentence_splitter import RuleSentenceSplitter
+
+try:
+    import whisper_online
+    WHISPER_ONLINE_AVAILABLE = True
+except ImportError:
+    WHISPER_ONLINE_AVAILABLE = False
+
+class TestRuleSentenceSplitter(unittest.TestCase):
+    """Test the sentence splitting rules"""
+
+    def test_languages(self):
+        """Test a short text of every supported language"""
+        cases = {
+            "cs": ("Dobrý den. Přijďte např. zítra. Stalo se to 3. května. Opravdu? Ano.",
+                   ["Dobrý den.", "Přijďte např. zítra.", "Stalo se to 3. května.", "Opravdu?", "Ano."]),
+            "en": ("Hello Mr. Smith. How are you? J. Doe is fine!",
+                   ["Hello Mr. Smith.", "How are you?", "J. Doe is fine!"]),
+            "es": ("¿Cómo estás? ¡Muy bien! El Sr. García llegó.",
+                   ["¿Cómo estás?", "¡Muy bien!", "El Sr. García llegó."]),
+            "de": ("Das ist gut, z.B. heute. Am 3. Mai kommt er. Ja.",
+                   ["Das ist gut, z.B. heute.", "Am 3. Mai kommt er.", "Ja."]),
+            "fr": ("Bonjour M. Dupont. Ça va? Oui.", ["Bonjour M. Dupont.", "Ça va?", "Oui."]),
+            "ru": ("Привет. Это т.е. пример. Как дела?", ["Привет.", "Это т.е. пример.", "Как дела?"]),
+            "id": ("Halo. Bpk. Budi datang. Terima kasih!", ["Halo.", "Bpk. Budi datang.", "Terima kasih!"]),
+            "zh": ("你好。今天天气很好！ 我们去公园吧？好", ["你好。", "今天天气很好！", "我们去公园吧？", "好"]),
+        }
+        for lan, (text, expected) in cases.items():
+            with self.subTest(lan=lan):
+                self.assertEqual(RuleSentenceSplitter(lan).split(text), expected)
+
+    def test_no_split_before_lowercase(self):
+        """Test a dot followed by a lowercase word doesn't end the sentence"""
+        splitter = RuleSentenceSplitter("en")
+        self.assertEqual(splitter.split("It costs 5 dollars vs. ten. Fine"), ["It costs 5 dollars vs. ten.", "Fine"])
+        self.assertEqual(splitter.split("Wait... what? OK."), ["Wait... what?", "OK."])
+
+    def test_keeps_all_words(self):
+        """Test the sentences joined with spaces give back the text"""
+        text = "A b. C d e? \"F g.\" (H i.) J...  K"
+        self.assertEqual(" ".join(RuleSentenceSplitter("en").split(text)), " ".join(text.split()))
+
+    def test_unknown_language(self):
+        """Test languages without rules are rejected"""
+        with self.assertRaises(ValueError):
+            RuleSentenceSplitter("uk")
+
+@unittest.skipUnless(WHISPER_ONLINE_AVAILABLE, "whisper_online dependencies are not installed")
+class TestTokenizerRegistry(unittest.TestCase):
+    """Test create_tokenizer builds every splitter once"""
+
+    def test_cached(self):
+        """Test the same tokenizer is returned for the same language and splitter"""
+        a = whisper_online.create_tokenizer("cs")
+        self.assertIsInstance(a, RuleSentenceSplitter)
+        self.assertIs(a, whisper_online.create_tokenizer("cs"))
+        self.assertIs(a, whisper_online.create_tokenizer("cs", "auto"))
+        self.assertIsNot(a, whisper_online.create_tokenizer("en"))
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Tests for the metrics of the streaming pipeline
+"""
+
+import unittest
+import tempfile
+import json
+import os
+import sys
+
+import numpy as np
+
+# Add project root to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from stream_metrics import Histogram, StreamMetrics, MetricsExporter
+
+try:
+    import whisper_online
+    WHISPER_ONLINE_AVAILABLE = True
+except ImportError:
+    WHISPER_ONLINE_AVAILABLE = False
+
+class TestStreamMetrics(unittest.TestCase):
+    """Test the histograms and the export formats"""
+
+    def test_histogram(self):
+        """Test the values go to the buckets by their upper bounds and the percentiles"""
+        h = Histogram([1, 2, 5])
+        for v in [0.5, 1.0, 1.5, 3, 100]:
+            h.observe(v)
+        self.assertEqual(h.counts, [2, 1, 1, 1])
+        self.assertEqual(h.percentile(50), 2)
+        self.assertEqual(h.percentile(99), 100)
+        self.assertEqual(h.summary()["count"], 5)
+        self.assertIsNone(Histogram([1]).percentile(50))
+
+    def test_prometheus_text(self):
+        """Test the buckets are cumulative and every sample line is a metric name and a number"""
+        m = StreamMetrics()
+        m.observe("transcribe_seconds", 0.3)
+        m.observe("transcribe_seconds", 3)
+        m.inc("iterations", 2)
+        m.set_gauge("chunk_size_seconds", 1.5)
+        text = m.prometheus_text()
+        self.assertIn('oneclick_stream_transcribe_seconds_bucket{le="0.5"} 1', text)
+        self.assertIn('oneclick_stream_transcribe_seconds_bucket{le="+Inf"} 2', text)
+        self.assertIn("oneclick_stream_iterations_total 2", text)
+        self.assertIn("oneclick_stream_chunk_size_seconds 1.5", text)
+        for line in text.splitlines():
+            if not line.startswith("#"):
+                self.assertRegex(line, r'^[a-z_]+(\{le="[^"]+"\})? [0-9.e+-]+$')
+
+    def test_exporter(self):
+        """Test the exporter appends JSON lines and rewrites the Prometheus file"""
+        with tempfile.TemporaryDirectory() as tmp:
+            m = StreamMetrics()
+            exporter = MetricsExporter(m, os.path.join(tmp, "m.jsonl"), os.path.join(tmp, "m.prom"),
+                                       interval=3600, gauges={"transcribe_cache_hit_rate": lambda: 0.25})
+            exporter.maybe_export()
+            self.assertFalse(os.path.exists(os.path.join(tmp, "m.jsonl")))
+            for _ in range(2):
+                m.inc("iterations")
+                exporter.export()
+            with open(os.path.join(tmp, "m.jsonl")) as f:
+                lines = [json.loads(l) for l in f]
+            self.assertEqual([l["counters"]["iterations"] for l in lines], [1, 2])
+            self.assertEqual(lines[-1]["gauges"]["transcribe_cache_hit_rate"], 0.25)
+            with open(os.path.join(tmp, "m.prom")) as f:
+                self.assertIn("oneclick_stream_iterations_total 2", f.read())
+            self.assertEqual(sorted(os.listdir(tmp)), ["m.jsonl", "m.prom"])
+
+@unittest.skipUnless(WHISPER_ONLINE_AVAILABLE, "whisper_online dependencies are not installed")
+class TestProcessorMetrics(unittest.TestCase):
+    """Test the online processor records its iterations"""
+
+    def test_records_iterations(self):
+        """Test the timing, the buffer length and the commit delay of every word are recorded"""
+        with tempfile.TemporaryDirectory() as tmp:
+            args = whisper_online.shared_args(backend="replay", lan="en", metrics_json=os.path.join(tmp, "m.jsonl"))
+            with open(os.devnull, "w") as devnull:
+                asr, online = whisper_online.asr_factory(args, logfile=devnull)
+                for _ in range(30):
+                    online.insert_audio_chunk(np.zeros(16000, dtype=np.float32))
+                    online.process_iter()
+                online.process_iter()  # no new audio, transcribed again without --skip-silence
+            exporter = whisper_online.create_metrics_exporter(asr, online, args)
+            exporter.export()
+        m = online.metrics
+        self.assertEqual(m.counters["iterations"], 31)
+        self.assertEqual(m.counters["skipped_iterations"], 0)
+        self.assertEqual(m.histograms["transcribe_seconds"].count, 31)
+        self.assertEqual(m.histograms["commit_delay_seconds"].count, m.counters["committed_words"])
+        self.assertGreater(m.counters["committed_words"], 40)
+        self.assertLessEqual(m.histograms["buffer_seconds"].max, 16)
+
+    def test_disabled_by_default(self):
+        """Test there are no metrics without --metrics-json and --metrics-prom"""
+        args = whisper_online.shared_args(backend="replay", lan="en")
+        with open(os.devnull, "w") as devnull:
+            asr, online = whisper_online.asr_factory(args, logfile=devnull)
+        self.assertIsNone(online.metrics)
+        self.assertIsNone(whisper_online.create_metrics_exporter(asr, online, args))
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+"""
+Tests for the streaming pipeline building blocks
+"""
+
+import unittest
+import tempfile
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+# Add project root to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from audio_buffer import AudioBuffer
+from transcript_store import CommittedStore, TranscriptLog, read_transcript
+from sentence_segmenter import IncrementalSentenceSegmenter, map_words_to_sentences
+
+try:
+    import whisper_online
+    from whisper_online import HypothesisBuffer
+    WHISPER_ONLINE_AVAILABLE = True
+except ImportError:
+    WHISPER_ONLINE_AVAILABLE = False
+
+try:
+    import torch
+    from silero_vad_iterator import VADIterator, FixedVADIterator
+    TORCH_AVAILABLE = True
+except ImportError:
+    TORCH_AVAILABLE = False
+
+class TestAudioBuffer(unittest.TestCase):
+    """Test the growable audio buffer against np.append/slicing"""
+
+    def test_append_trim_matches_numpy(self):
+        """Test random appends and trims give the same samples as np.append"""
+        rng = np.random.default_rng(0)
+        buf = AudioBuffer(capacity=100)
+        ref = np.array([], dtype=np.float32)
+        for _ in range(500):
+            chunk = rng.standard_normal(rng.integers(0, 80)).astype(np.float32)
+            buf.append(chunk)
+            ref = np.append(ref, chunk)
+            if rng.random() < 0.3:
+                n = int(rng.integers(0, len(ref)+1))
+                buf.trim(n)
+                ref = ref[n:]
+            self.assertEqual(len(buf), len(ref))
+            np.testing.assert_array_equal(buf.view(), ref)
+
+    def test_view_is_zero_copy(self):
+        """Test the view shares memory with the buffer"""
+        buf = AudioBuffer(capacity=10)
+        buf.append(np.ones(5, dtype=np.float32))
+        view = buf.view()
+        buf.trim(2)
+        self.assertTrue(np.shares_memory(view, buf.view()))
+
+    def test_indexing(self):
+        """Test slicing works like on the array"""
+        buf = AudioBuffer(capacity=4)
+        buf.append(np.arange(10, dtype=np.float32))
+        buf.trim(3)
+        np.testing.assert_array_equal(buf[:2], [3, 4])
+        np.testing.assert_array_equal(buf[-2:], [8, 9])
+        np.testing.assert_array_equal(np.asarray(buf), np.arange(3, 10))
+        buf.clear()
+        self.assertEqual(len(buf), 0)
+
+class TestCommittedStore(unittest.TestCase):
+    """Test the bounded store of committed words"""
+
+    def words(self, n, beg=0):
+        return [(i, i+1, f"w{i:03d}") for i in range(beg, beg+n)]
+
+    def reference_prompt(self, commited, offset):
+        # the original OnlineASRProcessor.prompt over the full list
+        k = max(0, len(commited)-1)
+        while k > 0 and commited[k-1][1] > offset:
+            k -= 1
+        p = [t for _, _, t in commited[:k]]
+        prompt, l = [], 0
+        while p and l < 200:
+            x = p.pop(-1)
+            l += len(x)+1
+            prompt.append(x)
+        return " ".join(prompt[::-1]), " ".join(t for _, _, t in commited[k:])
+
+    def test_prompt_matches_full_list(self):
+        """Test the incremental prompt is the same as the one from all words"""
+        store = CommittedStore()
+        commited = []
+        for i in range(0, 500, 10):
+            words = self.words(10, beg=i)
+            store.extend(words)
+            commited.extend(words)
+            offset = i - 5
+            store.set_offset(offset)
+            self.assertEqual(store.prompt(), self.reference_prompt(commited, offset))
+        self.assertLess(len(store), 60)
+        self.assertEqual(store.total_words, 500)
+        self.assertEqual(store.last(), (499, 500, "w499"))
+
+    def test_spills_to_log(self):
+        """Test every word ends up in the transcript log once"""
+        with tempfile.TemporaryDirectory() as tmp:
+            log = TranscriptLog(os.path.join(tmp, "transcript.txt"))
+            store = CommittedStore(log=log)
+            for i in range(0, 300, 10):
+                store.extend(self.words(10, beg=i))
+                store.set_offset(i)
+            store.close()
+            log.close()
+            with open(log.path, encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        self.assertEqual(len(lines), 300)
+        self.assertEqual(lines[0], "0 1000 w000")
+        self.assertEqual(lines[-1], "299000 300000 w299")
+        self.assertEqual(len(store), 0)
+
+class PunctuationSplitter:
+    """Splits after . ! ? like a sentence tokenizer, and counts the calls"""
+
+    def __init__(self):
+        self.chars = 0
+
+    def split(self, text):
+        self.chars += len(text)
+        return [s for s in re.split(r'(?<=[.!?])\s+', text) if s]
+
+class TestSentenceSegmenter(unittest.TestCase):
+    """Test the incremental sentence segmentation"""
+
+    def words(self, text):
+        return [(i, i+0.5, w) for i, w in enumerate(text.split())]
+
+    def test_map_words(self):
+        """Test the words are mapped to the sentences, including one-word ones"""
+        words = self.words("Hello there. Yes. How are you?")
+        sents, used = map_words_to_sentences(words, ["Hello there.", "Yes.", "How are you?"])
+        self.assertEqual(sents, [(0, 1.5, "Hello there."), (2, 2.5, "Yes."), (3, 5.5, "How are you?")])
+        self.assertEqual(used, [2, 3, 6])
+
+    def test_incremental_same_as_full(self):
+        """Test the sentences are the last ones of the full segmentation"""
+        words = self.words(" ".join(f"w{i}" + ("." if i % 7 == 3 else "") for i in range(200)))
+        splitter = PunctuationSplitter()
+        seg = IncrementalSentenceSegmenter(splitter)
+        for i in range(0, len(words), 3):
+            seg.add(words[i:i+3])
+            done = words[:i+3]
+            full, _ = map_words_to_sentences(done, splitter.split(" ".join(w[2] for w in done)))
+            self.assertEqual(seg.sentences(), full[-3:])
+
+    def test_tokenizes_only_pending_text(self):
+        """Test confirmed sentences are not tokenized again"""
+        words = self.words(" ".join(f"w{i}" + ("." if i % 5 == 4 else "") for i in range(5000)))
+        splitter = PunctuationSplitter()
+        seg = IncrementalSentenceSegmenter(splitter)
+        for i in range(0, len(words), 2):
+            seg.add(words[i:i+2])
+            seg.sentences()
+        self.assertLess(len(seg.pending), 10)
+        self.assertLess(splitter.chars, 2500 * 40)
+
+@unittest.skipUnless(WHISPER_ONLINE_AVAILABLE, "whisper_online dependencies are not installed")
+class TestHypothesisBuffer(unittest.TestCase):
+    """Test the local agreement of HypothesisBuffer"""
+
+    def words(self, text, beg=0.0):
+        return [(beg+i, beg+i+0.5, w) for i, w in enumerate(text.split())]
+
+    def test_commits_common_prefix(self):
+        """Test the words two consecutive hypotheses agree on are committed"""
+        hb = HypothesisBuffer()
+        hb.insert(self.words("a b c"), 0)
+        self.assertEqual(hb.flush(), [])
+        hb.insert(self.words("a b d e"), 0)
+        self.assertEqual(hb.flush(), [(0.0, 0.5, "a"), (1.0, 1.5, "b")])
+        self.assertEqual(hb.complete(), [(2.0, 2.5, "d"), (3.0, 3.5, "e")])
+        self.assertEqual(hb.last_commited_time, 1.5)
+
+    def test_offset_and_time_filter(self):
+        """Test the offset is added and words before the last commit are dropped"""
+        hb = HypothesisBuffer()
+        hb.last_commited_time = 9
+        hb.insert(self.words("x y z", beg=-2), 10)
+        self.assertEqual([w[2] for w in hb.new], ["y", "z"])
+        self.assertEqual(hb.new[0][:2], (9.0, 9.5))
+
+    def test_drops_repeated_ngram(self):
+        """Test words repeating the end of the committed text are dropped"""
+        hb = HypothesisBuffer()
+        hb.insert(self.words("a b c"), 0)
+        hb.flush()
+        hb.insert(self.words("a b c"), 0)
+        hb.flush()
+        hb.insert(self.words("b c d", beg=2.5), 0)
+        self.assertEqual([w[2] for w in hb.new], ["d"])
+
+    def test_pop_commited(self):
+        """Test committed words ending before the time are dropped"""
+        hb = HypothesisBuffer()
+        for _ in range(2):
+            hb.insert(self.words("a b c d"), 0)
+            hb.flush()
+        hb.pop_commited(1.5)
+        self.assertEqual([w[2] for w in hb.commited_in_buffer], ["c", "d"])
+        self.assertEqual(len(hb.commited_ids), 2)
+
+    def test_commit_decided(self):
+        """Test the commit is decided by a differing word or by a hypothesis longer than the previous one"""
+        hb = HypothesisBuffer()
+        hb.insert(self.words("a b c"), 0)
+        self.assertTrue(hb.commit_decided())
+        hb.flush()
+        hb.insert(self.words("a b"), 0)
+        self.assertFalse(hb.commit_decided())
+        hb.insert(self.words("a x"), 0)
+        self.assertTrue(hb.commit_decided())
+        hb.insert(self.words("a b c d"), 0)
+        self.assertTrue(hb.commit_decided())
+
+    def test_vocab_is_bounded(self):
+        """Test the vocabulary of a long stream stays bounded and the words are still committed in order"""
+        hb = HypothesisBuffer()
+        commited = []
+        for k in range(5000):
+            hb.insert([(i, i+0.5, f"w{i}") for i in range(max(0, k-10), k+3)], 0)
+            commited += hb.flush()
+            hb.pop_commited(k - 5)
+            self.assertLessEqual(len(hb.vocab), HypothesisBuffer.MIN_VOCAB)
+        self.assertEqual([w[2] for w in commited], [f"w{i}" for i in range(5001)])
+
+@unittest.skipUnless(WHISPER_ONLINE_AVAILABLE, "whisper_online dependencies are not installed")
+class TestReplayASR(unittest.TestCase):
+    """Test the fake backend of --backend replay"""
+
+    def stream(self, online, seconds):
+        words = []
+        for _ in range(seconds):
+            online.insert_audio_chunk(np.zeros(16000, dtype=np.float32))
+            o = online.process_iter()
+            if o[0] is not None:
+                words.extend(o[2].split())
+        o = online.finish()
+        return words + o[2].split()
+
+    def test_synthetic_words_are_committed_in_order(self):
+        """Test streaming commits the synthetic words once and in order, also with sentence trimming"""
+        for trimming in ["segment", "sentence", "word"]:
+            args = whisper_online.shared_args(backend="replay", lan="en", buffer_trimming=trimming)
+            with open(os.devnull, "w") as devnull:
+                asr, online = whisper_online.asr_factory(args, logfile=devnull)
+                words = self.stream(online, 120)
+            self.assertGreater(len(words), 200)
+            self.assertEqual(words, [f"w{k}." if k % 8 == 7 else f"w{k}" for k in range(len(words))])
+
+    def test_word_trimming_keeps_only_the_tail(self):
+        """Test the word buffer trimming keeps the buffer short and the committed text in the prompt"""
+        args = whisper_online.shared_args(backend="replay", lan="en", buffer_trimming="word", tail_context=1.0)
+        with open(os.devnull, "w") as devnull:
+            asr, online = whisper_online.asr_factory(args, logfile=devnull)
+            longest = 0
+            for _ in range(60):
+                online.insert_audio_chunk(np.zeros(16000, dtype=np.float32))
+                online.process_iter()
+                longest = max(longest, len(online.audio_buffer) / 16000)
+        self.assertLess(longest, 4)
+        prompt, context = online.prompt()
+        self.assertTrue(prompt)
+        self.assertEqual(prompt + " " + context, " ".join(w for _, _, w in online.commited.words()))
+        # the committed words in the buffer are the context of about tail_context seconds
+        self.assertLessEqual(online.commited.last()[1] - online.buffer_time_offset, 1.5)
+
+    def test_lazy_segments(self):
+        """Test consuming the segments lazily commits the same words and stops decoding early"""
+        outputs = []
+        for lazy in [False, True]:
+            args = whisper_online.shared_args(backend="replay", lan="en", lazy_segments=lazy)
+            with open(os.devnull, "w") as devnull:
+                asr, online = whisper_online.asr_factory(args, logfile=devnull)
+                outputs.append(self.stream(online, 90))
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertGreater(online.early_stops, 0)
+
+    def test_replays_transcript_log(self):
+        """Test the words of a transcript log come back at their times"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "words.txt")
+            log = TranscriptLog(path)
+            recorded = [(i*0.6, i*0.6+0.5, f"slovo{i}") for i in range(100)]
+            log.write(recorded)
+            log.close()
+            self.assertEqual([w for _, _, w in read_transcript(path)], [w for _, _, w in recorded])
+            asr = whisper_online.ReplayASR("cs", replay_file=path)
+            asr.stream_offset = 3.0
+            words = asr.transcribe(np.zeros(16000*3, dtype=np.float32))
+            self.assertEqual([w for _, _, w in words], [f"slovo{i}" for i in range(5, 10)])
+            self.assertAlmostEqual(words[0][0], 0.0)
+
+    def test_simulated_latency(self):
+        """Test transcribe takes the configured time"""
+        asr = whisper_online.ReplayASR("en", latency=0.05, rtf=0.1)
+        t = time.perf_counter()
+        asr.transcribe(np.zeros(16000, dtype=np.float32))
+        self.assertGreaterEqual(time.perf_counter() - t, 0.15)
+        self.assertEqual(asr.calls, 1)
+
+if WHISPER_ONLINE_AVAILABLE:
+    class TrailingWordASR(whisper_online.ReplayASR):
+        """ReplayASR of the words w0 w1 w2 in the first 2 seconds, that gives the last one only when the audio
+        goes on for a second after it, like Whisper at the end of an utterance"""
+
+        WORDS = [(0.1, 0.6, "w0"), (0.7, 1.2, "w1"), (1.3, 1.9, "w2")]
+
+        def _words(self, seconds):
+            end = self.stream_offset + seconds
+            words = [w for w in self.WORDS[:-1] if w[1] <= end - 0.2]
+            if end >= self.WORDS[-1][1] + 1:
+                words.append(self.WORDS[-1])
+            return [(b - self.stream_offset, e - self.stream_offset, w) for b, e, w in words]
+
+@unittest.skipUnless(WHISPER_ONLINE_AVAILABLE, "whisper_online dependencies are not installed")
+class TestSkipIterations(unittest.TestCase):
+    """Test process_iter skips transcribe when its outcome can't change"""
+
+    def test_silence_detector(self):
+        """Test noise bursts are speech and the background noise is not"""
+        from speech_segments import SilenceDetector
+        rng = np.random.default_rng(0)
+        d = SilenceDetector()
+        self.assertTrue(d.is_silence(np.zeros(16000, dtype=np.float32)))
+        for _ in range(5):
+            self.assertTrue(d.is_silence(rng.standard_normal(16000) * 0.002))
+        self.assertFalse(d.is_silence(rng.standard_normal(16000) * 0.2))
+        self.assertTrue(d.is_silence(rng.standard_normal(100) * 0.2))  # less than a frame
+
+    def test_skips_silence_after_commit(self):
+        """Test the silence after the speech is skipped once all the words are committed, and the buffer is trimmed"""
+        rng = np.random.default_rng(0)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "words.txt")
+            log = TranscriptLog(path)
+            log.write([(i*0.5, i*0.5+0.4, f"w{i}") for i in range(20)])
+            log.close()
+            asr = whisper_online.ReplayASR("en", replay_file=path)
+            with open(os.devnull, "w") as devnull:
+                online = whisper_online.OnlineASRProcessor(asr, logfile=devnull, skip_silence=True)
+                words = []
+                for i in range(60):
+                    a = rng.standard_normal(16000) * 0.002
+                    if i < 10:  # speech with short pauses
+                        a[:12000] += rng.standard_normal(12000) * 0.2
+                    online.insert_audio_chunk(a.astype(np.float32))
+                    words.extend(online.process_iter()[2].split())
+                    self.assertLessEqual(len(online.audio_buffer), 17*16000)
+                words.extend(online.finish()[2].split())
+        self.assertEqual(words, [f"w{i}" for i in range(20)])
+        self.assertGreater(online.skipped_iterations, 40)
+        self.assertEqual(online.iterations, 60)
+        self.assertLess(asr.calls, 20)
+
+    def test_last_word_after_trailing_silence(self):
+        """Test the silence after the speech is transcribed until it gives no new words, so the word that appears
+        only with the silence after it is committed, not trimmed away with the skipped silence"""
+        rng = np.random.default_rng(0)
+        asr = TrailingWordASR("en")
+        with open(os.devnull, "w") as devnull:
+            online = whisper_online.OnlineASRProcessor(asr, logfile=devnull, skip_silence=True, buffer_trimming=("segment", 3))
+            words = []
+            for i in range(12):
+                a = rng.standard_normal(8000) * 0.002
+                if i < 4:
+                    a += rng.standard_normal(8000) * 0.2
+                online.insert_audio_chunk(a.astype(np.float32))
+                words.extend(online.process_iter()[2].split())
+            self.assertEqual(words, ["w0", "w1", "w2"])
+            self.assertGreater(online.skipped_iterations, 0)
+
+    def test_no_new_audio(self):
+        """Test a second call without new audio does not transcribe with skip_silence"""
+        asr = whisper_online.ReplayASR("en")
+        with open(os.devnull, "w") as devnull:
+            online = whisper_online.OnlineASRProcessor(asr, logfile=devnull, skip_silence=True)
+            speech = np.random.default_rng(0).standard_normal(16000) * 0.2
+            online.insert_audio_chunk(speech.astype(np.float32))
+            online.process_iter()
+            self.assertEqual(online.process_iter(), (None, None, ""))
+        self.assertEqual((asr.calls, online.skipped_iterations), (1, 1))
+
+    def test_no_new_audio_confirms_by_default(self):
+        """Test without skip_silence a second call on the same audio transcribes again and commits the hypothesis"""
+        asr = whisper_online.ReplayASR("en")
+        with open(os.devnull, "w") as devnull:
+            online = whisper_online.OnlineASRProcessor(asr, logfile=devnull)
+            online.insert_audio_chunk(np.zeros(16000*2, dtype=np.float32))
+            self.assertEqual(online.process_iter()[2], "")
+            self.assertEqual(online.process_iter()[2], "w0 w1 w2")
+        self.assertEqual((asr.calls, online.skipped_iterations), (2, 0))
+
+class EnergyVAD:
+    """Stand-in for the Silero model: the speech probability is the window energy"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def reset_states(self):
+        pass
+
+    def __call__(self, x, sr):
+        self.calls += 1
+        return x.abs().mean().reshape(1, 1) * 3
+
+def bursts(seconds=30, seed=1):
+    rng = np.random.default_rng(seed)
+    t = np.arange(16000*seconds) / 16000
+    env = (np.sin(2*np.pi*0.3*t) + 0.3*np.sin(2*np.pi*1.7*t) > 0).astype(np.float32)
+    return (rng.standard_normal(len(t)) * 0.5 * env).astype(np.float32)
+
+@unittest.skipUnless(TORCH_AVAILABLE, "torch is not installed")
+class TestFixedVADIterator(unittest.TestCase):
+    """Test the windowing of FixedVADIterator"""
+
+    def run_chunks(self, vad, audio, sizes):
+        out, pos, i = [], 0, 0
+        while pos < len(audio):
+            n = sizes[i % len(sizes)]
+            out.append(vad(audio[pos:pos+n]))
+            pos += n
+            i += 1
+        return out
+
+    def test_matches_plain_iterator(self):
+        """Test 512-sample chunks give the same events as VADIterator"""
+        audio = bursts()
+        fixed = self.run_chunks(FixedVADIterator(EnergyVAD()), audio, [512])
+        plain = VADIterator(EnergyVAD())
+        expected = [plain(torch.from_numpy(audio[i:i+512])) for i in range(0, len(audio) - 511, 512)]
+        self.assertEqual(fixed[:len(expected)], expected)
+        self.assertTrue(any(r is not None for r in expected))
+
+    def test_batched_same_as_windowed(self):
+        """Test the batched scoring gives the same merged events"""
+        audio = bursts()
+        sizes = [100, 30000, 640, 16000, 7]
+        windowed = self.run_chunks(FixedVADIterator(EnergyVAD(), batch_windows=10**9), audio, sizes)
+        batched = self.run_chunks(FixedVADIterator(EnergyVAD(), batch_windows=1), audio, sizes)
+        self.assertEqual(windowed, batched)
+
+    def test_odd_chunks_keep_every_sample(self):
+        """Test all full windows are scored regardless of the chunk sizes"""
+        model = EnergyVAD()
+        vad = FixedVADIterator(model)
+        self.run_chunks(vad, bursts(seconds=2), [1, 511, 700, 3])
+        self.assertEqual(model.calls, 16000*2 // 512)
+        self.assertEqual(vad.current_sample, model.calls*512)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
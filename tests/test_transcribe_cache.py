@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Tests for the cache of transcribe results
+"""
+
+import unittest
+import tempfile
+import os
+import sys
+
+import numpy as np
+
+# Add project root to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from transcribe_cache import TranscribeCache, CachedASR, transcribe_key, encode_result, decode_result
+
+try:
+    import soundfile as sf
+    import whisper_online
+    WHISPER_ONLINE_AVAILABLE = True
+except ImportError:
+    WHISPER_ONLINE_AVAILABLE = False
+
+class TestTranscribeCache(unittest.TestCase):
+    """Test the on-disk store of transcribe results"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_encode_decode(self):
+        """Test the results come back exactly, also with unicode and without words"""
+        words = [(0.1, 0.52, " Dobrý"), (0.6, 1.0, " den."), (1.25, 1.5, "你好")]
+        self.assertEqual(decode_result(encode_result(words, [1.0, 1.5])), (words, [1.0, 1.5], None))
+        self.assertEqual(decode_result(encode_result(words, [1.5], [0.5, 0.25, 1.0])), (words, [1.5], [0.5, 0.25, 1.0]))
+        self.assertEqual(decode_result(encode_result([], [])), ([], [], None))
+        self.assertEqual(decode_result(encode_result([], [], [])), ([], [], []))
+
+    def test_key(self):
+        """Test the key depends on the audio, the prompt and the model"""
+        a = np.zeros(16000, dtype=np.float32)
+        b = a.copy()
+        b[100] = 0.5
+        keys = {transcribe_key(a, "", ("m", "cs")), transcribe_key(b, "", ("m", "cs")),
+                transcribe_key(a, "x", ("m", "cs")), transcribe_key(a, "", ("m", "en"))}
+        self.assertEqual(len(keys), 4)
+        self.assertEqual(transcribe_key(a, "", ("m", "cs")), transcribe_key(a.astype(np.float64), None, ("m", "cs")))
+
+    def test_hit_rate_and_prune(self):
+        """Test hits, misses and that the least recently used entries are removed over the limit"""
+        cache = TranscribeCache(self.tmp.name, max_bytes=10**6)
+        words = [(i*0.5, i*0.5+0.4, f"w{i}") for i in range(50)]
+        self.assertIsNone(cache.get("00aa"))
+        cache.put("00aa", words, [words[-1][1]])
+        self.assertEqual(cache.get("00aa"), (words, [words[-1][1]], None))
+        self.assertAlmostEqual(cache.hit_rate(), 0.5)
+        size = cache.total_bytes()
+        for i in range(9):
+            cache.put(f"{i:02d}bb", words, [])
+        self.assertEqual(cache.stats()["entries"], 10)
+        cache.prune(size * 3)
+        self.assertLessEqual(cache.total_bytes(), size * 3)
+        self.assertIsNotNone(cache.get("08bb"))
+
+    def test_full_cache_is_not_scanned_on_every_put(self):
+        """Test a full cache is pruned below the limit, so that the next stores don't list the directory"""
+        words = [(i*0.5, i*0.5+0.4, f"w{i}") for i in range(50)]
+        size = len(encode_result(words, []))
+        cache = TranscribeCache(self.tmp.name, max_bytes=size * 50)
+        for i in range(50):
+            cache.put(f"{i:04x}", words, [])
+        scans = 0
+        entries = cache.entries
+        def counting_entries():
+            nonlocal scans
+            scans += 1
+            return entries()
+        cache.entries = counting_entries
+        for i in range(50, 150):
+            cache.put(f"{i:04x}", words, [])
+        self.assertLess(scans, 20)
+        self.assertLessEqual(cache.total_bytes(), size * 50)
+
+if WHISPER_ONLINE_AVAILABLE:
+    class ConfidentReplayASR(whisper_online.ReplayASR):
+        """ReplayASR with a confidence of every word, lower for the words with a full stop"""
+
+        def word_confidences(self, r):
+            return [0.5 if w.endswith(".") else 0.95 for _, _, w in r]
+
+@unittest.skipUnless(WHISPER_ONLINE_AVAILABLE, "whisper_online dependencies are not installed")
+class TestCachedASR(unittest.TestCase):
+    """Test memoized transcribe calls with the replay backend"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = TranscribeCache(os.path.join(self.tmp.name, "cache"), max_bytes=10**7)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_second_offline_run_is_served_from_cache(self):
+        """Test the offline engine gives the same lines from the cache, without calling the model"""
+        wav = os.path.join(self.tmp.name, "speech.wav")
+        rng = np.random.default_rng(0)
+        audio = (rng.standard_normal(16000*60) * 0.001).astype(np.float32)
+        audio[16000*5:16000*50] += (rng.standard_normal(16000*45) * 0.2).astype(np.float32)
+        sf.write(wav, audio, 16000, subtype="FLOAT")
+        expected = list(whisper_online.transcribe_offline(whisper_online.ReplayASR("en"), wav))
+
+        asr = CachedASR(whisper_online.ReplayASR("en"), self.cache)
+        self.assertEqual(list(whisper_online.transcribe_offline(asr, wav)), expected)
+        calls = asr.calls
+        self.assertEqual(self.cache.hits, 0)
+        asr = CachedASR(whisper_online.ReplayASR("en"), self.cache)
+        self.assertEqual(list(whisper_online.transcribe_offline(asr, wav)), expected)
+        self.assertEqual(asr.calls, 0)
+        self.assertEqual(self.cache.hits, calls)
+
+    def test_batch_results_are_not_served_to_transcribe(self):
+        """Test transcribe_batch and transcribe store the same audio under different keys"""
+        asr = CachedASR(whisper_online.ReplayASR("en"), self.cache)
+        audio = np.zeros(16000*5, dtype=np.float32)
+        asr.transcribe_batch([audio])
+        asr.transcribe(audio)
+        self.assertEqual(self.cache.hits, 0)
+        self.assertEqual(self.cache.stats()["entries"], 2)
+
+    def test_confidences_are_stored(self):
+        """Test the confidences of the words come back on a hit, for the confidence commit policy"""
+        audio = np.zeros(16000*5, dtype=np.float32)
+        expected = ConfidentReplayASR("en")
+        expected = expected.word_confidences(expected.transcribe(audio))
+        for _ in range(2):
+            asr = CachedASR(ConfidentReplayASR("en"), self.cache)
+            self.assertEqual(asr.word_confidences(asr.transcribe(audio)), expected)
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_stream_is_served_by_segments(self):
+        """Test transcribe_stream yields a stored result segment by segment, and stores only complete results"""
+        audio = np.zeros(16000*10, dtype=np.float32)
+        replay = ConfidentReplayASR("en")
+        expected = [(replay.ts_words(r), replay.segments_end_ts(r), replay.word_confidences(r))
+                    for r in replay.transcribe_stream(audio)]
+        self.assertGreater(len(expected), 1)
+        asr = CachedASR(ConfidentReplayASR("en"), self.cache)
+        stream = asr.transcribe_stream(audio)
+        next(stream)
+        stream.close()
+        self.assertEqual(self.cache.stats()["entries"], 0)
+        for calls in [1, 0]:
+            asr = CachedASR(ConfidentReplayASR("en"), self.cache)
+            pieces = [(asr.ts_words(r), asr.segments_end_ts(r), asr.word_confidences(r)) for r in asr.transcribe_stream(audio)]
+            self.assertEqual(pieces, expected)
+            self.assertEqual(asr.calls, calls)
+
+    def test_lazy_confidence_streaming_does_not_change(self):
+        """Test the lazy segments and the confidence commit policy commit the same words through the cache"""
+        outputs = []
+        for asr in [ConfidentReplayASR("en"), CachedASR(ConfidentReplayASR("en"), self.cache),
+                    CachedASR(ConfidentReplayASR("en"), self.cache)]:
+            with open(os.devnull, "w") as devnull:
+                policy = whisper_online.create_commit_policy("confidence", threshold=0.9)
+                online = whisper_online.OnlineASRProcessor(asr, logfile=devnull, lazy_segments=True, commit_policy=policy)
+                out = []
+                for _ in range(30):
+                    online.insert_audio_chunk(np.zeros(16000, dtype=np.float32))
+                    out.append(online.process_iter())
+                outputs.append(out)
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(outputs[0], outputs[2])
+        self.assertGreater(self.cache.hits, 0)
+
+    def test_streaming_output_does_not_change(self):
+        """Test streaming through the cache commits the same words"""
+        outputs = []
+        for asr in [whisper_online.ReplayASR("en"), CachedASR(whisper_online.ReplayASR("en"), self.cache)]:
+            with open(os.devnull, "w") as devnull:
+                online = whisper_online.OnlineASRProcessor(asr, logfile=devnull)
+                out = []
+                for _ in range(60):
+                    online.insert_audio_chunk(np.zeros(16000, dtype=np.float32))
+                    out.append(online.process_iter())
+                outputs.append(out)
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertGreater(self.cache.misses, 0)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
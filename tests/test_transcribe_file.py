@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Tests for the in-process transcription API of whisper_online.py
+"""
+
+import unittest
+import tempfile
+import time
+import os
+import sys
+from unittest import mock
+
+import numpy as np
+
+# Add project root to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from speech_segments import frame_rms, energy_speech_regions, pack_windows, split_parts
+
+try:
+    import soundfile as sf
+    import whisper_online
+    WHISPER_ONLINE_AVAILABLE = True
+except ImportError:
+    WHISPER_ONLINE_AVAILABLE = False
+
+if WHISPER_ONLINE_AVAILABLE:
+    class CountingASR(whisper_online.ASRBase):
+        """Fake ASR: one word per half second of audio"""
+
+        sep = " "
+
+        def load_model(self, modelsize=None, cache_dir=None, model_dir=None):
+            self.offset = 0
+            self.calls = []
+            return modelsize
+
+        def transcribe(self, audio, init_prompt=""):
+            self.calls.append(len(audio))
+            n = int(len(audio) / 16000 * 2) - 1
+            return [(i*0.5, i*0.5+0.4, f"w{int(self.offset*2)+i}") for i in range(max(n, 0))]
+
+        def ts_words(self, r):
+            return r
+
+        def segments_end_ts(self, r):
+            return [w[1] for w in r[::4]]
+
+    class SlowASR(CountingASR):
+        """CountingASR that takes 0.1 s per transcribe"""
+
+        def transcribe(self, audio, init_prompt=""):
+            time.sleep(0.1)
+            return super().transcribe(audio, init_prompt)
+
+    class FakeRegistry(whisper_online.ASRRegistry):
+        """Registry that loads CountingASR"""
+
+        def __init__(self):
+            super().__init__()
+            self.loads = 0
+
+        def load(self, args):
+            self.loads += 1
+            return CountingASR(lan=args.lan, modelsize=args.model)
+
+    class BatchASR(CountingASR):
+        """Fake ASR with batched transcribe, records the batch sizes"""
+
+        supports_batch = True
+
+        def transcribe_batch(self, audios):
+            self.batches = getattr(self, "batches", []) + [len(audios)]
+            return super().transcribe_batch(audios)
+
+    def load_counting_asr(args):
+        """load_asr of the worker processes"""
+        return CountingASR(lan=args.lan, modelsize=args.model)
+
+    class HangingASR(CountingASR):
+        """CountingASR that takes a minute per transcribe"""
+
+        def transcribe(self, audio, init_prompt=""):
+            time.sleep(60)
+            return super().transcribe(audio, init_prompt)
+
+    def load_hanging_asr(args):
+        """load_asr of the worker processes, with HangingASR"""
+        return HangingASR(lan=args.lan, modelsize=args.model)
+
+def bursts(spans, seconds, sr=16000):
+    """Quiet noise with loud noise in the spans [(beg, end), ...] in seconds"""
+    rng = np.random.default_rng(0)
+    a = (rng.standard_normal(sr*seconds) * 0.001).astype(np.float32)
+    for beg, end in spans:
+        a[int(beg*sr):int(end*sr)] += (rng.standard_normal(int(end*sr) - int(beg*sr)) * 0.2).astype(np.float32)
+    return a
+
+class TestSpeechSegments(unittest.TestCase):
+    """Test the windows of the offline engine"""
+
+    def setUp(self):
+        self.audio = bursts([(1, 4), (4.3, 9), (12, 50), (80, 81)], 100)
+        self.rms = frame_rms(lambda beg, end: self.audio[int(beg*16000):int(end*16000)], 100)
+
+    def test_regions(self):
+        """Test the loud parts are found, with short pauses merged"""
+        regions = [(b/16000, e/16000) for b, e in energy_speech_regions(self.rms)]
+        self.assertEqual(len(regions), 3)
+        for (beg, end), (rb, re_) in zip([(1, 9), (12, 50), (80, 81)], regions):
+            self.assertAlmostEqual(rb, beg, delta=0.3)
+            self.assertAlmostEqual(re_, end, delta=0.3)
+
+    def test_windows(self):
+        """Test the windows cover the regions and are at most max_window long"""
+        regions = energy_speech_regions(self.rms)
+        windows = pack_windows(regions, self.rms, max_window=25)
+        self.assertTrue(all(e - b <= 25*16000 for b, e in windows))
+        covered = sum(e - b for b, e in windows)
+        self.assertGreaterEqual(covered, sum(e - b for b, e in regions))
+        self.assertEqual(windows[0][0], regions[0][0])
+        self.assertEqual(windows[-1][1], regions[-1][1])
+        # far apart regions are not packed together
+        self.assertEqual(windows[-1][0], regions[-1][0])
+
+    def test_split_parts(self):
+        """Test the parts cover the windows in order and overlap only at cuts without a pause"""
+        windows = [(0, 10), (10, 20), (21, 30), (30, 40), (45, 50), (50, 60)]
+        self.assertEqual(split_parts(windows, 1), [windows])
+        self.assertEqual(split_parts(windows, 3), [[(0, 10), (10, 20)], [(21, 30), (30, 40)], [(45, 50), (50, 60)]])
+        parts = split_parts(windows, 4)
+        self.assertEqual(len(parts), 4)
+        self.assertEqual(parts[1][0], (9.0, 20))
+        self.assertEqual(len(split_parts(windows, 10)), len(windows))
+        self.assertEqual(split_parts([], 4), [])
+
+@unittest.skipUnless(WHISPER_ONLINE_AVAILABLE, "whisper_online dependencies are not installed")
+class TestTranscribeFile(unittest.TestCase):
+    """Test transcribe_file with a fake ASR"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.wav = os.path.join(self.tmp.name, "silence.wav")
+        sf.write(self.wav, np.zeros(16000*20, dtype=np.float32), 16000, subtype="FLOAT")
+        self.devnull = open(os.devnull, "w")
+
+    def tearDown(self):
+        self.devnull.close()
+        self.tmp.cleanup()
+
+    def test_shared_args(self):
+        """Test the defaults of the command line and unknown options"""
+        args = whisper_online.shared_args(lan="cs", min_chunk_size=2)
+        self.assertEqual((args.lan, args.min_chunk_size, args.buffer_trimming), ("cs", 2, "segment"))
+        with self.assertRaises(TypeError):
+            whisper_online.shared_args(no_such_option=1)
+
+    def test_pcm_cache_is_opened_by_the_entry_points(self):
+        """Test importing opens no pcm cache, and an explicit --no-pcm-cache is kept by the later entry points"""
+        with mock.patch.object(whisper_online, "pcm_cache", None), \
+                mock.patch.object(whisper_online, "_pcm_cache_decided", False), \
+                mock.patch.object(whisper_online, "open_default_pcm_cache", return_value="cache") as opened:
+            whisper_online.open_pcm_cache(False)
+            self.assertIsNone(whisper_online.open_pcm_cache())
+            whisper_online.open_pcm_cache(True)
+            self.assertEqual(whisper_online.open_pcm_cache(), "cache")
+            self.assertEqual(opened.call_count, 1)
+
+    def test_yields_segments_and_reuses_model(self):
+        """Test the segments are in order and the model is loaded once"""
+        registry = FakeRegistry()
+        for lan in ["cs", "en"]:
+            segments = list(whisper_online.transcribe_file(self.wav, registry=registry, lan=lan, model="tiny",
+                                                           min_chunk_size=1, logfile=self.devnull))
+            self.assertTrue(segments)
+            begs = [b for b, _, _ in segments]
+            self.assertEqual(begs, sorted(begs))
+            self.assertTrue(all(t for _, _, t in segments))
+        self.assertEqual(registry.loads, 1)
+        self.assertEqual(len(registry), 1)
+        list(whisper_online.transcribe_file(self.wav, registry=registry, model="base", logfile=self.devnull))
+        self.assertEqual(registry.loads, 2)
+
+    def test_offline_transcribes_every_window_once(self):
+        """Test the offline engine sends every second of speech to the ASR once"""
+        wav = os.path.join(self.tmp.name, "speech.wav")
+        sf.write(wav, bursts([(1, 9), (12, 50), (80, 81)], 100), 16000, subtype="FLOAT")
+        registry = FakeRegistry()
+        segments = list(whisper_online.transcribe_file(wav, registry=registry, offline=True, model="tiny",
+                                                       logfile=self.devnull))
+        asr = registry.get(whisper_online.shared_args(model="tiny"))
+        windows = whisper_online.speech_windows(wav)
+        self.assertEqual(len(asr.calls), len(windows))
+        self.assertLessEqual(sum(asr.calls), 100*16000)
+        self.assertTrue(segments)
+        ends = [e for _, e, _ in segments]
+        self.assertEqual(ends, sorted(ends))
+        self.assertTrue(all(windows[0][0] <= b and e <= windows[-1][1] + 0.5 for b, e, _ in segments))
+
+    def test_timeout(self):
+        """Test a file that takes longer than the timeout stops with TimeoutError before the next transcribe"""
+        wav = os.path.join(self.tmp.name, "speech.wav")
+        sf.write(wav, bursts([(1, 9), (12, 50), (80, 81)], 100), 16000, subtype="FLOAT")
+        for path, offline in [(wav, True), (self.wav, False)]:
+            registry = FakeRegistry()
+            registry.load = lambda args: SlowASR(lan=args.lan, modelsize=args.model)
+            with self.assertRaises(TimeoutError):
+                list(whisper_online.transcribe_file(path, registry=registry, offline=offline, timeout=0.05,
+                                                    model="tiny", min_chunk_size=1, logfile=self.devnull))
+            asr = registry.get(whisper_online.shared_args(model="tiny"))
+            self.assertEqual(len(asr.calls), 1)
+
+    def test_offline_builds_no_online_processor(self):
+        """Test --offline with --vac builds no streaming processor and no exporter of its metrics"""
+        registry = FakeRegistry()
+        with mock.patch.object(whisper_online, "VACOnlineASRProcessor", side_effect=AssertionError("built")), \
+                mock.patch.object(whisper_online, "OnlineASRProcessor", side_effect=AssertionError("built")):
+            segments = list(whisper_online.transcribe_file(self.wav, registry=registry, offline=True, vac=True,
+                                                           offline_segmenter="energy", model="tiny",
+                                                           logfile=self.devnull))
+            args = whisper_online.shared_args(model="tiny", vac=True)
+            args.offline = True
+            asr, online = whisper_online.asr_factory(args, registry=registry)
+        self.assertEqual(segments, [])
+        self.assertIsNone(online)
+        self.assertIsNone(whisper_online.create_metrics_exporter(asr, online, args))
+
+@unittest.skipUnless(WHISPER_ONLINE_AVAILABLE, "whisper_online dependencies not installed")
+class TestParallel(unittest.TestCase):
+    """Test the offline engine in worker processes"""
+
+    def test_border_duplicates(self):
+        """Test the repeated words at the border of two parts are found like in HypothesisBuffer"""
+        commited = [(8.0, 8.4, " a"), (8.5, 8.9, " b"), (9.0, 9.4, " c")]
+        self.assertEqual(whisper_online.border_duplicates([], commited), 0)
+        # the same words again, transcribed from an overlapping window
+        self.assertEqual(whisper_online.border_duplicates(commited, [(8.5, 8.9, " b"), (9.0, 9.4, " c"), (9.5, 9.9, " d")]), 2)
+        # shifted timestamps: the repeated n-gram is dropped
+        self.assertEqual(whisper_online.border_duplicates(commited, [(9.3, 9.6, "b"), (9.6, 9.8, " c"), (10.0, 10.4, " d")]), 2)
+        self.assertEqual(whisper_online.border_duplicates(commited, [(9.5, 9.9, " d"), (10.0, 10.4, " c")]), 0)
+        self.assertEqual(whisper_online.border_duplicates(commited, [(12.0, 12.4, " c")]), 0)
+
+    def tearDown(self):
+        whisper_online.shutdown_parallel_pool()
+
+    def test_same_as_offline(self):
+        """Test the stitched parts give the lines of the offline engine, and the workers are reused for the next file"""
+        with tempfile.TemporaryDirectory() as tmp:
+            args = whisper_online.shared_args(model="tiny")
+            pools = []
+            for i, spans in enumerate([[(1, 15), (18, 32), (35, 49), (52, 66)], [(2, 20), (25, 60)]]):
+                wav = os.path.join(tmp, f"speech{i}.wav")
+                sf.write(wav, bursts(spans, 70), 16000, subtype="FLOAT")
+                expected = list(whisper_online.transcribe_offline(load_counting_asr(args), wav))
+                lines = list(whisper_online.transcribe_parallel(wav, args, 2, load_asr=load_counting_asr))
+                self.assertTrue(expected)
+                self.assertEqual(lines, expected)
+                pools.append(whisper_online.get_parallel_pool(args, 2, load_counting_asr))
+        self.assertIs(pools[0], pools[1])
+
+    def test_timeout_kills_workers(self):
+        """Test the workers are stopped at the timeout and not waited for"""
+        with tempfile.TemporaryDirectory() as tmp:
+            wav = os.path.join(tmp, "speech.wav")
+            sf.write(wav, bursts([(1, 15), (18, 32)], 35), 16000, subtype="FLOAT")
+            args = whisper_online.shared_args(model="tiny")
+            t = time.monotonic()
+            with self.assertRaises(TimeoutError):
+                list(whisper_online.transcribe_parallel(wav, args, 2, load_asr=load_hanging_asr,
+                                                        deadline=whisper_online.timeout_deadline(1)))
+        self.assertLess(time.monotonic() - t, 30)
+        self.assertIsNone(whisper_online._parallel_pool)
+
+@unittest.skipUnless(WHISPER_ONLINE_AVAILABLE, "whisper_online dependencies not installed")
+class TestBatched(unittest.TestCase):
+    """Test batched transcription of many files"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.files = []
+        for i, spans in enumerate([[(1, 9), (12, 30)], [], [(0.5, 20)], [(2, 4), (10, 14)]]):
+            fname = os.path.join(self.tmp.name, f"clip{i}.wav")
+            sf.write(fname, bursts(spans, 35), 16000, subtype="FLOAT")
+            self.files.append(fname)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_words_are_routed_to_their_files(self):
+        """Test every file gets the lines of the offline engine, in batches of windows of several files"""
+        asr = BatchASR(lan="cs")
+        done = dict(whisper_online.transcribe_batched(asr, self.files, batch_size=3))
+        self.assertEqual(sorted(done), sorted(self.files))
+        windows = sum(len(whisper_online.speech_windows(f)) for f in self.files)
+        self.assertEqual(sum(asr.batches), windows)
+        self.assertEqual(len(asr.batches), -(-windows // 3))
+        for fname in self.files:
+            self.assertEqual(done[fname], list(whisper_online.transcribe_offline(CountingASR(lan="cs"), fname)))
+
+    def test_without_batch_support(self):
+        """Test the files are transcribed one by one by a backend without batches"""
+        registry = FakeRegistry()
+        done = list(whisper_online.transcribe_files(self.files, registry=registry, model="tiny"))
+        self.assertEqual([f for f, _ in done], self.files)
+        self.assertEqual(done[1][1], [])
+        self.assertTrue(done[0][1])
+
+@unittest.skipUnless(WHISPER_ONLINE_AVAILABLE, "whisper_online dependencies not installed")
+class TestFasterWhisperDevice(unittest.TestCase):
+    """Test the device and compute type of the faster-whisper backend"""
+
+    def test_resolve_device(self):
+        """Test auto selection and the CPU fallback without CUDA"""
+        resolve = whisper_online.resolve_device
+        self.assertEqual(resolve("auto", "auto", cuda_devices=1), ("cuda", "float16"))
+        self.assertEqual(resolve("auto", "auto", cuda_devices=0), ("cpu", "int8"))
+        self.assertEqual(resolve("cuda", "float16", cuda_devices=0), ("cpu", "int8"))
+        self.assertEqual(resolve("cuda", "int8_float16", cuda_devices=2), ("cuda", "int8_float16"))
+        self.assertEqual(resolve("cpu", "float32", cuda_devices=1), ("cpu", "float32"))
+        self.assertEqual(resolve("cpu", "int8_float32", cuda_devices=0), ("cpu", "int8_float32"))
+
+    def test_create_asr_passes_options(self):
+        """Test the command line options reach the model, and the registry keeps one model per device"""
+        args = whisper_online.shared_args(model="tiny", compute_type="float16", cpu_threads=4, num_workers=2)
+        with mock.patch.object(whisper_online, "cuda_device_count", return_value=0), \
+                mock.patch.object(whisper_online.FasterWhisperASR, "load_model", return_value=None):
+            asr = whisper_online.create_asr(args)
+        self.assertEqual((asr.device, asr.compute_type, asr.cpu_threads, asr.num_workers), ("cpu", "int8", 4, 2))
+        registry = whisper_online.ASRRegistry()
+        self.assertNotEqual(registry.key(args), registry.key(whisper_online.shared_args(model="tiny", device="cpu",
+                                                                                        compute_type="float16")))
+
+    def test_batch_clips_are_sample_indices(self):
+        """Test the clip bounds of the batched pipeline are ints that slice out every audio, and the words come back"""
+        class FakePipeline:
+            def transcribe(self, audio, clip_timestamps=None, **kw):
+                self.clips = clip_timestamps
+                self.slices = [audio[c["start"]:c["end"]] for c in clip_timestamps]
+                # one segment per clip, with one word at 0.5 s from the clip start, in seconds of the whole audio
+                word = lambda c: mock.Mock(start=c["start"]/16000 + 0.5, end=c["start"]/16000 + 0.9, word=" w")
+                return [mock.Mock(start=c["start"]/16000, no_speech_prob=0.0, words=[word(c)])
+                        for c in clip_timestamps], None
+
+        with mock.patch.object(whisper_online, "cuda_device_count", return_value=0), \
+                mock.patch.object(whisper_online.FasterWhisperASR, "load_model", return_value=None):
+            asr = whisper_online.create_asr(whisper_online.shared_args(model="tiny"))
+        asr._batched = FakePipeline()
+        audios = [np.full(16000*n, n, dtype=np.float32) for n in (3, 1, 7)]
+        out = asr.transcribe_batch(audios)
+        for c in asr._batched.clips:
+            self.assertIsInstance(c["start"], int)
+            self.assertIsInstance(c["end"], int)
+        for a, sliced in zip(audios, asr._batched.slices):
+            np.testing.assert_array_equal(a, sliced)
+        self.assertEqual([[[(round(b, 6), round(e, 6), w) for b, e, w in seg] for seg in o] for o in out],
+                         [[[(0.5, 0.9, " w")]]] * 3)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
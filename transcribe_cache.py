@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+
+"""Persistent on-disk cache of transcribe results, in front of ASRBase.transcribe.
+
+Running a folder again with another --buffer_trimming, other target languages
+or another SRT layout used to repeat exactly the same Whisper passes. A
+transcribe result depends only on the audio window, the prompt, the model and
+the transcribe options, so the words of every call are stored here under a hash
+of these. The offline engine sends the same windows on every run, so its second
+run is served from the cache completely.
+
+An entry is the normalized result (the words of ts_words, the segment ends of
+segments_end_ts and the confidences of word_confidences, if the backend has
+them) in a small binary file, a few kB per window. transcribe_stream serves a
+stored result segment by segment, like the backends that decode lazily. Entries are
+written to a temporary file and renamed, so that several processes can share
+the cache directory. When its total size exceeds the limit, the least recently
+used entries are removed until it is down to LOW_WATER of the limit.
+
+The cache lives in `get_transcribe_cache_dir()` of src/config.py, and it is
+used with `--transcribe-cache` or `ONECLICK_TRANSCRIBE_CACHE=1`.
+
+Command line usage:
+    python3 transcribe_cache.py stats
+    python3 transcribe_cache.py prune [--max-mb 256]
+    python3 transcribe_cache.py clear
+"""
+
+import os
+import sys
+import struct
+import hashlib
+import logging
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# bump it when the entry format or the normalization of the results changes
+FORMAT_VERSION = 2
+
+# the cache is pruned after this many stores even if this process did not reach the limit,
+# because other processes write to the same directory
+PRUNE_EVERY = 1000
+
+# over the limit, the cache is pruned to this share of it, so that the next stores don't scan the directory again
+LOW_WATER = 0.8
+
+
+def _config():
+    src = os.path.join(os.path.dirname(os.path.abspath(__file__)), "src")
+    if src not in sys.path:
+        sys.path.append(src)
+    import config
+    return config
+
+
+def transcribe_key(audio, init_prompt, asr_key):
+    """Hash of the audio samples, the prompt and the model with its options (ASRBase.cache_key)."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"v{FORMAT_VERSION}:{asr_key!r}:".encode())
+    h.update((init_prompt or "").encode("utf-8"))
+    h.update(b"\0")
+    h.update(np.ascontiguousarray(audio, dtype=np.float32).tobytes())
+    return h.hexdigest()
+
+
+def encode_result(words, ends, confidences=None):
+    """words: [(beg, end, "word"), ...], ends: [segment end, ...], confidences: [of every word, ...] or None -> bytes"""
+    numbers = [t for b, e, _ in words for t in (b, e)] + list(ends) + list(confidences or [])
+    text = "\0".join(w for _, _, w in words).encode("utf-8")
+    return (struct.pack("<III", len(words), len(ends), confidences is not None)
+            + np.array(numbers, dtype="<f8").tobytes() + text)
+
+
+def decode_result(data):
+    """bytes -> (words, ends, confidences), the inverse of encode_result"""
+    n, m, has_confidences = struct.unpack_from("<III", data)
+    count = 2*n + m + (n if has_confidences else 0)
+    numbers = np.frombuffer(data, dtype="<f8", count=count, offset=12).tolist()
+    text = data[12 + 8*count:].decode("utf-8")
+    texts = text.split("\0") if n else []
+    words = [(numbers[2*i], numbers[2*i+1], texts[i]) for i in range(n)]
+    confidences = numbers[2*n + m:] if has_confidences else None
+    return words, numbers[2*n:2*n + m], confidences
+
+
+class TranscribeCache:
+    """Directory of <key>.tr files, in subdirectories by the first two characters of the key."""
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._bytes = None  # estimate of the total size, counted on the first put
+        self._puts = 0
+
+    def _path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.tr"
+
+    def get(self, key):
+        """Returns (words, ends, confidences) of the key, or None if it is not cached."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                result = decode_result(f.read())
+        except (OSError, ValueError, struct.error, UnicodeDecodeError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        # mark as recently used for the eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return result
+
+    def put(self, key, words, ends, confidences=None):
+        path = self._path(key)
+        data = encode_result(words, ends, confidences)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # not *.tr, so that it's not listed as an entry while it's written
+        tmp = path.with_name(f"{key}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+        if self._bytes is None:
+            self._bytes = self.total_bytes()
+        else:
+            self._bytes += len(data)
+        self._puts += 1
+        if self._bytes > self.max_bytes or self._puts % PRUNE_EVERY == 0:
+            self.prune(keep=key, low_water=LOW_WATER)
+
+    def entries(self):
+        """Returns a list of dicts with key, path, bytes and last_used, the oldest first."""
+        out = []
+        if not self.cache_dir.is_dir():
+            return out
+        for path in self.cache_dir.glob("*/*.tr"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            out.append({"key": path.stem, "path": str(path), "bytes": st.st_size, "last_used": st.st_mtime})
+        return sorted(out, key=lambda e: e["last_used"])
+
+    def total_bytes(self):
+        return sum(e["bytes"] for e in self.entries())
+
+    def prune(self, max_bytes=None, keep=None, low_water=1.0):
+        """Removes the least recently used entries until the cache fits into max_bytes.
+        keep: key of an entry that is never removed, e.g. the one that was just stored.
+        low_water: if the cache is over max_bytes, it is pruned to this share of it.
+        Returns the number of removed entries."""
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        entries = self.entries()
+        total = sum(e["bytes"] for e in entries)
+        target = max_bytes * low_water if total > max_bytes else max_bytes
+        removed = 0
+        for e in entries:
+            if total <= target:
+                break
+            if e["key"] == keep:
+                continue
+            try:
+                os.unlink(e["path"])
+            except FileNotFoundError:
+                pass
+            total -= e["bytes"]
+            removed += 1
+        if removed:
+            logger.debug(f"transcribe cache: evicted {removed} entries")
+        self.evictions += removed
+        self._bytes = total
+        return removed
+
+    def clear(self):
+        return self.prune(0)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        entries = self.entries()
+        return {
+            "dir": str(self.cache_dir),
+            "entries": len(entries),
+            "bytes": sum(e["bytes"] for e in entries),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate(),
+            "evictions": self.evictions,
+        }
+
+
+class CachedTranscript:
+    """A transcribe result served by CachedASR: the words, the segment ends and the confidences of the words"""
+
+    def __init__(self, words, ends, confidences=None):
+        self.words = words
+        self.ends = ends
+        self.confidences = confidences
+
+
+class CachedASR:
+    """Wraps an ASR object (whisper_online.ASRBase) and memoizes its transcribe calls in a TranscribeCache.
+    transcribe returns a CachedTranscript both on a hit and on a miss, so that the output does not depend on
+    the cache. The other attributes are the ones of the wrapped ASR, and they are set on it.
+    """
+
+    def __init__(self, asr, cache):
+        object.__setattr__(self, "asr", asr)
+        object.__setattr__(self, "cache", cache)
+
+    def __getattr__(self, name):
+        return getattr(self.asr, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.asr, name, value)
+
+    def transcribe(self, audio, init_prompt=""):
+        key = transcribe_key(audio, init_prompt, self.asr.cache_key())
+        result = self.cache.get(key)
+        if result is None:
+            res = self.asr.transcribe(audio, init_prompt=init_prompt)
+            result = self.asr.ts_words(res), self.asr.segments_end_ts(res), self.asr.word_confidences(res)
+            self.cache.put(key, *result)
+        return CachedTranscript(*result)
+
+    def transcribe_stream(self, audio, init_prompt=""):
+        # the same results as transcribe, under the same key
+        key = transcribe_key(audio, init_prompt, self.asr.cache_key())
+        result = self.cache.get(key)
+        if result is not None:
+            yield from _segments(*result)
+            return
+        words, ends, confidences = [], [], []
+        stream = self.asr.transcribe_stream(audio, init_prompt=init_prompt)
+        try:
+            for r in stream:
+                piece = CachedTranscript(self.asr.ts_words(r), self.asr.segments_end_ts(r), self.asr.word_confidences(r))
+                words.extend(piece.words)
+                ends.extend(piece.ends)
+                confidences = None if confidences is None or piece.confidences is None else confidences + piece.confidences
+                yield piece
+        finally:
+            stream.close()
+        # only a complete result is stored, not when the caller stopped early
+        self.cache.put(key, words, ends, confidences)
+
+    def ts_words(self, r):
+        return r.words
+
+    def segments_end_ts(self, r):
+        return r.ends
+
+    def word_confidences(self, r):
+        return r.confidences
+
+    def transcribe_batch(self, audios):
+        # not the keys of transcribe, the batched pipeline gives other results for the same audio
+        asr_key = self.asr.batch_cache_key()
+        keys = [transcribe_key(a, "", asr_key) for a in audios]
+        out = [None] * len(audios)
+        missing = []
+        for i, key in enumerate(keys):
+            result = self.cache.get(key)
+            if result is None:
+                missing.append(i)
+            else:
+                out[i] = _groups(*result[:2])
+        if missing:
+            for i, groups in zip(missing, self.asr.transcribe_batch([audios[i] for i in missing])):
+                self.cache.put(keys[i], [w for g in groups for w in g], [g[-1][1] for g in groups])
+                out[i] = groups
+        return out
+
+
+def _segments(words, ends, confidences):
+    """A stored result as CachedTranscripts of one segment each, the pieces of transcribe_stream"""
+    i = 0
+    for seg_end in ends:
+        j = i
+        while j < len(words) and words[j][1] <= seg_end + 0.01:
+            j += 1
+        yield CachedTranscript(words[i:j], [seg_end], None if confidences is None else confidences[i:j])
+        i = j
+    if i < len(words):
+        yield CachedTranscript(words[i:], [], None if confidences is None else confidences[i:])
+
+
+def _groups(words, ends):
+    """The words grouped by the segment ends, like whisper_online.segment_words"""
+    out = []
+    i = 0
+    for seg_end in list(ends) + [float("inf")]:
+        group = []
+        while i < len(words) and words[i][1] <= seg_end + 0.01:
+            group.append(words[i])
+            i += 1
+        if group:
+            out.append(group)
+    return out
+
+
+def open_default_transcribe_cache(enabled=None):
+    """Returns the TranscribeCache configured in src/config.py, or None if it is disabled.
+    enabled: True or False overrides the configuration."""
+    try:
+        config = _config()
+    except ImportError:
+        logger.debug("src/config.py not found, the transcribe cache is disabled")
+        return None
+    settings = config.CACHE_SETTINGS
+    if enabled is None:
+        enabled = settings["transcribe_cache_enabled"]
+    if not enabled:
+        return None
+    return TranscribeCache(config.get_transcribe_cache_dir(), settings["transcribe_cache_max_mb"]*1024*1024)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Inspect and prune the cache of transcribe results.")
+    parser.add_argument("--dir", type=str, default=None, help="Cache directory (default: from src/config.py)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="Show the number of entries and their total size")
+    p = sub.add_parser("prune", help="Remove the least recently used entries over the size limit")
+    p.add_argument("--max-mb", type=float, default=None, help="Size limit in MB (default: from src/config.py)")
+    sub.add_parser("clear", help="Remove all entries")
+    args = parser.parse_args()
+
+    config = _config()
+    cache_dir = args.dir if args.dir is not None else config.get_transcribe_cache_dir()
+    cache = TranscribeCache(cache_dir, config.CACHE_SETTINGS["transcribe_cache_max_mb"]*1024*1024)
+
+    if args.command == "stats":
+        st = cache.stats()
+        print(f"Directory: {st['dir']}")
+        print(f"Entries:   {st['entries']}")
+        print(f"Size:      {st['bytes']/2**20:.1f} MB of {st['max_bytes']/2**20:.0f} MB")
+    elif args.command == "prune":
+        max_bytes = None if args.max_mb is None else int(args.max_mb*1024*1024)
+        print(f"Removed {cache.prune(max_bytes)} entries")
+    elif args.command == "clear":
+        print(f"Removed {cache.clear()} entries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+"""Bounded store of the committed transcript of OnlineASRProcessor.
+
+OnlineASRProcessor used to keep all committed words in one list, and prompt()
+walked it backwards and joined the last 200 characters on every process_iter.
+In a server session of several hours, both the list and that walk keep
+growing. CommittedStore keeps only the words that are still needed:
+
+  - context: the words inside the audio buffer (they end after its start),
+  - prompt: the shortest suffix of the words before the audio buffer that has
+    at least `prompt_chars` characters, the init prompt for Whisper.
+
+Words that drop out of the prompt are spilled to a TranscriptLog, if there is
+one, otherwise they are forgotten. The prompt and context strings are joined
+only when they change.
+"""
+
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class TranscriptLog:
+    """Appends committed words to a text file, one per line: "beg end word", in milliseconds
+    like the output of whisper_online.py.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "a", encoding="utf-8")
+        self.words = 0
+
+    def write(self, words):
+        self.file.writelines(f"{b*1000:1.0f} {e*1000:1.0f} {t.strip()}\n" for b, e, t in words)
+        self.words += len(words)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+class CommittedStore:
+
+    def __init__(self, sep=" ", prompt_chars=200, log=None):
+        """sep: the word separator of the ASR
+        prompt_chars: the prompt is the shortest suffix of the scrolled away text with at least this many characters
+        log: TranscriptLog for the words that are no longer needed, or None
+        """
+        self.sep = sep
+        self.prompt_chars = prompt_chars
+        self.log = log
+
+        self._prompt = deque()  # (beg, end, "word"), before the audio buffer
+        self._prompt_len = 0  # characters of the words in _prompt, +1 for each separator
+        self._context = deque()  # (beg, end, "word"), in the audio buffer
+        self._offset = 0
+        self._prompt_text = ""
+        self._context_text = ""
+        self._changed = False
+
+        self.total_words = 0  # all words committed to this store
+
+    def __len__(self):
+        return len(self._prompt) + len(self._context)
+
+    def last(self):
+        """The last committed word (beg, end, "word"), or None"""
+        if self._context:
+            return self._context[-1]
+        return self._prompt[-1] if self._prompt else None
+
+    def words(self):
+        """All kept words, [(beg, end, "word"), ...]"""
+        return list(self._prompt) + list(self._context)
+
+    def context(self):
+        """The committed words inside the audio buffer, [(beg, end, "word"), ...]"""
+        return list(self._context)
+
+    def extend(self, words):
+        if not words:
+            return
+        self._context.extend(words)
+        self.total_words += len(words)
+        self._changed = True
+        self._advance()
+
+    def set_offset(self, offset):
+        """The audio buffer starts at offset (in seconds) now, the words that end before it go to the prompt."""
+        self._offset = offset
+        self._advance()
+
+    def _advance(self):
+        # the last committed word stays in the context, like in the original prompt()
+        context = self._context
+        while len(context) > 1 and context[0][1] <= self._offset:
+            w = context.popleft()
+            self._prompt.append(w)
+            self._prompt_len += len(w[2]) + 1
+            self._changed = True
+        spilled = []
+        while self._prompt and self._prompt_len - len(self._prompt[0][2]) - 1 >= self.prompt_chars:
+            w = self._prompt.popleft()
+            self._prompt_len -= len(w[2]) + 1
+            spilled.append(w)
+        if spilled and self.log is not None:
+            self.log.write(spilled)
+
+    def prompt(self):
+        """Returns (prompt, context), the same as OnlineASRProcessor.prompt"""
+        if self._changed:
+            self._prompt_text = self.sep.join(t for _, _, t in self._prompt)
+            self._context_text = self.sep.join(t for _, _, t in self._context)
+            self._changed = False
+        return self._prompt_text, self._context_text
+
+    def close(self):
+        """Spills all kept words to the log. The store is empty then."""
+        if self.log is not None:
+            self.log.write(self.words())
+            self.log.flush()
+        self._prompt.clear()
+        self._context.clear()
+        self._prompt_len = 0
+        self._changed = True
+
+
+def read_transcript(path):
+    """Reads the words of a TranscriptLog file, or of the output of whisper_online.py
+    ("emission beg end text" lines), as [(beg, end, "word"), ...] in seconds, sorted by beg.
+    The words of a multi-word line are spread evenly over its time.
+    """
+    words = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) < 3:
+                continue
+            if len(fields) >= 4 and _is_number(fields[2]):
+                fields = fields[1:]  # the emission time of whisper_online.py
+            beg, end, text = float(fields[0]) / 1000, float(fields[1]) / 1000, fields[2:]
+            step = (end - beg) / len(text)
+            words.extend((beg + i*step, beg + (i+1)*step, w) for i, w in enumerate(text))
+    words.sort(key=lambda w: w[0])
+    return words
+
+
+def _is_number(s):
+    try:
+        float(s)
+    except ValueError:
+        return False
+    return True
@@ -1,27 +1,152 @@
 #!/usr/bin/env python3
 import sys
+import os
 import numpy as np
 import librosa
-from functools import lru_cache
 import time
 import logging
+import threading
+import contextlib
+import argparse
+import multiprocessing
+import signal
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
 
 import io
 import soundfile as sf
 import math
 
+from collections import OrderedDict, deque
+from audio_cache import AudioCache
+from audio_buffer import AudioBuffer
+from transcript_store import CommittedStore, TranscriptLog, read_transcript
+from sentence_segmenter import IncrementalSentenceSegmenter, map_words_to_sentences
+from sentence_splitter import RuleSentenceSplitter
+from chunk_controller import ChunkSizeController
+from commit_policy import COMMIT_POLICIES, LocalAgreement, create_commit_policy
+from stream_metrics import StreamMetrics, MetricsExporter
+import profiling
+from speech_segments import SilenceDetector, frame_rms, energy_speech_regions, pack_windows, split_parts
+from audio_reader import open_audio_reader, parse_wav_header, MemmapWavReader, BlockResampleReader, ArrayReader
+from pcm_cache import open_default_pcm_cache, file_hash
+from transcribe_cache import open_default_transcribe_cache, CachedASR
+from ffmpeg_decoder import ffmpeg_available, decode_audio as ffmpeg_decode_audio, FFmpegStreamReader, RESAMPLERS
+
 logger = logging.getLogger(__name__)
 
-@lru_cache(10**6)
-def load_audio(fname):
+# decoded audio files, bounded by size (see audio_cache.py)
+audio_cache = AudioCache()
+
+# decoded audio files persisted across runs (see pcm_cache.py), or None if disabled. It is opened by
+# open_pcm_cache from the entry points, not on import, so that importing this module writes nothing.
+pcm_cache = None
+_pcm_cache_decided = False
+
+def open_pcm_cache(enabled=None):
+    """Opens the pcm cache configured in src/config.py, or disables it with enabled=False.
+    With enabled=None, an earlier decision is kept (e.g. --no-pcm-cache). Returns the cache or None."""
+    global pcm_cache, _pcm_cache_decided
+    if enabled is None:
+        if _pcm_cache_decided:
+            return pcm_cache
+        enabled = True
+    pcm_cache = open_default_pcm_cache() if enabled else None
+    _pcm_cache_decided = True
+    return pcm_cache
+
+# "librosa" or "ffmpeg" (see ffmpeg_decoder.py), and ffmpeg's resampler quality. Set by set_audio_decoder.
+audio_decoder = "librosa"
+resample_quality = "default"
+
+def set_audio_decoder(decoder, quality="default"):
+    global audio_decoder, resample_quality
+    if decoder == "ffmpeg" and not ffmpeg_available():
+        logger.warning("ffmpeg not found, using librosa for decoding audio")
+        decoder = "librosa"
+    audio_decoder = decoder
+    resample_quality = quality
+
+def _decode_whole(fname):
+    if audio_decoder == "ffmpeg":
+        return ffmpeg_decode_audio(fname, quality=resample_quality)
     a, _ = librosa.load(fname, sr=16000, dtype=np.float32)
     return a
 
+def pcm_cache_decoder():
+    """The decoder and its settings that the pcm cache entries are keyed by, the samples differ between them."""
+    if audio_decoder == "ffmpeg":
+        return f"ffmpeg:{resample_quality}"
+    return audio_decoder
+
+def load_audio_into_pcm_cache(fname, cache):
+    """Returns the memory-mapped decoded audio of fname from the pcm cache. On a miss, it decodes
+    and stores it first."""
+    key = file_hash(fname, pcm_cache_decoder())
+    audio = cache.get(fname, key=key)
+    if audio is None and audio_decoder == "ffmpeg":
+        audio = cache.put(fname, _decode_whole(fname), key=key)
+    elif audio is None:
+        try:
+            with open_audio_reader(fname) as reader:
+                # block by block, in bounded memory
+                audio = cache.put_from_reader(fname, reader, key=key)
+        except (RuntimeError, TypeError, ValueError):
+            # soundfile can't open or seek in this format
+            audio = cache.put(fname, _decode_whole(fname), key=key)
+    return audio
+
+def _decode_audio(fname):
+    # 16 kHz mono WAV is read directly, caching it would only duplicate it
+    if pcm_cache is not None and not MemmapWavReader.supports(parse_wav_header(fname)):
+        return load_audio_into_pcm_cache(fname, pcm_cache)
+    return _decode_whole(fname)
+
+def load_audio(fname):
+    return audio_cache.get(fname, _decode_audio)
+
+# random-access readers used by load_audio_chunk (see audio_reader.py), the least recently used is closed first
+_audio_readers = OrderedDict()
+MAX_OPEN_AUDIO_READERS = 8
+
+def _open_audio_reader(fname):
+    if audio_decoder == "ffmpeg" and pcm_cache is None:
+        header = parse_wav_header(fname)
+        if MemmapWavReader.supports(header):
+            return MemmapWavReader(fname, header)
+        # consecutive windows are streamed from one ffmpeg process
+        return FFmpegStreamReader(fname, quality=resample_quality)
+    reader = open_audio_reader(fname, loader=load_audio)
+    if pcm_cache is not None and isinstance(reader, BlockResampleReader):
+        # resampling again on every run is what the pcm cache is for
+        reader.close()
+        reader = ArrayReader(load_audio(fname))
+    return reader
+
+def get_audio_reader(fname):
+    key = os.path.abspath(fname)
+    reader = _audio_readers.get(key)
+    if reader is None:
+        reader = _open_audio_reader(fname)
+        _audio_readers[key] = reader
+        while len(_audio_readers) > MAX_OPEN_AUDIO_READERS:
+            _, r = _audio_readers.popitem(last=False)
+            r.close()
+    else:
+        _audio_readers.move_to_end(key)
+    return reader
+
 def load_audio_chunk(fname, beg, end):
-    audio = load_audio(fname)
-    beg_s = int(beg*16000)
-    end_s = int(end*16000)
-    return audio[beg_s:end_s]
+    if fname in audio_cache:  # already decoded whole, slicing it is the cheapest
+        audio = load_audio(fname)
+        beg_s = int(beg*16000)
+        end_s = int(end*16000)
+        return audio[beg_s:end_s]
+    # decodes only the [beg, end) window
+    return get_audio_reader(fname).read(beg, end)
+
+def audio_duration(fname):
+    """Duration in seconds, without decoding the whole file if possible."""
+    return get_audio_reader(fname).duration
 
 
 # Whisper backend
@@ -40,8 +165,29 @@ class ASRBase:
         else:
             self.original_language = lan
 
+        self.model_name = model_dir or modelsize
         self.model = self.load_model(modelsize, cache_dir, model_dir)
 
+    def reset_options(self, lan):
+        """Sets the language and drops the options of use_vad and set_translate_task, for reusing the loaded model."""
+        self.transcribe_kargs = {}
+        self.original_language = None if lan == "auto" else lan
+
+
+    # True if transcribe_batch decodes the audios in one batched call, not one by one
+    supports_batch = False
+
+    def cache_key(self):
+        """Everything but the audio and the prompt that the result of transcribe depends on, for transcribe_cache.py"""
+        return (type(self).__name__, self.model_name, self.original_language, sorted(self.transcribe_kargs.items()))
+
+    def batch_cache_key(self):
+        """Like cache_key, for the results of transcribe_batch, which decodes differently than transcribe"""
+        return self.cache_key() + ("batch",)
+
+    # time of the audio passed to transcribe in the whole stream, in seconds. Set by the callers,
+    # only the replay backend needs it.
+    stream_offset = 0.0
 
     def load_model(self, modelsize, cache_dir):
         raise NotImplemented("must be implemented in the child class")
@@ -49,6 +195,23 @@ class ASRBase:
     def transcribe(self, audio, init_prompt=""):
         raise NotImplemented("must be implemented in the child class")
 
+    def word_confidences(self, res):
+        """The confidences (0..1) of the words of ts_words(res), or None if the backend has none."""
+        return None
+
+    def transcribe_stream(self, audio, init_prompt=""):
+        """Like transcribe, but yields the result in pieces as they are decoded, every one can be passed to
+        ts_words and segments_end_ts. The caller may stop iterating, then the rest is not decoded.
+        This one yields the whole result at once, the backends that decode lazily override it.
+        """
+        yield self.transcribe(audio, init_prompt=init_prompt)
+
+    def transcribe_batch(self, audios):
+        """Transcribes every audio of the list, without a prompt.
+        Returns: for every audio, the words of every segment [[(beg, end, "word"), ...], ...], in seconds from its start.
+        """
+        return [segment_words(self, self.transcribe(a), 0) for a in audios]
+
     def use_vad(self):
         raise NotImplemented("must be implemented in the child class")
 
@@ -88,6 +251,9 @@ class WhisperTimestampedASR(ASRBase):
     def segments_end_ts(self, res):
         return [s["end"] for s in res["segments"]]
 
+    def word_confidences(self, res):
+        return [w.get("confidence", 0.0) * (1 - s.get("no_speech_prob", 0.0)) for s in res["segments"] for w in s["words"]]
+
     def use_vad(self):
         self.transcribe_kargs["vad"] = True
 
@@ -97,12 +263,66 @@ class WhisperTimestampedASR(ASRBase):
 
 
 
+# device and compute type of faster-whisper (CTranslate2), see --device and --compute-type
+DEVICES = ["auto", "cuda", "cpu"]
+COMPUTE_TYPES = ["auto", "int8", "int8_float32", "float32", "int8_float16", "float16"]
+CUDA_ONLY_COMPUTE_TYPES = ("int8_float16", "float16")
+
+def cuda_device_count():
+    """Number of CUDA devices usable by CTranslate2, 0 without them or without ctranslate2."""
+    try:
+        import ctranslate2
+        return ctranslate2.get_cuda_device_count()
+    except Exception:  # ImportError, or a broken CUDA installation
+        return 0
+
+def resolve_device(device="auto", compute_type="auto", cuda_devices=None):
+    """Returns (device, compute_type) for faster-whisper.
+    "auto" device is cuda if there is a CUDA device, otherwise cpu. Without CUDA, cuda falls back
+    to cpu, and the compute types that need a GPU fall back to int8, the fastest one on CPU.
+    "auto" compute type is float16 on cuda and int8 on cpu.
+    """
+    if cuda_devices is None:
+        cuda_devices = cuda_device_count()
+    if device == "auto":
+        device = "cuda" if cuda_devices > 0 else "cpu"
+    elif device == "cuda" and cuda_devices == 0:
+        logger.warning("CUDA is not available, faster-whisper runs on CPU")
+        device = "cpu"
+    if compute_type == "auto":
+        compute_type = "float16" if device == "cuda" else "int8"
+    elif device == "cpu" and compute_type in CUDA_ONLY_COMPUTE_TYPES:
+        logger.warning(f"compute type {compute_type} is not supported on CPU, using int8")
+        compute_type = "int8"
+    return device, compute_type
+
 class FasterWhisperASR(ASRBase):
     """Uses faster-whisper library as the backend. Works much faster, appx 4-times (in offline mode). For GPU, it requires installation with a specific CUDNN version.
+    On CPU, int8 is the fastest compute type; see benchmarks/bench_rtf.py.
     """
 
     sep = ""
 
+    def __init__(self, lan, modelsize=None, cache_dir=None, model_dir=None, logfile=sys.stderr,
+                 device="auto", compute_type="auto", cpu_threads=0, num_workers=1):
+        """device: auto, cuda or cpu. compute_type: one of COMPUTE_TYPES, see resolve_device.
+        cpu_threads: threads per transcription on CPU, 0 for the CTranslate2 default.
+        num_workers: number of transcriptions that can run in parallel from several threads.
+        """
+        self.device, self.compute_type = resolve_device(device, compute_type)
+        self.cpu_threads = cpu_threads
+        self.num_workers = num_workers
+        super().__init__(lan, modelsize=modelsize, cache_dir=cache_dir, model_dir=model_dir, logfile=logfile)
+
+    def cache_key(self):
+        return super().cache_key() + (self.device, self.compute_type)
+
+    def batch_cache_key(self):
+        # the options of transcribe_batch: the pipeline runs without vad_filter
+        kargs = sorted((k, v) for k, v in self.transcribe_kargs.items() if k != "vad_filter")
+        return (type(self).__name__, self.model_name, self.original_language, kargs, self.device, self.compute_type,
+                "batch", ("vad_filter", False), ("word_timestamps", True))
+
     def load_model(self, modelsize=None, cache_dir=None, model_dir=None):
         from faster_whisper import WhisperModel
 #        logging.getLogger("faster_whisper").setLevel(logger.level)
@@ -114,17 +334,12 @@ class FasterWhisperASR(ASRBase):
         else:
             raise ValueError("modelsize or model_dir parameter must be set")
 
-
-        # this worked fast and reliably on NVIDIA L40
-        model = WhisperModel(model_size_or_path, device="cuda", compute_type="float16", download_root=cache_dir)
-
-        # or run on GPU with INT8
-        # tested: the transcripts were different, probably worse than with FP16, and it was slightly (appx 20%) slower
-        #model = WhisperModel(model_size, device="cuda", compute_type="int8_float16")
-
-        # or run on CPU with INT8
-        # tested: works, but slow, appx 10-times than cuda FP16
-#        model = WhisperModel(modelsize, device="cpu", compute_type="int8") #, download_root="faster-disk-cache-dir/")
+        # float16 on cuda worked fast and reliably on NVIDIA L40.
+        # int8_float16 on cuda: the transcripts were different, probably worse than with FP16, and it was slightly (appx 20%) slower.
+        # int8 on cpu: works, appx 10-times slower than cuda FP16.
+        logger.info(f"faster-whisper on {self.device}, compute type {self.compute_type}, {self.cpu_threads or 'default'} cpu threads, {self.num_workers} workers")
+        model = WhisperModel(model_size_or_path, device=self.device, compute_type=self.compute_type,
+                             cpu_threads=self.cpu_threads, num_workers=self.num_workers, download_root=cache_dir)
         return model
 
     def transcribe(self, audio, init_prompt=""):
@@ -135,6 +350,12 @@ class FasterWhisperASR(ASRBase):
 
         return list(segments)
 
+    def transcribe_stream(self, audio, init_prompt=""):
+        # the segments generator decodes a 30-second window when its first segment is requested
+        segments, info = self.model.transcribe(audio, language=self.original_language, initial_prompt=init_prompt, beam_size=5, word_timestamps=True, condition_on_previous_text=True, **self.transcribe_kargs)
+        for segment in segments:
+            yield [segment]
+
     def ts_words(self, segments):
         o = []
         for segment in segments:
@@ -150,6 +371,42 @@ class FasterWhisperASR(ASRBase):
     def segments_end_ts(self, res):
         return [s.end for s in res]
 
+    def word_confidences(self, segments):
+        return [word.probability * (1 - segment.no_speech_prob)
+                for segment in segments if segment.no_speech_prob <= 0.9 for word in segment.words]
+
+    @property
+    def supports_batch(self):
+        # BatchedInferencePipeline is in faster-whisper 1.1 and newer
+        try:
+            from faster_whisper import BatchedInferencePipeline
+        except ImportError:
+            return False
+        return True
+
+    def transcribe_batch(self, audios):
+        """Transcribes the audios in batches of BatchedInferencePipeline: they are concatenated, and every
+        audio is one clip of up to 30 seconds, so that len(audios) clips are decoded together.
+        """
+        if getattr(self, "_batched", None) is None:
+            from faster_whisper import BatchedInferencePipeline
+            self._batched = BatchedInferencePipeline(model=self.model)
+        # the pipeline slices the audio by the clip bounds, so they are sample indices, not seconds
+        bounds = np.cumsum([0] + [len(a) for a in audios])
+        clips = [{"start": int(b), "end": int(e)} for b, e in zip(bounds[:-1], bounds[1:])]
+        starts = bounds / 16000
+        kargs = {k: v for k, v in self.transcribe_kargs.items() if k != "vad_filter"}
+        segments, info = self._batched.transcribe(np.concatenate(audios), language=self.original_language, batch_size=len(audios),
+                                                  word_timestamps=True, vad_filter=False, clip_timestamps=clips, **kargs)
+        out = [[] for _ in audios]
+        for segment in segments:
+            if segment.no_speech_prob > 0.9 or not segment.words:
+                continue
+            # the clip of the segment, and the times from the clip start
+            i = min(max(int(np.searchsorted(starts, segment.start + 0.01, side="right")) - 1, 0), len(audios) - 1)
+            out[i].append([(w.start - starts[i], w.end - starts[i], w.word) for w in segment.words])
+        return out
+
     def use_vad(self):
         self.transcribe_kargs["vad_filter"] = True
 
@@ -262,6 +519,14 @@ class MLXWhisper(ASRBase):
     def segments_end_ts(self, res):
         return [s['end'] for s in res]
 
+    def word_confidences(self, segments):
+        return [
+            word.get("probability", 0.0) * (1 - segment.get("no_speech_prob", 0))
+            for segment in segments
+            for word in segment.get("words", [])
+            if segment.get("no_speech_prob", 0) <= 0.9
+        ]
+
     def use_vad(self):
         self.transcribe_kargs["vad_filter"] = True
 
@@ -353,27 +618,141 @@ class OpenaiApiASR(ASRBase):
     def set_translate_task(self):
         self.task = "translate"
 
+    def cache_key(self):
+        return (type(self).__name__, self.modelname, self.original_language, self.task, self.use_vad_opt, self.temperature)
 
+    def reset_options(self, lan):
+        self.original_language = None if lan == "auto" else lan
+        self.use_vad_opt = False
+        self.task = "transcribe"
+
+
+
+
+class ReplayASR(ASRBase):
+    """Fake backend without a model, for benchmarking and testing the rest of the pipeline (--backend replay).
+    It replays the words of a recording (--replay-file: a --transcript-log file, or the output of whisper_online.py),
+    or it generates the words "w0 w1 ..." of a synthetic speaker, one every word_seconds, with a full stop
+    after every 8th word. transcribe returns the words inside the audio, found by stream_offset, and sleeps for
+    latency seconds plus rtf times the audio length, to simulate the processing time of a model.
+    The output is deterministic: the same audio at the same stream_offset gives the same words.
+    """
+
+    sep = " "
+
+    def __init__(self, lan, replay_file=None, latency=0.0, rtf=0.0, word_seconds=0.5, logfile=sys.stderr):
+        self.replay_file = replay_file
+        self.latency = latency
+        self.rtf = rtf
+        self.word_seconds = word_seconds
+        self.calls = 0
+        super().__init__(lan, logfile=logfile)
+
+    def load_model(self, modelsize=None, cache_dir=None, model_dir=None):
+        if self.replay_file is None:
+            return None
+        words = read_transcript(self.replay_file)
+        logger.info(f"replaying {len(words)} words from {self.replay_file}")
+        self.begs = np.array([w[0] for w in words])
+        self.ends = np.array([w[1] for w in words])
+        return words
+
+    def transcribe(self, audio, init_prompt=""):
+        self.calls += 1
+        seconds = len(audio) / 16000
+        delay = self.latency + self.rtf * seconds
+        if delay > 0:
+            time.sleep(delay)
+        return self._words(seconds)
+
+    def transcribe_stream(self, audio, init_prompt=""):
+        """Yields the words segment by segment, the rtf part of the delay is spread over the segments."""
+        self.calls += 1
+        seconds = len(audio) / 16000
+        if self.latency > 0:
+            time.sleep(self.latency)
+        words = self._words(seconds)
+        prev = 0.0
+        for end in self.segments_end_ts(words):
+            segment = [w for w in words if prev < w[1] <= end]
+            if self.rtf > 0:
+                time.sleep(self.rtf * (end - prev))
+            prev = end
+            yield segment
+
+    def _words(self, seconds):
+        beg = self.stream_offset
+        end = beg + seconds
+        if self.model is None:
+            d = self.word_seconds
+            first = max(0, math.ceil(beg / d - 1e-9))
+            last = int((end - 0.2*d) / d)  # the last word must end inside the audio
+            return [(k*d - beg, k*d + 0.8*d - beg, f"w{k}." if k % 8 == 7 else f"w{k}") for k in range(first, last)]
+        i = int(np.searchsorted(self.begs, beg, side="left"))
+        j = int(np.searchsorted(self.ends, end, side="right"))
+        return [(b - beg, e - beg, w) for b, e, w in self.model[i:max(i, j)] if e <= end]
+
+    def cache_key(self):
+        # the words depend on the time of the audio, not on its samples
+        return super().cache_key() + (self.replay_file, self.word_seconds, self.stream_offset)
+
+    def ts_words(self, r):
+        return r
+
+    def segments_end_ts(self, r):
+        # a segment ends with a sentence, and with the last word
+        return [e for b, e, w in r[:-1] if w.endswith((".", "?", "!"))] + [e for b, e, w in r[-1:]]
+
+    def use_vad(self):
+        self.transcribe_kargs["vad_filter"] = True
+
+    def set_translate_task(self):
+        self.transcribe_kargs["task"] = "translate"
 
 
 class HypothesisBuffer:
+    """Keeps the last hypotheses of the words after the last commit, and the committed words that are
+    still in the audio buffer. Words are compared by interned integer ids. The committed words are in deques,
+    they are dropped from the front in O(1), and every step is a single pass over the hypothesis.
+    Which words are committed decides the policy of commit_policy.py, LocalAgreement-2 by default.
+    """
+
+    # pop_commited interns the held words again when the vocabulary is this many times larger than them,
+    # so it doesn't grow with the whole stream; it's amortized O(1) per word
+    VOCAB_SLACK = 4
+    MIN_VOCAB = 1024
 
-    def __init__(self, logfile=sys.stderr):
-        self.commited_in_buffer = []
+    def __init__(self, logfile=sys.stderr, policy=None):
+        self.policy = policy if policy is not None else LocalAgreement(2)
+        self.commited_in_buffer = deque()  # (beg, end, "word")
+        self.commited_ids = deque()  # word ids of commited_in_buffer
         self.buffer = []
+        self.buffer_ids = []
+        self.older = deque()  # (words, ids) of the hypotheses before buffer, for LocalAgreement with n > 2
         self.new = []
+        self.new_ids = []
+        self.new_conf = None  # confidences of the new words, or None
 
         self.last_commited_time = 0
         self.last_commited_word = None
 
         self.logfile = logfile
 
-    def insert(self, new, offset):
+        self.vocab = {}  # word -> id
+
+    def word_ids(self, words):
+        vocab = self.vocab
+        return [vocab.setdefault(w[2], len(vocab)) for w in words]
+
+    def insert(self, new, offset, confidences=None):
         # compare self.commited_in_buffer and new. It inserts only the words in new that extend the commited_in_buffer, it means they are roughly behind last_commited_time and new in content
         # the new tail is added to self.new
-        
-        new = [(a+offset,b+offset,t) for a,b,t in new]
-        self.new = [(a,b,t) for a,b,t in new if a > self.last_commited_time-0.1]
+        # confidences: of the words in new (ASRBase.word_confidences), or None
+
+        keep = [a+offset > self.last_commited_time-0.1 for a,b,t in new]
+        self.new = [(a+offset,b+offset,t) for (a,b,t), k in zip(new, keep) if k]
+        self.new_ids = self.word_ids(self.new)
+        self.new_conf = None if confidences is None else [c for c, k in zip(confidences, keep) if k]
 
         if len(self.new) >= 1:
             a,b,t = self.new[0]
@@ -383,42 +762,79 @@ class HypothesisBuffer:
                     cn = len(self.commited_in_buffer)
                     nn = len(self.new)
                     for i in range(1,min(min(cn,nn),5)+1):  # 5 is the maximum 
-                        c = " ".join([self.commited_in_buffer[-j][2] for j in range(1,i+1)][::-1])
-                        tail = " ".join(self.new[j-1][2] for j in range(1,i+1))
-                        if c == tail:
-                            words = []
-                            for j in range(i):
-                                words.append(repr(self.new.pop(0)))
-                            words_msg = " ".join(words)
+                        c = [self.commited_ids[-j] for j in range(i,0,-1)]
+                        if c == self.new_ids[:i]:
+                            words_msg = " ".join(repr(w) for w in self.new[:i])
                             logger.debug(f"removing last {i} words: {words_msg}")
+                            del self.new[:i]
+                            del self.new_ids[:i]
+                            if self.new_conf is not None:
+                                del self.new_conf[:i]
                             break
 
-    def flush(self):
-        # returns commited chunk = the longest common prefix of 2 last inserts. 
-
-        commit = []
-        while self.new:
-            na, nb, nt = self.new[0]
-
-            if len(self.buffer) == 0:
-                break
-
-            if nt == self.buffer[0][2]:
-                commit.append((na,nb,nt))
-                self.last_commited_word = nt
-                self.last_commited_time = nb
-                self.buffer.pop(0)
-                self.new.pop(0)
-            else:
-                break
-        self.buffer = self.new
+    def previous_ids(self):
+        """The word ids of the previous hypotheses, the oldest first, the last one is buffer_ids."""
+        return [ids for _, ids in self.older] + [self.buffer_ids]
+
+    def commit_decided(self, now=None):
+        """True if flush would commit the same words even if more words were appended to the last insert,
+        e.g. with LocalAgreement-2: they differ from the previous hypothesis, or they are longer than it.
+        Until there are enough words for the n-gram check of insert, it's not decided."""
+        if len(self.new) < min(len(self.commited_in_buffer), 5):
+            return False
+        return self.policy.decided(self, now)
+
+    def flush(self, now=None):
+        # returns commited chunk, by default the longest common prefix of 2 last inserts.
+        # now: the end of the audio buffer in seconds, for the time-based policies and the commit delays
+
+        k = self.policy.commit_length(self, now)
+        self.policy.record(self, k, now)
+
+        commit = self.new[:k]
+        commit_ids = self.new_ids[:k]
+        if k:
+            self.last_commited_word = commit[-1][2]
+            self.last_commited_time = commit[-1][1]
+            self.commited_in_buffer.extend(commit)
+            self.commited_ids.extend(commit_ids)
+        if self.policy.n > 2:
+            self.older.append((self.buffer, self.buffer_ids))
+            while len(self.older) > self.policy.n - 2:
+                self.older.popleft()
+            if k:
+                self.older = deque(self.without_commit(w, ids, commit_ids) for w, ids in self.older)
+        self.buffer = self.new[k:]
+        self.buffer_ids = self.new_ids[k:]
         self.new = []
-        self.commited_in_buffer.extend(commit)
+        self.new_ids = []
+        self.new_conf = None
         return commit
 
+    def without_commit(self, words, ids, commit_ids):
+        """An older hypothesis without the committed words: without the prefix if it agrees, otherwise
+        without the words before the last commit, like in insert."""
+        k = len(commit_ids)
+        if ids[:k] == commit_ids:
+            return words[k:], ids[k:]
+        keep = [i for i, (a, b, t) in enumerate(words) if a > self.last_commited_time-0.1]
+        return [words[i] for i in keep], [ids[i] for i in keep]
+
     def pop_commited(self, time):
         while self.commited_in_buffer and self.commited_in_buffer[0][1] <= time:
-            self.commited_in_buffer.pop(0)
+            self.commited_in_buffer.popleft()
+            self.commited_ids.popleft()
+        held = len(self.commited_in_buffer) + len(self.buffer) + len(self.new) + sum(len(w) for w, _ in self.older)
+        if len(self.vocab) > max(self.MIN_VOCAB, self.VOCAB_SLACK*held):
+            self.rebuild_vocab()
+
+    def rebuild_vocab(self):
+        """Interns only the words that are still held, with new ids. Equal words keep equal ids."""
+        self.vocab = {}
+        self.commited_ids = deque(self.word_ids(self.commited_in_buffer))
+        self.buffer_ids = self.word_ids(self.buffer)
+        self.new_ids = self.word_ids(self.new)
+        self.older = deque((w, self.word_ids(w)) for w, _ in self.older)
 
     def complete(self):
         return self.buffer
@@ -427,16 +843,43 @@ class OnlineASRProcessor:
 
     SAMPLING_RATE = 16000
 
-    def __init__(self, asr, tokenizer=None, buffer_trimming=("segment", 15), logfile=sys.stderr):
+    def __init__(self, asr, tokenizer=None, buffer_trimming=("segment", 15), logfile=sys.stderr, transcript_log=None,
+                 chunk_controller=None, skip_silence=False, tail_context=2.0, lazy_segments=False, commit_policy=None,
+                 metrics=None):
         """asr: WhisperASR object
         tokenizer: sentence tokenizer object for the target language. Must have a method *split* that behaves like the one of MosesTokenizer. It can be None, if "segment" buffer trimming option is used, then tokenizer is not used at all.
         ("segment", 15)
-        buffer_trimming: a pair of (option, seconds), where option is either "sentence" or "segment", and seconds is a number. Buffer is trimmed if it is longer than "seconds" threshold. Default is the most recommended option.
+        buffer_trimming: a pair of (option, seconds), where option is either "sentence", "segment" or "word", and seconds is a number. Buffer is trimmed if it is longer than "seconds" threshold. Default is the most recommended option.
+            "word" trims the buffer after every commit, so that it's only the uncommitted tail and tail_context seconds of committed words. The trimming of the segments longer than "seconds" is kept as a fallback.
         logfile: where to store the log. 
+        transcript_log: file name or TranscriptLog where the committed words are appended when they are no longer needed for the prompt, or None to forget them.
+        chunk_controller: ChunkSizeController that adapts the chunk size (see chunk_size) and possibly the buffer trimming threshold to the transcribe time, or None.
+        tail_context: seconds of committed audio that stay in the buffer with the "word" buffer trimming, the acoustic context of the tail.
+        lazy_segments: if True, process_iter consumes the segments of transcribe_stream as they are decoded, and it stops decoding when the words of this commit are decided (see HypothesisBuffer.commit_decided). The next hypothesis is then shorter.
+        commit_policy: the policy of commit_policy.py that decides which words are committed, or None for LocalAgreement-2.
+        metrics: StreamMetrics where every process_iter records its timing, or None.
+        skip_silence: if True, process_iter does not call transcribe when the audio inserted since the last call is silence and there is no uncommitted text that it could confirm.
         """
         self.asr = asr
+        self.controller = chunk_controller
+        self.skip_silence = skip_silence
+        self.tail_context = tail_context
+        self.lazy_segments = lazy_segments
+        self.commit_policy = commit_policy if commit_policy is not None else LocalAgreement(2)
+        self.metrics = metrics
+        if metrics is not None:
+            # one definition of the commit delay: the policy records it, the metrics export it
+            metrics.histograms["commit_delay_seconds"] = self.commit_policy.delays
+        self.early_stops = 0  # process_iter calls that stopped decoding before the end of the buffer
+        # process_iter calls, and the ones that skipped transcribe because its outcome could not change
+        self.iterations = 0
+        self.skipped_iterations = 0
         self.tokenizer = tokenizer
         self.logfile = logfile
+        if isinstance(transcript_log, str):
+            transcript_log = TranscriptLog(transcript_log)
+        self.transcript_log = transcript_log
+        self.commited = None
 
         self.init()
 
@@ -444,35 +887,41 @@ class OnlineASRProcessor:
 
     def init(self, offset=None):
         """run this when starting or restarting processing"""
-        self.audio_buffer = np.array([],dtype=np.float32)
-        self.transcript_buffer = HypothesisBuffer(logfile=self.logfile)
+        self.audio_buffer = AudioBuffer()
+        self.transcript_buffer = HypothesisBuffer(logfile=self.logfile, policy=self.commit_policy)
         self.buffer_time_offset = 0
         if offset is not None:
             self.buffer_time_offset = offset
         self.transcript_buffer.last_commited_time = self.buffer_time_offset
-        self.commited = []
+        if self.commited is not None:
+            self.commited.close()
+        self.commited = CommittedStore(sep=self.asr.sep, log=self.transcript_log)
+        self.commited.set_offset(self.buffer_time_offset)
+        self.segmenter = IncrementalSentenceSegmenter(self.tokenizer) if self.tokenizer is not None else None
+
+        # the audio inserted since the last transcribe: its length, and if it has speech
+        self.new_samples = 0
+        self.new_speech = False
+        self.silence = SilenceDetector()
+        # True after a transcribe over new audio without speech that gave no new words, committed or not
+        self.settled = False
 
     def insert_audio_chunk(self, audio):
-        self.audio_buffer = np.append(self.audio_buffer, audio)
+        self.audio_buffer.append(audio)
+        self.new_samples += len(audio)
+        if self.skip_silence:
+            speech = not self.silence.is_silence(audio)
+            self.new_speech = self.new_speech or speech
+
+    def chunk_size(self, default):
+        """Seconds of new audio to wait for before the next process_iter: the one of the chunk controller, or default."""
+        return default if self.controller is None else self.controller.chunk_size
 
     def prompt(self):
         """Returns a tuple: (prompt, context), where "prompt" is a 200-character suffix of commited text that is inside of the scrolled away part of audio buffer. 
         "context" is the commited text that is inside the audio buffer. It is transcribed again and skipped. It is returned only for debugging and logging reasons.
         """
-        k = max(0,len(self.commited)-1)
-        while k > 0 and self.commited[k-1][1] > self.buffer_time_offset:
-            k -= 1
-
-        p = self.commited[:k]
-        p = [t for _,_,t in p]
-        prompt = []
-        l = 0
-        while p and l < 200:  # 200 characters prompt size
-            x = p.pop(-1)
-            l += len(x)+1
-            prompt.append(x)
-        non_prompt = self.commited[k:]
-        return self.asr.sep.join(prompt[::-1]), self.asr.sep.join(t for _,_,t in non_prompt)
+        return self.commited.prompt()
 
     def process_iter(self):
         """Runs on the current audio buffer.
@@ -480,55 +929,154 @@ class OnlineASRProcessor:
         The non-emty text is confirmed (committed) partial transcript.
         """
 
-        prompt, non_prompt = self.prompt()
+        self.iterations += 1
+        if self.metrics is not None:
+            self.metrics.inc("iterations")
+        if self.can_skip():
+            self.skipped_iterations += 1
+            if self.metrics is not None:
+                self.metrics.inc("skipped_iterations")
+            logger.debug(f"skipping transcribe, {self.new_samples/self.SAMPLING_RATE:2.2f} seconds of new audio without speech")
+            self.trim_silence()
+            return (None, None, "")
+        new_seconds = self.new_samples/self.SAMPLING_RATE
+        new_speech = self.new_speech
+        self.new_samples = 0
+        self.new_speech = False
+
+        with profiling.span("prompt"):
+            prompt, non_prompt = self.prompt()
         logger.debug(f"PROMPT: {prompt}")
         logger.debug(f"CONTEXT: {non_prompt}")
         logger.debug(f"transcribing {len(self.audio_buffer)/self.SAMPLING_RATE:2.2f} seconds from {self.buffer_time_offset:2.2f}")
-        res = self.asr.transcribe(self.audio_buffer, init_prompt=prompt)
+        self.asr.stream_offset = self.buffer_time_offset
+        now = self.buffer_time_offset + len(self.audio_buffer)/self.SAMPLING_RATE
+        t = time.perf_counter()
+        if self.lazy_segments:
+            with profiling.span("transcribe"):
+                tsw, ends = self.transcribe_lazily(prompt, now)
+        else:
+            with profiling.span("transcribe"):
+                res = self.asr.transcribe(self.audio_buffer.view(), init_prompt=prompt)
+            with profiling.span("ts_words"):
+                # transform to [(beg,end,"word1"), ...]
+                tsw = self.asr.ts_words(res)
+                ends = self.asr.segments_end_ts(res)
+                confidences = self.asr.word_confidences(res)
+            with profiling.span("insert"):
+                self.transcript_buffer.insert(tsw, self.buffer_time_offset, confidences)
+        elapsed = time.perf_counter() - t
+        if self.controller is not None:
+            self.controller.update(elapsed, len(self.audio_buffer)/self.SAMPLING_RATE)
+            if self.controller.buffer_trimming_sec is not None:
+                self.buffer_trimming_sec = self.controller.buffer_trimming_sec
+
+        with profiling.span("flush"):
+            o = self.transcript_buffer.flush(now)
+            self.commited.extend(o)
+            if self.buffer_trimming_way == "sentence":
+                self.segmenter.add(o)
+        self.settled = not new_speech and not o and not self.transcript_buffer.buffer
+        if self.metrics is not None:
+            self.record_metrics(elapsed, new_seconds, o)
+        with profiling.span("to_flush"):
+            completed = self.to_flush(o)
+            logger.debug(f">>>>COMPLETE NOW: {completed}")
+            the_rest = self.to_flush(self.transcript_buffer.complete())
+            logger.debug(f"INCOMPLETE: {the_rest}")
+
+        # there is a newly confirmed text
 
-        # transform to [(beg,end,"word1"), ...]
-        tsw = self.asr.ts_words(res)
+        with profiling.span("chunking"):
+            if o and self.buffer_trimming_way == "sentence":  # trim the completed sentences
+                if len(self.audio_buffer)/self.SAMPLING_RATE > self.buffer_trimming_sec:  # longer than this
+                    self.chunk_completed_sentence()
 
-        self.transcript_buffer.insert(tsw, self.buffer_time_offset)
-        o = self.transcript_buffer.flush()
-        self.commited.extend(o)
-        completed = self.to_flush(o)
-        logger.debug(f">>>>COMPLETE NOW: {completed}")
-        the_rest = self.to_flush(self.transcript_buffer.complete())
-        logger.debug(f"INCOMPLETE: {the_rest}")
+            if o and self.buffer_trimming_way == "word":  # trim the committed words
+                self.chunk_committed_words()
 
-        # there is a newly confirmed text
+            if self.buffer_trimming_way in ("segment", "word"):
+                s = self.buffer_trimming_sec  # trim the completed segments longer than s,
+            else:
+                s = 30 # if the audio buffer is longer than 30s, trim it
 
-        if o and self.buffer_trimming_way == "sentence":  # trim the completed sentences
-            if len(self.audio_buffer)/self.SAMPLING_RATE > self.buffer_trimming_sec:  # longer than this
-                self.chunk_completed_sentence()
+            if len(self.audio_buffer)/self.SAMPLING_RATE > s:
+                self.chunk_completed_segment(ends)
 
-        
-        if self.buffer_trimming_way == "segment":
-            s = self.buffer_trimming_sec  # trim the completed segments longer than s,
-        else:
-            s = 30 # if the audio buffer is longer than 30s, trim it
-        
-        if len(self.audio_buffer)/self.SAMPLING_RATE > s:
-            self.chunk_completed_segment(res)
-
-            # alternative: on any word
-            #l = self.buffer_time_offset + len(self.audio_buffer)/self.SAMPLING_RATE - 10
-            # let's find commited word that is less
-            #k = len(self.commited)-1
-            #while k>0 and self.commited[k][1] > l:
-            #    k -= 1
-            #t = self.commited[k][1] 
-            logger.debug("chunking segment")
-            #self.chunk_at(t)
+                # alternative: on any word
+                #l = self.buffer_time_offset + len(self.audio_buffer)/self.SAMPLING_RATE - 10
+                # let's find commited word that is less
+                #k = len(self.commited)-1
+                #while k>0 and self.commited[k][1] > l:
+                #    k -= 1
+                #t = self.commited[k][1] 
+                logger.debug("chunking segment")
+                #self.chunk_at(t)
 
         logger.debug(f"len of buffer now: {len(self.audio_buffer)/self.SAMPLING_RATE:2.2f}")
         return self.to_flush(o)
 
+    def transcribe_lazily(self, prompt, now):
+        """Inserts the words of transcribe_stream into the transcript buffer segment by segment, until the commit
+        is decided. Returns the words and the segment ends that were decoded."""
+        tsw, ends, conf = [], [], []
+        stream = self.asr.transcribe_stream(self.audio_buffer.view(), init_prompt=prompt)
+        try:
+            for r in stream:
+                tsw.extend(self.asr.ts_words(r))
+                ends.extend(self.asr.segments_end_ts(r))
+                c = self.asr.word_confidences(r)
+                conf = None if conf is None or c is None else conf + c
+                self.transcript_buffer.insert(tsw, self.buffer_time_offset, conf)
+                if self.transcript_buffer.commit_decided(now):
+                    break
+            else:
+                return tsw, ends
+        finally:
+            stream.close()
+        self.early_stops += 1
+        if self.metrics is not None:
+            self.metrics.inc("early_stops")
+        logger.debug(f"commit decided, stopped decoding after {len(ends)} segments")
+        return tsw, ends
+
+    def record_metrics(self, elapsed, new_seconds, commit):
+        m = self.metrics
+        m.observe("transcribe_seconds", elapsed)
+        m.observe("buffer_seconds", len(self.audio_buffer)/self.SAMPLING_RATE)
+        if new_seconds > 0:
+            m.observe("rtf", elapsed / new_seconds)
+        m.inc("committed_words", len(commit))
+        if self.controller is not None:
+            m.set_gauge("chunk_size_seconds", self.controller.chunk_size)
+            m.set_gauge("buffer_trimming_seconds", self.buffer_trimming_sec)
+
+    def can_skip(self):
+        """With skip_silence, True if transcribe would give the same outcome as the last one: there is no new
+        audio, or the new audio is silence and the last transcribe was already over silence and gave no new words.
+        Whisper often gives the last word of an utterance only when it sees the silence after it, so the first
+        transcribe after the speech is never skipped.
+        Without skip_silence, the same audio is transcribed again, which can confirm the pending hypothesis against itself."""
+        if not self.skip_silence:
+            return False
+        if self.new_samples == 0:
+            return True
+        return self.settled and not self.new_speech
+
+    def trim_silence(self):
+        """Trims the audio buffer inside of the skipped silence, 1 second before its end, when the buffer is over the
+        trimming threshold. Otherwise it would grow for as long as the silence lasts. Everything before it is committed."""
+        s = self.buffer_trimming_sec if self.buffer_trimming_way in ("segment", "word") else 30
+        if len(self.audio_buffer)/self.SAMPLING_RATE > s:
+            keep = min(self.new_samples, self.SAMPLING_RATE)
+            t = self.buffer_time_offset + (len(self.audio_buffer) - keep)/self.SAMPLING_RATE
+            logger.debug(f"--- silence chunked at {t:2.2f}")
+            self.chunk_at(t)
+            self.new_samples = keep
+
     def chunk_completed_sentence(self):
-        if self.commited == []: return
-        logger.debug(self.commited)
-        sents = self.words_to_sentences(self.commited)
+        if not self.commited: return
+        sents = self.segmenter.sentences()
         for s in sents:
             logger.debug(f"\t\tSENT: {s}")
         if len(sents) < 2:
@@ -541,12 +1089,32 @@ class OnlineASRProcessor:
         logger.debug(f"--- sentence chunked at {chunk_at:2.2f}")
         self.chunk_at(chunk_at)
 
-    def chunk_completed_segment(self, res):
-        if self.commited == []: return
+    def chunk_committed_words(self):
+        """Trims the buffer between two words, the last boundary that is at least tail_context seconds before the
+        end of the last committed word. The audio before it isn't transcribed again, its text is in the prompt."""
+        words = self.commited.context()
+        if not words:
+            return
+        # the boundaries: between two committed words, and after the last one
+        uncommitted = self.transcript_buffer.complete()
+        following = [b for b, _, _ in words[1:]] + [uncommitted[0][0] if uncommitted else words[-1][1]]
+        limit = words[-1][1] - self.tail_context
+        cut = None
+        for (_, e, _), b in zip(words, following):
+            t = (e + max(e, b)) / 2  # in the middle of the pause
+            if t > limit:
+                break
+            cut = t
+        if cut is not None and cut > self.buffer_time_offset:
+            logger.debug(f"--- word chunked at {cut:2.2f}")
+            self.chunk_at(cut)
 
-        ends = self.asr.segments_end_ts(res)
+    def chunk_completed_segment(self, ends):
+        if not self.commited: return
 
-        t = self.commited[-1][1]
+        ends = list(ends)
+
+        t = self.commited.last()[1]
 
         if len(ends) > 1:
 
@@ -571,33 +1139,17 @@ class OnlineASRProcessor:
         """
         self.transcript_buffer.pop_commited(time)
         cut_seconds = time - self.buffer_time_offset
-        self.audio_buffer = self.audio_buffer[int(cut_seconds*self.SAMPLING_RATE):]
+        self.audio_buffer.trim(int(cut_seconds*self.SAMPLING_RATE))
         self.buffer_time_offset = time
+        self.commited.set_offset(time)
 
     def words_to_sentences(self, words):
         """Uses self.tokenizer for sentence segmentation of words.
         Returns: [(beg,end,"sentence 1"),...]
         """
         
-        cwords = [w for w in words]
-        t = " ".join(o[2] for o in cwords)
-        s = self.tokenizer.split(t)
-        out = []
-        while s:
-            beg = None
-            end = None
-            sent = s.pop(0).strip()
-            fsent = sent
-            while cwords:
-                b,e,w = cwords.pop(0)
-                w = w.strip()
-                if beg is None and sent.startswith(w):
-                    beg = b
-                elif end is None and sent == w:
-                    end = e
-                    out.append((beg,end,fsent))
-                    break
-                sent = sent[len(w):].strip()
+        t = " ".join(o[2] for o in words)
+        out, _ = map_words_to_sentences(words, self.tokenizer.split(t))
         return out
 
     def finish(self):
@@ -610,6 +1162,12 @@ class OnlineASRProcessor:
         self.buffer_time_offset += len(self.audio_buffer)/16000
         return f
 
+    def close(self):
+        """Writes the kept committed words to the transcript log and closes it."""
+        self.commited.close()
+        if self.transcript_log is not None:
+            self.transcript_log.close()
+
 
     def to_flush(self, sents, sep=None, offset=0, ):
         # concatenates the timestamped words or sentences into one sequence that is flushed in one line
@@ -626,6 +1184,21 @@ class OnlineASRProcessor:
             e = offset + sents[-1][1]
         return (b,e,t)
 
+_vad_model = None
+
+def load_vad_model():
+    """Silero VAD model, loaded once per process. Its state is reset by FixedVADIterator, so it can be
+    reused by consecutive VACOnlineASRProcessors, but not by concurrent ones.
+    """
+    global _vad_model
+    if _vad_model is None:
+        import torch
+        _vad_model, _ = torch.hub.load(
+            repo_or_dir='snakers4/silero-vad',
+            model='silero_vad'
+        )
+    return _vad_model
+
 class VACOnlineASRProcessor(OnlineASRProcessor):
     '''Wraps OnlineASRProcessor with VAC (Voice Activity Controller). 
 
@@ -640,13 +1213,8 @@ class VACOnlineASRProcessor(OnlineASRProcessor):
         self.online = OnlineASRProcessor(*a, **kw)
 
         # VAC:
-        import torch
-        model, _ = torch.hub.load(
-            repo_or_dir='snakers4/silero-vad',
-            model='silero_vad'
-        )
         from silero_vad_iterator import FixedVADIterator
-        self.vac = FixedVADIterator(model)  # we use the default options there: 500ms silence, 100ms padding, etc.  
+        self.vac = FixedVADIterator(load_vad_model())  # we use the default options there: 500ms silence, 100ms padding, etc.  
 
         self.logfile = self.online.logfile
         self.init()
@@ -659,17 +1227,17 @@ class VACOnlineASRProcessor(OnlineASRProcessor):
         self.is_currently_final = False
 
         self.status = None  # or "voice" or "nonvoice"
-        self.audio_buffer = np.array([],dtype=np.float32)
+        self.audio_buffer = AudioBuffer(capacity=2*self.SAMPLING_RATE)
         self.buffer_offset = 0  # in frames
 
     def clear_buffer(self):
         self.buffer_offset += len(self.audio_buffer)
-        self.audio_buffer = np.array([],dtype=np.float32)
+        self.audio_buffer.clear()
 
 
     def insert_audio_chunk(self, audio):
         res = self.vac(audio)
-        self.audio_buffer = np.append(self.audio_buffer, audio)
+        self.audio_buffer.append(audio)
 
         if res is not None:
             frame = list(res.values())[0]-self.buffer_offset
@@ -699,25 +1267,28 @@ class VACOnlineASRProcessor(OnlineASRProcessor):
                 self.clear_buffer()
         else:
             if self.status == 'voice':
-                self.online.insert_audio_chunk(self.audio_buffer)
+                self.online.insert_audio_chunk(self.audio_buffer.view())
                 self.current_online_chunk_buffer_size += len(self.audio_buffer)
                 self.clear_buffer()
             else:
                 # We keep 1 second because VAD may later find start of voice in it.
                 # But we trim it to prevent OOM. 
-                self.buffer_offset += max(0,len(self.audio_buffer)-self.SAMPLING_RATE)
-                self.audio_buffer = self.audio_buffer[-self.SAMPLING_RATE:]
+                trim = max(0,len(self.audio_buffer)-self.SAMPLING_RATE)
+                self.buffer_offset += trim
+                self.audio_buffer.trim(trim)
 
 
     def process_iter(self):
         if self.is_currently_final:
             return self.finish()
-        elif self.current_online_chunk_buffer_size > self.SAMPLING_RATE*self.online_chunk_size:
+        elif self.current_online_chunk_buffer_size > self.SAMPLING_RATE*self.online.chunk_size(self.online_chunk_size):
             self.current_online_chunk_buffer_size = 0
             ret = self.online.process_iter()
             return ret
         else:
             print("no online update, only VAD", self.status, file=self.logfile)
+            if self.online.metrics is not None:
+                self.online.metrics.inc("vad_only_iterations")
             return (None, None, "")
 
     def finish(self):
@@ -726,16 +1297,46 @@ class VACOnlineASRProcessor(OnlineASRProcessor):
         self.is_currently_final = False
         return ret
 
+    def chunk_size(self, default):
+        # the VAC chunks are fixed, the controller sets the chunks of self.online
+        return default
+
+    def close(self):
+        self.online.close()
+
 
 
 WHISPER_LANG_CODES = "af,am,ar,as,az,ba,be,bg,bn,bo,br,bs,ca,cs,cy,da,de,el,en,es,et,eu,fa,fi,fo,fr,gl,gu,ha,haw,he,hi,hr,ht,hu,hy,id,is,it,ja,jw,ka,kk,km,kn,ko,la,lb,ln,lo,lt,lv,mg,mi,mk,ml,mn,mr,ms,mt,my,ne,nl,nn,no,oc,pa,pl,ps,pt,ro,ru,sa,sd,si,sk,sl,sn,so,sq,sr,su,sv,sw,ta,te,tg,th,tk,tl,tr,tt,uk,ur,uz,vi,yi,yo,zh".split(",")
 
-def create_tokenizer(lan):
-    """returns an object that has split function that works like the one of MosesTokenizer"""
+SENTENCE_SPLITTERS = ["auto", "rules", "moses", "wtpsplit"]
+
+# (language, splitter) -> tokenizer, every one is built once per process
+_tokenizers = {}
+_tokenizers_lock = threading.Lock()
+
+def create_tokenizer(lan, splitter="auto"):
+    """returns an object that has split function that works like the one of MosesTokenizer
+    splitter: "rules" for the rule-based splitter of sentence_splitter.py, "moses" or "wtpsplit" for the
+    heavy ones, or "auto": rules for the languages that have them, otherwise the heavy ones like before.
+    The tokenizers are cached, so that the same one is returned for the same language and splitter.
+    """
 
     assert lan in WHISPER_LANG_CODES, "language must be Whisper's supported lang code: " + " ".join(WHISPER_LANG_CODES)
+    assert splitter in SENTENCE_SPLITTERS, "splitter must be one of: " + " ".join(SENTENCE_SPLITTERS)
+
+    key = (lan, splitter)
+    with _tokenizers_lock:
+        if key not in _tokenizers:
+            t = time.time()
+            _tokenizers[key] = _build_tokenizer(lan, splitter)
+            logger.debug(f"{type(_tokenizers[key]).__name__} sentence splitter for {lan} built in {time.time()-t:.2f} seconds")
+        return _tokenizers[key]
 
-    if lan == "uk":
+def _build_tokenizer(lan, splitter):
+    if splitter == "rules" or (splitter == "auto" and lan in RuleSentenceSplitter.LANGUAGES):
+        return RuleSentenceSplitter(lan)
+
+    if lan == "uk" and splitter == "auto":
         import tokenize_uk
         class UkrainianTokenizer:
             def split(self, text):
@@ -743,7 +1344,7 @@ def create_tokenizer(lan):
         return UkrainianTokenizer()
 
     # supported by fast-mosestokenizer
-    if lan in "as bn ca cs de el en es et fi fr ga gu hi hu is it kn lt lv ml mni mr nl or pa pl pt ro ru sk sl sv ta te yue zh".split():
+    if splitter == "moses" or (splitter == "auto" and lan in "as bn ca cs de el en es et fi fr ga gu hi hu is it kn lt lv ml mni mr nl or pa pl pt ro ru sk sl sv ta te yue zh".split()):
         from mosestokenizer import MosesTokenizer
         return MosesTokenizer(lan)
 
@@ -771,22 +1372,51 @@ def add_shared_args(parser):
     parser.add_argument('--model_dir', type=str, default=None, help="Dir where Whisper model.bin and other files are saved. This option overrides --model and --model_cache_dir parameter.")
     parser.add_argument('--lan', '--language', type=str, default='auto', help="Source language code, e.g. en,de,cs, or 'auto' for language detection.")
     parser.add_argument('--task', type=str, default='transcribe', choices=["transcribe","translate"],help="Transcribe or translate.")
-    parser.add_argument('--backend', type=str, default="faster-whisper", choices=["faster-whisper", "whisper_timestamped", "mlx-whisper", "openai-api"],help='Load only this backend for Whisper processing.')
+    parser.add_argument('--backend', type=str, default="faster-whisper", choices=["faster-whisper", "whisper_timestamped", "mlx-whisper", "openai-api", "replay"],help='Load only this backend for Whisper processing. "replay" is a fake backend without a model, for benchmarks and tests, see --replay-file.')
+    parser.add_argument('--replay-file', dest='replay_file', type=str, default=None, help='Words for the replay backend: a --transcript-log file or the output of whisper_online.py. Without it, synthetic words are generated, one every half second.')
+    parser.add_argument('--replay-latency', dest='replay_latency', type=float, default=0.0, help='Simulated processing time of every transcribe call of the replay backend, in seconds.')
+    parser.add_argument('--replay-rtf', dest='replay_rtf', type=float, default=0.0, help='Simulated processing time of the replay backend per second of audio.')
+    parser.add_argument('--device', type=str, default="auto", choices=DEVICES, help='Device of the faster-whisper backend. "auto" uses cuda if it is available, otherwise cpu.')
+    parser.add_argument('--compute-type', dest='compute_type', type=str, default="auto", choices=COMPUTE_TYPES, help='Compute type of the faster-whisper backend. "auto" is float16 on cuda and int8 on cpu. Without CUDA, the float16 types fall back to int8.')
+    parser.add_argument('--cpu-threads', dest='cpu_threads', type=int, default=0, help='Number of threads of the faster-whisper backend on CPU, 0 for the default.')
+    parser.add_argument('--num-workers', dest='num_workers', type=int, default=1, help='Number of transcriptions the faster-whisper model can run in parallel, when it is shared by several threads.')
     parser.add_argument('--vac', action="store_true", default=False, help='Use VAC = voice activity controller. Recommended. Requires torch.')
     parser.add_argument('--vac-chunk-size', type=float, default=0.04, help='VAC sample size in seconds.')
     parser.add_argument('--vad', action="store_true", default=False, help='Use VAD = voice activity detection, with the default parameters.')
-    parser.add_argument('--buffer_trimming', type=str, default="segment", choices=["sentence", "segment"],help='Buffer trimming strategy -- trim completed sentences marked with punctuation mark and detected by sentence segmenter, or the completed segments returned by Whisper. Sentence segmenter must be installed for "sentence" option.')
+    parser.add_argument('--buffer_trimming', type=str, default="segment", choices=["sentence", "segment", "word"],help='Buffer trimming strategy -- trim completed sentences marked with punctuation mark and detected by sentence segmenter, or the completed segments returned by Whisper, or after every committed word, so that only the uncommitted tail and --tail-context seconds are transcribed again. Sentence segmenter must be installed for "sentence" option.')
+    parser.add_argument('--tail-context', dest='tail_context', type=float, default=2.0, help='Seconds of the committed audio that are transcribed again with the uncommitted tail, with --buffer_trimming word.')
+    parser.add_argument('--transcript-log', dest='transcript_log', type=str, default=None, help='Append the committed words to this file when they are no longer needed for the prompt, so that long sessions keep only a bounded part of the transcript in memory.')
+    parser.add_argument('--sentence-splitter', dest='sentence_splitter', type=str, default="auto", choices=SENTENCE_SPLITTERS, help='Sentence splitter for the "sentence" buffer trimming. "auto" uses the rule-based splitter for cs,en,es,de,fr,ru,id,zh and mosestokenizer or wtpsplit for the other languages.')
+    parser.add_argument('--target-latency', dest='target_latency', type=float, default=None, help='Adapt the chunk size to the transcribe time, to emit the text this many seconds after it was spoken, if possible. The chunk size starts at --min-chunk-size.')
+    parser.add_argument('--target-rtf', dest='target_rtf', type=float, default=None, help='Adapt the chunk size so that the transcribe time is at most this share of the audio time, e.g. 0.5 to keep the ASR busy at most half of the time.')
+    parser.add_argument('--adaptive-trimming', dest='adaptive_trimming', action="store_true", default=False, help='With --target-latency, lower the buffer trimming threshold when the latency can not be held, down to 5 seconds, and raise it back to --buffer_trimming_sec when it can.')
+    parser.add_argument('--commit-policy', dest='commit_policy', type=str, default="agreement", choices=COMMIT_POLICIES, help='Which words are committed: "agreement" of the last --agreement-n hypotheses, or also the words older than --max-commit-delay ("forced"), or also the words with at least --commit-confidence ("confidence", faster-whisper, whisper_timestamped and mlx-whisper).')
+    parser.add_argument('--agreement-n', dest='agreement_n', type=int, default=2, choices=[1, 2, 3], help='Number of consecutive hypotheses that must agree on a word to commit it. 1 is the fastest, 3 the most stable.')
+    parser.add_argument('--max-commit-delay', dest='max_commit_delay', type=float, default=2.0, help='With --commit-policy forced, the words that ended this many seconds before the end of the audio are committed.')
+    parser.add_argument('--commit-confidence', dest='commit_confidence', type=float, default=0.9, help='With --commit-policy confidence, the words with at least this confidence are committed.')
+    parser.add_argument('--lazy-segments', dest='lazy_segments', action="store_true", default=False, help='Consume the segments of faster-whisper as they are decoded and stop decoding when the text to commit in this iteration is decided. Lower latency, but the hypothesis for the next iteration is shorter.')
+    parser.add_argument('--skip-silence', dest='skip_silence', action="store_true", default=False, help='Do not transcribe again when there is no new audio, or when the new audio is silence and all the text is committed. Cheaper than --vac, and it needs no torch.')
     parser.add_argument('--buffer_trimming_sec', type=float, default=15, help='Buffer trimming length threshold in seconds. If buffer length is longer, trimming sentence/segment is triggered.')
+    parser.add_argument('--transcribe-cache', dest='transcribe_cache', action="store_true", default=False, help='Store the results of every transcribe call on disk and reuse them when the same audio is transcribed with the same prompt, model and options again (see transcribe_cache.py). Also enabled by ONECLICK_TRANSCRIBE_CACHE=1.')
+    parser.add_argument('--decoder', type=str, default="librosa", choices=["librosa", "ffmpeg"], help='Audio decoder for the input files. "ffmpeg" decodes them in an ffmpeg subprocess, it is faster for MP3/M4A/WMA. Requires ffmpeg. The whole file is decoded once into the pcm cache; only with --no-pcm-cache are the windows streamed from one running ffmpeg process.')
+    parser.add_argument('--resample-quality', dest='resample_quality', type=str, default="default", choices=list(RESAMPLERS), help='Resampler quality of the ffmpeg decoder. "high" requires ffmpeg built with libsoxr.')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes of the offline mode. The file is split at pauses into this many parts, every worker loads its own model and transcribes one part.')
+    parser.add_argument('--offline-segmenter', dest='offline_segmenter', type=str, default="auto", choices=["auto", "energy", "silero"], help='How the offline mode splits the file into windows: by the signal energy, or by Silero VAD (requires torch). "auto" uses Silero with --vac.')
+    parser.add_argument('--metrics-json', dest='metrics_json', type=str, default=None, help='Append the latency and throughput metrics of the streaming processor to this JSON lines file, see stream_metrics.py.')
+    parser.add_argument('--metrics-prom', dest='metrics_prom', type=str, default=None, help='Write the metrics of the streaming processor to this file in the Prometheus text format, e.g. for the textfile collector of node_exporter.')
+    parser.add_argument('--metrics-interval', dest='metrics_interval', type=float, default=10.0, help='Export the metrics every this many seconds, and at the end.')
+    parser.add_argument('--profile', type=str, default=None, metavar='DIR', help='Time the stages of the ASR (prompt, transcribe, flush, chunking, ...) and write a Chrome trace of every session to this directory, see profiling.py. It opens in chrome://tracing or ui.perfetto.dev. With --offline --workers N, only the main process is traced, not the transcription in the worker processes.')
+    parser.add_argument('--profile-cprofile', dest='profile_cprofile', action="store_true", default=False, help='With --profile, also write a cProfile dump of every session, for python -m pstats or snakeviz.')
     parser.add_argument("-l", "--log-level", dest="log_level", choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'], help="Set the log level", default='DEBUG')
 
-def asr_factory(args, logfile=sys.stderr):
-    """
-    Creates and configures an ASR and ASR Online instance based on the specified backend and arguments.
-    """
+def create_asr(args):
+    """Loads the ASR of args.backend with args.model."""
     backend = args.backend
     if backend == "openai-api":
         logger.debug("Using OpenAI API.")
         asr = OpenaiApiASR(lan=args.lan)
+    elif backend == "replay":
+        asr = ReplayASR(lan=args.lan, replay_file=args.replay_file, latency=args.replay_latency, rtf=args.replay_rtf)
     else:
         if backend == "faster-whisper":
             asr_cls = FasterWhisperASR
@@ -799,55 +1429,534 @@ def asr_factory(args, logfile=sys.stderr):
         size = args.model
         t = time.time()
         logger.info(f"Loading Whisper {size} model for {args.lan}...")
-        asr = asr_cls(modelsize=size, lan=args.lan, cache_dir=args.model_cache_dir, model_dir=args.model_dir)
+        kw = {}
+        if asr_cls is FasterWhisperASR:
+            kw = dict(device=args.device, compute_type=args.compute_type, cpu_threads=args.cpu_threads, num_workers=args.num_workers)
+        asr = asr_cls(modelsize=size, lan=args.lan, cache_dir=args.model_cache_dir, model_dir=args.model_dir, **kw)
         e = time.time()
         logger.info(f"done. It took {round(e-t,2)} seconds.")
+    cache = open_default_transcribe_cache(True if getattr(args, "transcribe_cache", False) else None)
+    if cache is not None:
+        logger.info(f"Caching the transcribe results in {cache.cache_dir}")
+        asr = CachedASR(asr, cache)
+    return asr
+
+class ASRRegistry:
+    """Keeps the loaded ASR objects, keyed by (backend, model, device, compute type), so that a process that
+    transcribes many files, in many languages, loads every model only once.
+    The ASR objects are not thread-safe, use them from one thread at a time.
+    """
+
+    def __init__(self):
+        self._asrs = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(args):
+        if args.backend == "replay":
+            return (args.backend, args.replay_file, args.replay_latency, args.replay_rtf, args.transcribe_cache)
+        return (args.backend, args.model_dir or args.model, getattr(args, "device", None), getattr(args, "compute_type", None),
+                getattr(args, "transcribe_cache", False))
+
+    def load(self, args):
+        return create_asr(args)
+
+    def get(self, args):
+        """The ASR for args, loaded on the first request."""
+        key = self.key(args)
+        with self._lock:
+            if key not in self._asrs:
+                self._asrs[key] = self.load(args)
+            else:
+                logger.debug(f"reusing the loaded {key[1]} model of {key[0]}")
+            asr = self._asrs[key]
+        asr.reset_options(args.lan)
+        return asr
+
+    def __contains__(self, args):
+        return self.key(args) in self._asrs
+
+    def __len__(self):
+        return len(self._asrs)
 
-    # Apply common configurations
+    def clear(self):
+        with self._lock:
+            self._asrs.clear()
+
+# the default registry of transcribe_file
+asr_registry = ASRRegistry()
+
+def apply_asr_options(asr, args):
+    """Applies --vad and --task to asr. Returns the language of the output."""
     if getattr(args, 'vad', False):  # Checks if VAD argument is present and True
         logger.info("Setting VAD filter")
         asr.use_vad()
 
-    language = args.lan
     if args.task == "translate":
         asr.set_translate_task()
-        tgt_language = "en"  # Whisper translates into English
+        return "en"  # Whisper translates into English
+    return args.lan  # Whisper transcribes in this language
+
+def create_metrics_exporter(asr, online, args):
+    """MetricsExporter of the metrics of online for --metrics-json and --metrics-prom, or None if there are none."""
+    if online is None:
+        return None
+    metrics = getattr(online, "online", online).metrics
+    if metrics is None:
+        return None
+    gauges = {}
+    if isinstance(asr, CachedASR):
+        gauges["transcribe_cache_hit_rate"] = asr.cache.hit_rate
+    return MetricsExporter(metrics, json_path=getattr(args, 'metrics_json', None),
+                           prometheus_path=getattr(args, 'metrics_prom', None),
+                           interval=getattr(args, 'metrics_interval', 10.0), gauges=gauges)
+
+def create_chunk_controller(args):
+    """ChunkSizeController of --target-latency and --target-rtf, or None if neither is set."""
+    target_latency = getattr(args, 'target_latency', None)
+    target_rtf = getattr(args, 'target_rtf', None)
+    if target_latency is None and target_rtf is None:
+        return None
+    trimming_sec = args.buffer_trimming_sec if getattr(args, 'adaptive_trimming', False) else None
+    return ChunkSizeController(args.min_chunk_size, target_latency=target_latency, target_rtf=target_rtf,
+                               trimming_sec=trimming_sec)
+
+def asr_factory(args, logfile=sys.stderr, registry=None):
+    """
+    Creates and configures an ASR and ASR Online instance based on the specified backend and arguments.
+    registry: ASRRegistry to take the ASR from, or None to load a new one.
+    With args.offline, the online instance is None: the offline engine transcribes with the ASR only,
+    so neither the streaming processor nor, with --vac, its VAD iterator is built.
+    """
+    open_pcm_cache()
+    if registry is not None:
+        asr = registry.get(args)
     else:
-        tgt_language = language  # Whisper transcribes in this language
+        asr = create_asr(args)
+    tgt_language = apply_asr_options(asr, args)
+    if getattr(args, 'offline', False):
+        return asr, None
 
     # Create the tokenizer
     if args.buffer_trimming == "sentence":
-        tokenizer = create_tokenizer(tgt_language)
+        tokenizer = create_tokenizer(tgt_language, getattr(args, 'sentence_splitter', "auto"))
     else:
         tokenizer = None
 
+    controller = create_chunk_controller(args)
+    policy = create_commit_policy(getattr(args, 'commit_policy', "agreement"), n=getattr(args, 'agreement_n', 2),
+                                  max_delay=getattr(args, 'max_commit_delay', 2.0),
+                                  threshold=getattr(args, 'commit_confidence', 0.9))
+    metrics = StreamMetrics() if getattr(args, 'metrics_json', None) or getattr(args, 'metrics_prom', None) else None
+
     # Create the OnlineASRProcessor
     if args.vac:
         
-        online = VACOnlineASRProcessor(args.min_chunk_size, asr,tokenizer,logfile=logfile,buffer_trimming=(args.buffer_trimming, args.buffer_trimming_sec))
+        online = VACOnlineASRProcessor(args.min_chunk_size, asr,tokenizer,logfile=logfile,buffer_trimming=(args.buffer_trimming, args.buffer_trimming_sec),transcript_log=getattr(args, 'transcript_log', None),chunk_controller=controller,skip_silence=getattr(args, 'skip_silence', False),tail_context=getattr(args, 'tail_context', 2.0),lazy_segments=getattr(args, 'lazy_segments', False),commit_policy=policy,metrics=metrics)
     else:
-        online = OnlineASRProcessor(asr,tokenizer,logfile=logfile,buffer_trimming=(args.buffer_trimming, args.buffer_trimming_sec))
+        online = OnlineASRProcessor(asr,tokenizer,logfile=logfile,buffer_trimming=(args.buffer_trimming, args.buffer_trimming_sec),transcript_log=getattr(args, 'transcript_log', None),chunk_controller=controller,skip_silence=getattr(args, 'skip_silence', False),tail_context=getattr(args, 'tail_context', 2.0),lazy_segments=getattr(args, 'lazy_segments', False),commit_policy=policy,metrics=metrics)
 
     return asr, online
 
+def shared_args(**options):
+    """argparse.Namespace with the defaults of add_shared_args, overridden by options, e.g. lan="cs", min_chunk_size=1."""
+    parser = argparse.ArgumentParser(add_help=False)
+    add_shared_args(parser)
+    args = parser.parse_args([])
+    for k, v in options.items():
+        if not hasattr(args, k):
+            raise TypeError(f"unknown option {k}")
+        setattr(args, k, v)
+    return args
+
+def simulate_comp_unaware(online, audio_path, min_chunk, beg=0, duration=None):
+    """Computationally unaware simulation: feeds the file to online in chunks of min_chunk seconds, as fast
+    as they are processed.
+    Yields: (end, o), where end is the time of the audio processed so far, and o the output of process_iter.
+    """
+    if duration is None:
+        duration = audio_duration(audio_path)
+    end = beg + min_chunk
+    while True:
+        a = load_audio_chunk(audio_path,beg,end)
+        online.insert_audio_chunk(a)
+        try:
+            with profiling.span("process_iter"):
+                o = online.process_iter()
+        except AssertionError as e:
+            logger.error(f"assertion error: {repr(e)}")
+            pass
+        else:
+            yield end, o
+
+        logger.debug(f"## last processed {end:.2f}s")
+
+        if end >= duration:
+            break
+        
+        beg = end
+        
+        chunk = online.chunk_size(min_chunk)
+        if end + chunk > duration:
+            end = duration
+        else:
+            end += chunk
+
+def silero_speech_regions(audio_path, duration, block_seconds=60):
+    """Speech regions [(beg, end), ...] in samples of the whole file, by Silero VAD."""
+    from silero_vad_iterator import FixedVADIterator
+    vad = FixedVADIterator(load_vad_model())
+    regions = []
+    start = None
+    beg = 0
+    while beg < duration:
+        end = min(duration, beg + block_seconds)
+        for event in vad.events(load_audio_chunk(audio_path, beg, end)):
+            if 'start' in event:
+                start = event['start']
+            elif start is not None:
+                regions.append((start, event['end']))
+                start = None
+        beg = end
+    if start is not None:
+        regions.append((start, int(duration*16000)))
+    return regions
+
+def speech_windows(audio_path, segmenter="energy", max_window=25, duration=None):
+    """Windows [(beg, end), ...] in seconds that cover the speech of the file, up to max_window seconds,
+    cut in silence. segmenter: "energy" (see speech_segments.py) or "silero" (requires torch).
+    """
+    if duration is None:
+        duration = audio_duration(audio_path)
+    read = lambda beg, end: load_audio_chunk(audio_path, beg, end)
+    rms = frame_rms(read, duration)
+    if segmenter == "silero":
+        regions = silero_speech_regions(audio_path, duration)
+    else:
+        regions = energy_speech_regions(rms)
+    windows = pack_windows(regions, rms, max_window=max_window)
+    logger.debug(f"{len(windows)} windows with {sum(e-b for b, e in windows)/16000:.2f} seconds of {duration:.2f} seconds of audio")
+    return [(b/16000, e/16000) for b, e in windows]
+
+def segment_words(asr, res, offset):
+    """Groups the words of a transcribe result by Whisper's segments.
+    Returns: [[(beg, end, "word"), ...], ...] with the times shifted by offset, without empty segments.
+    """
+    words = asr.ts_words(res)
+    out = []
+    i = 0
+    for seg_end in asr.segments_end_ts(res) + [float("inf")]:
+        group = []
+        while i < len(words) and words[i][1] <= seg_end + 0.01:
+            b, e, w = words[i]
+            group.append((offset + b, offset + e, w))
+            i += 1
+        if group:
+            out.append(group)
+    return out
+
+def segment_lines(asr, res, offset):
+    """Returns: [(beg, end, "text"), ...], the segments of segment_words joined into lines."""
+    return [(g[0][0], g[-1][1], asr.sep.join(w[2] for w in g)) for g in segment_words(asr, res, offset)]
+
+def check_deadline(deadline, audio_path):
+    """Raises TimeoutError if deadline, a time.monotonic() value or None for no limit, has passed."""
+    if deadline is not None and time.monotonic() > deadline:
+        raise TimeoutError(f"transcribing {audio_path} took longer than the timeout")
+
+def timeout_deadline(timeout):
+    """The deadline of check_deadline in timeout seconds from now, or None if timeout is None."""
+    return None if timeout is None else time.monotonic() + timeout
+
+def transcribe_offline(asr, audio_path, segmenter="energy", max_window=25, duration=None, deadline=None):
+    """Offline engine: splits the whole file into speech windows once and transcribes every window
+    once, with the text of the previous one as the prompt. Unlike the streaming simulation, no audio
+    is transcribed twice.
+    deadline: see check_deadline, it is checked before every window.
+    Yields: (beg, end, "text") in seconds, one per Whisper segment, in the format of OnlineASRProcessor.
+    """
+    prompt = ""
+    with profiling.span("speech_windows"):
+        windows = speech_windows(audio_path, segmenter, max_window, duration)
+    for beg, end in windows:
+        check_deadline(deadline, audio_path)
+        with profiling.span("load_audio"):
+            a = load_audio_chunk(audio_path, beg, end)
+        logger.debug(f"transcribing {end-beg:2.2f} seconds from {beg:2.2f}")
+        asr.stream_offset = beg
+        with profiling.span("transcribe"):
+            res = asr.transcribe(a, init_prompt=prompt)
+        with profiling.span("segment_lines"):
+            lines = list(segment_lines(asr, res, beg))
+        for line in lines:
+            yield line
+            prompt = (prompt + asr.sep + line[2])[-200:]  # 200 characters prompt size
+
+def transcribe_batched(asr, audio_paths, batch_size=16, segmenter="energy", max_window=25, timeout=None):
+    """Offline engine for many short files: the speech windows of all files are packed into batches of
+    batch_size windows, every batch is one asr.transcribe_batch call, and the words are routed back to
+    their files. Unlike transcribe_offline, the windows are transcribed without a prompt.
+    timeout: seconds, the files of a batch are done together, so it limits the time until the next file
+    is done; TimeoutError is raised before the next batch when it is over.
+    Yields: (audio_path, [(beg, end, "text"), ...]) for every file, when all its windows are transcribed.
+    """
+    lines = {}  # file index -> [(beg, end, "text"), ...]
+    remaining = {}  # file index -> number of windows not transcribed yet
+    pending = []  # (file index, window beginning, audio)
+    deadline = timeout_deadline(timeout)
+
+    def run_batch():
+        check_deadline(deadline, audio_paths[pending[0][0]])
+        with profiling.span("transcribe_batch", windows=len(pending)):
+            results = asr.transcribe_batch([a for _, _, a in pending])
+        logger.debug(f"transcribed a batch of {len(pending)} windows")
+        for (i, beg, _), groups in zip(pending, results):
+            lines[i].extend((beg + g[0][0], beg + g[-1][1], asr.sep.join(w[2] for w in g)) for g in groups)
+            remaining[i] -= 1
+        pending.clear()
+
+    def completed():
+        nonlocal deadline
+        for i in sorted(i for i, n in remaining.items() if n == 0):
+            del remaining[i]
+            deadline = timeout_deadline(timeout)
+            yield audio_paths[i], lines.pop(i)
+
+    for i, audio_path in enumerate(audio_paths):
+        with profiling.span("speech_windows"):
+            windows = speech_windows(audio_path, segmenter, max_window)
+        lines[i] = []
+        remaining[i] = len(windows)
+        for beg, end in windows:
+            with profiling.span("load_audio"):
+                pending.append((i, beg, load_audio_chunk(audio_path, beg, end)))
+            if len(pending) >= batch_size:
+                run_batch()
+        yield from completed()
+    if pending:
+        run_batch()
+    yield from completed()
+
+def border_duplicates(commited, new, max_ngram=5):
+    """Number of the leading words of new that repeat the end of commited, the way HypothesisBuffer.insert
+    drops them: the words that begin before the last committed word ends, and then 1 to max_ngram words
+    that are identical to the last committed ones, if they follow in less than a second.
+    commited, new: [(beg, end, "word"), ...] in the same time base
+    """
+    if not commited:
+        return 0
+    last = commited[-1][1]
+    k = 0
+    while k < len(new) and new[k][0] <= last - 0.1:
+        k += 1
+    if k < len(new) and abs(new[k][0] - last) < 1:
+        for i in range(1, min(len(commited), len(new) - k, max_ngram) + 1):
+            if [w[2].strip() for w in commited[-i:]] == [w[2].strip() for w in new[k:k+i]]:
+                k += i
+                break
+    return k
+
+# the ASR of a worker process of transcribe_parallel
+_worker_asr = None
+
+def _init_parallel_worker(load_asr, args, workers, use_pcm_cache, log_level, pids):
+    global _worker_asr
+    # first, so that the worker can be killed even while its model loads
+    pids.put(os.getpid())
+    logging.basicConfig(format='%(levelname)s\t%(message)s')
+    logger.setLevel(log_level)
+    open_pcm_cache(use_pcm_cache)
+    set_audio_decoder(args.decoder, args.resample_quality)
+    if getattr(args, "cpu_threads", None) == 0 and workers > 1:
+        # the default of CTranslate2 is one thread pool per process, share the cores instead
+        args = argparse.Namespace(**vars(args))
+        args.cpu_threads = max(1, (os.cpu_count() or 1) // workers)
+    _worker_asr = load_asr(args)
+
+def _transcribe_part(audio_path, windows, args):
+    """Transcribes the windows of one part like transcribe_offline, in a worker process.
+    Returns: the separator of the words, and [[(beg, end, "word"), ...], ...], the words of every segment.
+    """
+    asr = _worker_asr
+    # the worker is reused for the next files, maybe in another language
+    asr.reset_options(args.lan)
+    apply_asr_options(asr, args)
+    prompt = ""
+    out = []
+    for beg, end in windows:
+        asr.stream_offset = beg
+        res = asr.transcribe(load_audio_chunk(audio_path, beg, end), init_prompt=prompt)
+        for group in segment_words(asr, res, beg):
+            out.append(group)
+            prompt = (prompt + asr.sep + asr.sep.join(w[2] for w in group))[-200:]
+    return asr.sep, out
+
+# the worker processes of transcribe_parallel, kept for the next files: (key, ProcessPoolExecutor, queue of the
+# PIDs the workers report when they start) or None
+_parallel_pool = None
+
+def get_parallel_pool(args, workers, load_asr=create_asr):
+    """The pool of workers processes that have the model of args loaded by load_asr(args). It is kept for the next
+    files, like the models of ASRRegistry, and replaced only when the model or the worker setup changes."""
+    global _parallel_pool
+    use_pcm_cache = pcm_cache is not None
+    log_level = logger.getEffectiveLevel()
+    key = (ASRRegistry.key(args), workers, load_asr, args.decoder, args.resample_quality,
+           getattr(args, "cpu_threads", None), use_pcm_cache, log_level)
+    if _parallel_pool is not None and _parallel_pool[0] == key:
+        return _parallel_pool[1]
+    shutdown_parallel_pool()
+    logger.info(f"starting {workers} worker processes")
+    # spawn, because torch and CUDA can't be used in forked processes
+    ctx = multiprocessing.get_context("spawn")
+    pids = ctx.SimpleQueue()
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_parallel_worker,
+                               initargs=(load_asr, args, workers, use_pcm_cache, log_level, pids))
+    _parallel_pool = (key, pool, pids)
+    return pool
+
+def shutdown_parallel_pool(kill=False):
+    """Stops the worker processes of transcribe_parallel, if there are any.
+    kill: don't wait for the parts they are transcribing, e.g. after a timeout. Cancel the futures that
+    are not running yet first, the workers would start them otherwise.
+    """
+    global _parallel_pool
+    if _parallel_pool is not None:
+        _, pool, pids = _parallel_pool
+        _parallel_pool = None
+        if not kill:
+            pool.shutdown()
+            return
+        pool.shutdown(wait=False)
+        # ProcessPoolExecutor has no public way to stop a running task. When one worker is killed, the pool is
+        # broken and the executor terminates the others too.
+        while not pids.empty():
+            try:
+                os.kill(pids.get(), signal.SIGTERM)
+            except OSError:
+                pass  # it has exited already
+
+def transcribe_parallel(audio_path, args, workers, segmenter="energy", max_window=25, duration=None, overlap=1.0,
+                        load_asr=create_asr, deadline=None):
+    """Offline engine in worker processes, for long files: the speech windows are split into workers parts
+    at pauses (see speech_segments.split_parts), and every part is transcribed by a process with its own
+    model, loaded by load_asr(args). The processes stay for the next files, see get_parallel_pool.
+    The parts are stitched in order; the words at the borders that one part repeats after the other
+    are dropped (see border_duplicates).
+    deadline: see check_deadline. When it passes, the worker processes are killed and started again for the
+    next file, they would go on transcribing the parts of this one.
+    Yields: (beg, end, "text") in seconds, like transcribe_offline.
+    """
+    if duration is None:
+        duration = audio_duration(audio_path)
+    parts = split_parts(speech_windows(audio_path, segmenter, max_window, duration), workers, overlap)
+    if not parts:
+        return
+    pool = get_parallel_pool(args, workers, load_asr)
+    logger.info(f"transcribing {len(parts)} parts in {workers} worker processes")
+    futures = [pool.submit(_transcribe_part, audio_path, part, args) for part in parts]
+    tail = []  # the last committed words
+    for future in futures:
+        try:
+            sep, groups = future.result(timeout=None if deadline is None else max(0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            for f in futures:
+                f.cancel()
+            shutdown_parallel_pool(kill=True)
+            check_deadline(deadline, audio_path)
+            raise
+        words = [w for g in groups for w in g]
+        drop = border_duplicates(tail, words)
+        if drop:
+            logger.debug(f"removing {drop} repeated words at the border: {words[:drop]}")
+        tail = (tail + words[drop:])[-5:]
+        for g in groups:
+            g, drop = g[drop:], max(0, drop - len(g))
+            if g:
+                yield (g[0][0], g[-1][1], sep.join(w[2] for w in g))
+
+def offline_segmenter(args):
+    """"energy" or "silero", the segmenter of the offline engine for args."""
+    if args.offline_segmenter == "auto":
+        return "silero" if args.vac else "energy"
+    return args.offline_segmenter
+
+# shorter files are transcribed faster in this process, by the model in the registry, than by loading it in workers
+PARALLEL_MIN_DURATION = 600
+
+def transcribe_file(audio_path, registry=asr_registry, logfile=sys.stderr, offline=False, timeout=None, **options):
+    """Transcribes an audio file in this process, the same way as `whisper_online.py audio_path --comp_unaware`,
+    or `--offline` if offline is True (in worker processes with workers=N, for files of PARALLEL_MIN_DURATION seconds or more).
+    options: the options of add_shared_args, e.g. lan="cs", model="large-v3", backend="mlx-whisper", vac=True.
+    The ASR is taken from registry, so every model is loaded only once for many files and languages.
+    timeout: seconds, TimeoutError is raised when the file takes longer. It is checked between the transcribe
+    calls, in this process they can't be interrupted.
+    Yields: (beg, end, "text") in seconds, the lines that whisper_online.py prints.
+    """
+    deadline = timeout_deadline(timeout)
+    args = shared_args(**options)
+    set_audio_decoder(args.decoder, args.resample_quality)
+    open_pcm_cache()
+    if offline and args.workers > 1 and audio_duration(audio_path) >= PARALLEL_MIN_DURATION:
+        # the workers load their own models, not from registry, and keep them for the next files
+        yield from transcribe_parallel(audio_path, args, args.workers, offline_segmenter(args), deadline=deadline)
+        return
+    args.offline = offline
+    asr, online = asr_factory(args, logfile=logfile, registry=registry)
+    if offline:
+        yield from transcribe_offline(asr, audio_path, offline_segmenter(args), deadline=deadline)
+        return
+    min_chunk = args.vac_chunk_size if args.vac else args.min_chunk_size
+    try:
+        for _, o in simulate_comp_unaware(online, audio_path, min_chunk):
+            check_deadline(deadline, audio_path)
+            if o[0] is not None:
+                yield o
+        o = online.finish()
+        if o[0] is not None:
+            yield o
+    finally:
+        online.close()
+
+def transcribe_files(audio_paths, registry=asr_registry, batch_size=16, timeout=None, **options):
+    """Transcribes many files with the offline engine in this process, for archives of short clips.
+    If the backend supports it (see ASRBase.supports_batch), the speech windows of several files are
+    decoded in one batched call (see transcribe_batched), otherwise the files are transcribed one by one.
+    options: the options of add_shared_args, like in transcribe_file.
+    timeout: seconds per file, like in transcribe_file; with batches, the time until the next file is done.
+    Yields: (audio_path, [(beg, end, "text"), ...]) in seconds, for every file when it is done.
+    """
+    args = shared_args(**options)
+    set_audio_decoder(args.decoder, args.resample_quality)
+    open_pcm_cache()
+    asr = registry.get(args) if registry is not None else create_asr(args)
+    apply_asr_options(asr, args)
+    if asr.supports_batch and batch_size > 1:
+        yield from transcribe_batched(asr, audio_paths, batch_size, offline_segmenter(args), timeout=timeout)
+        return
+    for audio_path in audio_paths:
+        yield audio_path, list(transcribe_offline(asr, audio_path, offline_segmenter(args),
+                                                  deadline=timeout_deadline(timeout)))
+
 def set_logging(args,logger,other="_server"):
     logging.basicConfig(#format='%(name)s 
             format='%(levelname)s\t%(message)s')
     logger.setLevel(args.log_level)
     logging.getLogger("whisper_online"+other).setLevel(args.log_level)
+    logging.getLogger("profiling").setLevel(args.log_level)
 #    logging.getLogger("whisper_online_server").setLevel(args.log_level)
 
 
 
 if __name__ == "__main__":
 
-    import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument('audio_path', type=str, help="Filename of 16kHz mono channel wav, on which live streaming is simulated.")
     add_shared_args(parser)
     parser.add_argument('--start_at', type=float, default=0.0, help='Start processing audio at this time.')
-    parser.add_argument('--offline', action="store_true", default=False, help='Offline mode.')
+    parser.add_argument('--offline', action="store_true", default=False, help='Offline mode: the whole file is split into speech windows, and every window is transcribed once. Much faster than the simulation for subtitling files.')
     parser.add_argument('--comp_unaware', action="store_true", default=False, help='Computationally unaware simulation.')
+    parser.add_argument('--no-pcm-cache', dest='no_pcm_cache', action="store_true", default=False, help='Do not use the persistent cache of decoded audio files (see pcm_cache.py). With --decoder ffmpeg, the audio is then streamed from ffmpeg instead of decoded whole.')
     
     args = parser.parse_args()
 
@@ -864,103 +1973,128 @@ if __name__ == "__main__":
 
     set_logging(args,logger)
 
+    open_pcm_cache(not args.no_pcm_cache)
+    set_audio_decoder(args.decoder, args.resample_quality)
+
     audio_path = args.audio_path
 
     SAMPLING_RATE = 16000
-    duration = len(load_audio(audio_path))/SAMPLING_RATE
+    duration = audio_duration(audio_path)
     logger.info("Audio duration is: %2.2f seconds" % duration)
 
-    asr, online = asr_factory(args, logfile=logfile)
+    # in parallel mode, the models are loaded by the worker processes
+    parallel = args.offline and args.workers > 1
+    exporter = None
+    asr = online = None
+    if not parallel:
+        asr, online = asr_factory(args, logfile=logfile)
+        exporter = create_metrics_exporter(asr, online, args)
     if args.vac:
         min_chunk = args.vac_chunk_size
     else:
         min_chunk = args.min_chunk_size
 
-    # load the audio into the LRU cache before we start the timer
+    # open the audio reader before we start the timer
     a = load_audio_chunk(audio_path,0,1)
 
     # warm up the ASR because the very first transcribe takes much more time than the other
-    asr.transcribe(a)
-
-    beg = args.start_at
-    start = time.time()-beg
-
-    def output_transcript(o, now=None):
-        # output format in stdout is like:
-        # 4186.3606 0 1720 Takhle to je
-        # - the first three words are:
-        #    - emission time from beginning of processing, in milliseconds
-        #    - beg and end timestamp of the text segment, as estimated by Whisper model. The timestamps are not accurate, but they're useful anyway
-        # - the next words: segment transcript
-        if now is None:
-            now = time.time()-start
-        if o[0] is not None:
-            print("%1.4f %1.0f %1.0f %s" % (now*1000, o[0]*1000,o[1]*1000,o[2]),file=logfile,flush=True)
-            print("%1.4f %1.0f %1.0f %s" % (now*1000, o[0]*1000,o[1]*1000,o[2]),flush=True)
-        else:
-            # No text, so no output
-            pass
-
-    if args.offline: ## offline mode processing (for testing/debugging)
-        a = load_audio(audio_path)
-        online.insert_audio_chunk(a)
-        try:
-            o = online.process_iter()
-        except AssertionError as e:
-            logger.error(f"assertion error: {repr(e)}")
-        else:
-            output_transcript(o)
-        now = None
-    elif args.comp_unaware:  # computational unaware mode 
-        end = beg + min_chunk
-        while True:
-            a = load_audio_chunk(audio_path,beg,end)
-            online.insert_audio_chunk(a)
-            try:
-                o = online.process_iter()
-            except AssertionError as e:
-                logger.error(f"assertion error: {repr(e)}")
-                pass
-            else:
-                output_transcript(o, now=end)
-
-            logger.debug(f"## last processed {end:.2f}s")
-
-            if end >= duration:
-                break
-            
-            beg = end
-            
-            if end + min_chunk > duration:
-                end = duration
+    if not parallel:
+        asr.transcribe(a)
+
+    # after the warm up, it would be the longest transcribe in the trace
+    session = contextlib.nullcontext()
+    if args.profile:
+        session = profiling.ProfileSession(args.profile, f"whisper_online-{os.getpid()}", args.profile_cprofile)
+
+    # the trace and the cProfile dump are written and the profiler is disabled even on an error or Ctrl-C
+    with session:
+        beg = args.start_at
+        start = time.time()-beg
+
+        def output_transcript(o, now=None):
+            # output format in stdout is like:
+            # 4186.3606 0 1720 Takhle to je
+            # - the first three words are:
+            #    - emission time from beginning of processing, in milliseconds
+            #    - beg and end timestamp of the text segment, as estimated by Whisper model. The timestamps are not accurate, but they're useful anyway
+            # - the next words: segment transcript
+            if now is None:
+                now = time.time()-start
+            if o[0] is not None:
+                print("%1.4f %1.0f %1.0f %s" % (now*1000, o[0]*1000,o[1]*1000,o[2]),file=logfile,flush=True)
+                print("%1.4f %1.0f %1.0f %s" % (now*1000, o[0]*1000,o[1]*1000,o[2]),flush=True)
             else:
-                end += min_chunk
-        now = duration
-
-    else: # online = simultaneous mode
-        end = 0
-        while True:
-            now = time.time() - start
-            if now < end+min_chunk:
-                time.sleep(min_chunk+end-now)
-            end = time.time() - start
-            a = load_audio_chunk(audio_path,beg,end)
-            beg = end
-            online.insert_audio_chunk(a)
-
-            try:
-                o = online.process_iter()
-            except AssertionError as e:
-                logger.error(f"assertion error: {e}")
+                # No text, so no output
                 pass
-            else:
-                output_transcript(o)
-            now = time.time() - start
-            logger.debug(f"## last processed {end:.2f} s, now is {now:.2f}, the latency is {now-end:.2f}")
 
-            if end >= duration:
-                break
-        now = None
-
-    o = online.finish()
-    output_transcript(o, now=now)
+        if parallel:  ## offline mode in worker processes
+            for o in transcribe_parallel(audio_path, args, args.workers, offline_segmenter(args), duration=duration):
+                output_transcript(o)
+            shutdown_parallel_pool()
+            now = None
+        elif args.offline: ## offline mode, every window of the file is transcribed once
+            for o in transcribe_offline(asr, audio_path, offline_segmenter(args), duration=duration):
+                output_transcript(o)
+            now = None
+        elif args.comp_unaware:  # computational unaware mode 
+            for end, o in simulate_comp_unaware(online, audio_path, min_chunk, beg, duration):
+                output_transcript(o, now=end)
+                if exporter is not None:
+                    exporter.maybe_export()
+            now = duration
+
+        else: # online = simultaneous mode
+            end = 0
+            while True:
+                now = time.time() - start
+                chunk = online.chunk_size(min_chunk)
+                if now < end+chunk:
+                    time.sleep(chunk+end-now)
+                end = time.time() - start
+                a = load_audio_chunk(audio_path,beg,end)
+                beg = end
+                online.insert_audio_chunk(a)
+
+                try:
+                    with profiling.span("process_iter"):
+                        o = online.process_iter()
+                except AssertionError as e:
+                    logger.error(f"assertion error: {e}")
+                    pass
+                else:
+                    output_transcript(o)
+                if exporter is not None:
+                    exporter.maybe_export()
+                now = time.time() - start
+                logger.debug(f"## last processed {end:.2f} s, now is {now:.2f}, the latency is {now-end:.2f}")
+
+                if end >= duration:
+                    break
+            now = None
+
+        if online is not None:
+            o = online.finish()
+            output_transcript(o, now=now)
+            online.close()
+        if exporter is not None:
+            exporter.export()
+
+    if online is not None:  # not in the offline mode, which has no streaming processor
+        processor = getattr(online, "online", online)
+        st = processor.commit_policy.stats()
+        if st["words"]:
+            logger.info(f"commit delay ({st['policy']}, n={st['n']}) of {st['words']} words: mean {st['mean']:.2f} s, "
+                        f"p50 {st['p50']:.2f} s, p90 {st['p90']:.2f} s, p99 {st['p99']:.2f} s, max {st['max']:.2f} s")
+        if processor.early_stops:
+            logger.info(f"stopped decoding early in {processor.early_stops} of {processor.iterations} iterations")
+        if processor.skipped_iterations:
+            logger.info(f"skipped transcribe in {processor.skipped_iterations} of {processor.iterations} iterations")
+        controller = processor.controller
+        if controller is not None:
+            st = controller.stats()
+            logger.info(f"chunk size controller: {st['iterations']} iterations, last chunk size {st['chunk_size']:.2f} s, "
+                        f"{st['increases']} increases, {st['decreases']} decreases, "
+                        f"{st['trimming_changes']} buffer trimming changes")
+    if isinstance(asr, CachedASR):  # also in the offline mode, the main use of the cache
+        st = asr.cache.stats()
+        logger.info(f"transcribe cache: {st['hits']} hits, {st['misses']} misses, hit rate {st['hit_rate']:.1%}")
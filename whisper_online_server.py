@@ -21,6 +21,7 @@ add_shared_args(parser)
 args = parser.parse_args()
 
 set_logging(args,logger,other="")
+set_audio_decoder(args.decoder, args.resample_quality)
 
 # setting whisper object by args 
 
@@ -30,6 +31,7 @@ size = args.model
 language = args.lan
 asr, online = asr_factory(args)
 min_chunk = args.min_chunk_size
+exporter = create_metrics_exporter(asr, online, args)
 
 # warm up the ASR because the very first transcribe takes more time than the others. 
 # Test results in https://github.com/ufal/whisper_streaming/pull/81
@@ -85,12 +87,14 @@ import soundfile
 
 # wraps socket and ASR object, and serves one client connection. 
 # next client should be served by a new instance of this object
+# the chunk size is min_chunk, or the one of the chunk controller of online_asr_proc (--target-latency, --target-rtf)
 class ServerProcessor:
 
-    def __init__(self, c, online_asr_proc, min_chunk):
+    def __init__(self, c, online_asr_proc, min_chunk, exporter=None):
         self.connection = c
         self.online_asr_proc = online_asr_proc
         self.min_chunk = min_chunk
+        self.exporter = exporter
 
         self.last_end = None
 
@@ -101,7 +105,7 @@ class ServerProcessor:
         # blocks operation if less than self.min_chunk seconds is available
         # unblocks if connection is closed or a chunk is available
         out = []
-        minlimit = self.min_chunk*SAMPLING_RATE
+        minlimit = self.online_asr_proc.chunk_size(self.min_chunk)*SAMPLING_RATE
         while sum(len(x) for x in out) < minlimit:
             raw_bytes = self.connection.non_blocking_receive_audio()
             if not raw_bytes:
@@ -154,13 +158,21 @@ class ServerProcessor:
             a = self.receive_audio_chunk()
             if a is None:
                 break
+            if self.exporter is not None:
+                # the audio that came while the previous iteration was running
+                self.exporter.metrics.observe("queue_seconds", len(a)/SAMPLING_RATE)
             self.online_asr_proc.insert_audio_chunk(a)
-            o = online.process_iter()
+            with profiling.span("process_iter"):
+                o = online.process_iter()
             try:
                 self.send_result(o)
             except BrokenPipeError:
                 logger.info("broken pipe -- connection closed?")
                 break
+            if self.exporter is not None:
+                self.exporter.maybe_export()
+        if self.exporter is not None:
+            self.exporter.export()
 
 #        o = online.finish()  # this should be working
 #        self.send_result(o)
@@ -173,12 +185,18 @@ with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
     s.bind((args.host, args.port))
     s.listen(1)
     logger.info('Listening on'+str((args.host, args.port)))
+    sessions = 0
     while True:
         conn, addr = s.accept()
         logger.info('Connected to client on {}'.format(addr))
         connection = Connection(conn)
-        proc = ServerProcessor(connection, online, args.min_chunk_size)
-        proc.process()
+        proc = ServerProcessor(connection, online, args.min_chunk_size, exporter)
+        sessions += 1
+        if args.profile:
+            with profiling.ProfileSession(args.profile, f"session-{sessions}-{os.getpid()}", args.profile_cprofile):
+                proc.process()
+        else:
+            proc.process()
         conn.close()
         logger.info('Connection to client closed')
 logger.info('Connection closed, terminating.')